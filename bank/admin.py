@@ -1,11 +1,235 @@
-from django.contrib import admin
-from .models import Account, Transaction, Transfer, Notification
+from datetime import timedelta
 
-class AccountAdmin(admin.ModelAdmin):
-    list_display = ('user', 'account_number', 'balance', 'daily_transaction_limit', 'max_transaction_count')
+from django import forms
+from django.contrib import admin, messages
+from django.contrib.admin.helpers import ActionForm
+from django.core.paginator import Paginator
+from django.db import connections, transaction
+from django.db.models import F, Max, Min, QuerySet
+from django.http import StreamingHttpResponse
+from django.utils import timezone
+from django.utils.functional import cached_property
+
+from . import fragments, limits
+from .models import Account, Notification, Transaction, Transfer
+from .statements import stream_csv
+
+ESTIMATE_ABOVE = 100000  # Changelists count exactly up to this many rows
+
+
+def estimated_count(queryset):
+    """Approximate size of the whole table without scanning it; only for tables whose rows are never deleted."""
+    connection = connections[queryset.db]
+    if connection.vendor == 'postgresql':
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass',
+                           [queryset.model._meta.db_table])
+            row = cursor.fetchone()
+        if row and row[0] >= 0:
+            return row[0]
+    # Without deletes the id range is close; both ends come off the primary key index
+    bounds = PeriodQuerySet(queryset.model, using=queryset.db).aggregate(low=Min('pk'), high=Max('pk'))
+    return 0 if bounds['high'] is None else bounds['high'] - bounds['low'] + 1
+
+
+class CappedCountPaginator(Paginator):
+    """Avoids ``COUNT(*)`` over large tables by counting at most ``ESTIMATE_ABOVE`` rows plus one."""
+
+    @cached_property
+    def count(self):
+        return self.object_list.order_by()[:ESTIMATE_ABOVE + 1].count()
+
+
+class EstimatedCountPaginator(CappedCountPaginator):
+    """For append-only tables: the unfiltered list uses ``estimated_count()`` past ``ESTIMATE_ABOVE`` rows."""
+
+    @cached_property
+    def count(self):
+        if not self.object_list.query.where:
+            estimate = estimated_count(self.object_list)
+            if estimate > ESTIMATE_ABOVE:
+                return estimate
+        return super().count
+
+
+def _period_start(value, kind):
+    value = value.replace(hour=0, minute=0, second=0, microsecond=0)
+    if kind in ('year', 'month'):
+        value = value.replace(day=1)
+    if kind == 'year':
+        value = value.replace(month=1)
+    return value
+
+
+def _next_period(value, kind):
+    if kind == 'day':
+        return value + timedelta(days=1)
+    if kind == 'month':
+        return value.replace(year=value.year + value.month // 12, month=value.month % 12 + 1)
+    return value.replace(year=value.year + 1)
+
+
+class PeriodQuerySet(QuerySet):
+    """Min/max lookups and ``datetimes()`` answered from indexes instead of scanning every row.
+
+    The admin's date hierarchy asks for the years, months or days that have
+    rows; this takes the bounds from the ends of the date index and checks
+    each candidate period with an ``exists()`` seek.
+    """
+
+    def aggregate(self, *args, **kwargs):
+        # SQLite only reads MIN() or MAX() off an index when it is the query's lone aggregate
+        if args or not all(type(aggregate) in (Min, Max) and aggregate.filter is None
+                           and isinstance(aggregate.source_expressions[0], F) for aggregate in kwargs.values()):
+            return super().aggregate(*args, **kwargs)
+        result = {}
+        for name, aggregate in kwargs.items():
+            field_name = aggregate.source_expressions[0].name
+            ordered = self.exclude(**{f'{field_name}__isnull': True}).values_list(field_name, flat=True)
+            result[name] = ordered.order_by(field_name if type(aggregate) is Min else f'-{field_name}').first()
+        return result
+
+    def datetimes(self, field_name, kind, order='ASC', tzinfo=None):
+        if kind not in ('year', 'month', 'day'):
+            return super().datetimes(field_name, kind, order, tzinfo)
+        bounds = self.aggregate(first=Min(field_name), last=Max(field_name))
+        if bounds['first'] is None:
+            return []
+        tzinfo = tzinfo or timezone.get_current_timezone()
+        start, last = _period_start(timezone.localtime(bounds['first'], tzinfo), kind), bounds['last']
+        periods = []
+        while start <= last:
+            end = _next_period(start, kind)
+            # SQLite seeks the index with the first range it finds on the column, so the period goes before
+            # any range the queryset already has (the hierarchy's own year or month)
+            period = type(self)(self.model, using=self.db).filter(**{f'{field_name}__gte': start, f'{field_name}__lt': end})
+            if (period & self).exists():
+                periods.append(start)
+            start = end
+        return periods if order == 'ASC' else periods[::-1]
+
+
+class LargeTableAdmin(admin.ModelAdmin):
+    paginator = CappedCountPaginator
+    show_full_result_count = False
+    export_columns = ()
+    actions = ['export_csv']
+
+    def get_queryset(self, request):
+        queryset = super().get_queryset(request)
+        return PeriodQuerySet(queryset.model, queryset.query, queryset.db)
+
+    @admin.action(description='Export selected rows as CSV')
+    def export_csv(self, request, queryset):
+        response = StreamingHttpResponse(stream_csv(queryset.order_by('pk'), columns=self.export_columns),
+                                         content_type='text/csv')
+        response['Content-Disposition'] = f'attachment; filename="{self.model._meta.model_name}s.csv"'
+        return response
+
+
+class LimitsForm(forms.Form):
+    daily_transaction_limit = forms.DecimalField(required=False, min_value=0, max_digits=12, decimal_places=2)
+    max_transaction_count = forms.IntegerField(required=False, min_value=0)
+
+
+class AccountActionForm(ActionForm, LimitsForm):
+    pass
+
+
+@admin.register(Account)
+class AccountAdmin(LargeTableAdmin):
+    list_display = ('account_number', 'user', 'balance', 'daily_transaction_limit', 'max_transaction_count',
+                    'is_frozen')
     list_editable = ('daily_transaction_limit', 'max_transaction_count')
+    list_select_related = ('user',)
+    list_filter = ('is_frozen',)
+    search_fields = ('=account_number', 'user__username')
+    raw_id_fields = ('user',)
+    ordering = ('-id',)
+    action_form = AccountActionForm
+    actions = ['set_limits', 'reset_counters', 'freeze', 'unfreeze', 'export_csv']
+    export_columns = ('id', 'account_number', 'user__username', 'balance', 'daily_transaction_limit',
+                      'max_transaction_count', 'is_frozen')
+
+    def _updated(self, request, queryset, message, **changes):
+        # update() skips post_save, so the dashboard fragments are invalidated here
+        with transaction.atomic(using=queryset.db):
+            updated = queryset.update(**changes)
+            fragments.touch(queryset.values_list('user_id', flat=True))
+        self.message_user(request, f'{updated} account(s) {message}.', messages.SUCCESS)
+
+    @admin.action(description='Set limits on selected accounts')
+    def set_limits(self, request, queryset):
+        form = LimitsForm(request.POST)
+        changes = {name: value for name, value in form.cleaned_data.items() if value is not None} \
+            if form.is_valid() else {}
+        if not changes:
+            self.message_user(request, 'Enter a daily limit or a transaction count to set.', messages.ERROR)
+            return
+        self._updated(request, queryset, 'updated', **changes)
+
+    @admin.action(description="Reset today's transaction counters")
+    def reset_counters(self, request, queryset):
+        with transaction.atomic(using=queryset.db):
+            queryset.update(transaction_count=0)
+            account_ids = list(queryset.values_list('pk', flat=True))
+            limits.reset(account_ids)
+        self.message_user(request, f'Counters reset on {len(account_ids)} account(s).', messages.SUCCESS)
+
+    @admin.action(description='Freeze selected accounts')
+    def freeze(self, request, queryset):
+        self._updated(request, queryset, 'frozen', is_frozen=True)
+
+    @admin.action(description='Unfreeze selected accounts')
+    def unfreeze(self, request, queryset):
+        self._updated(request, queryset, 'unfrozen', is_frozen=False)
+
+
+@admin.register(Transaction)
+class TransactionAdmin(LargeTableAdmin):
+    paginator = EstimatedCountPaginator
+    list_display = ('id', 'date', 'user', 'account', 'transaction_type', 'amount', 'status')
+    list_select_related = ('user', 'account')
+    list_filter = ('transaction_type',)
+    search_fields = ('=account__account_number',)
+    raw_id_fields = ('user', 'account', 'batch', 'exchange_rate')
+    date_hierarchy = 'date'
+    ordering = ('-date', '-id')
+    export_columns = ('id', 'date', 'user__username', 'account__account_number', 'transaction_type', 'amount',
+                      'status', 'memo')
+
+    # Ledger rows are written by bank.transfers together with their postings
+    def has_add_permission(self, request):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(Transfer)
+class TransferAdmin(LargeTableAdmin):
+    paginator = EstimatedCountPaginator
+    list_display = ('id', 'timestamp', 'from_account', 'to_account', 'amount', 'decision')
+    list_select_related = ('from_account', 'to_account')
+    list_filter = ('decision',)
+    autocomplete_fields = ('from_account', 'to_account')
+    date_hierarchy = 'timestamp'
+    ordering = ('-timestamp',)
+    export_columns = ('id', 'timestamp', 'from_account__account_number', 'to_account__account_number', 'amount',
+                      'decision', 'decision_reasons')
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
 
-admin.site.register(Account, AccountAdmin)
-admin.site.register(Transaction)
-admin.site.register(Transfer)
-admin.site.register(Notification)
+@admin.register(Notification)
+class NotificationAdmin(LargeTableAdmin):
+    list_display = ('id', 'timestamp', 'user', 'is_read', 'delivery_status')
+    list_select_related = ('user',)
+    list_filter = ('is_read', 'delivery_status')
+    raw_id_fields = ('user',)
+    ordering = ('-id',)
+    export_columns = ('id', 'timestamp', 'user__username', 'message', 'is_read', 'delivery_status')
@@ -1,6 +1,18 @@
 from django.apps import AppConfig
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_save
 
 
 class BankConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'bank'
+
+    def ready(self):
+        from .dbprofiles import configure_sqlite
+        from .fragments import invalidate_on_save
+        from .instrumentation import observe_queries
+
+        connection_created.connect(configure_sqlite, dispatch_uid='bank.configure_sqlite')
+        connection_created.connect(observe_queries, dispatch_uid='bank.observe_queries')
+        for model in ('Account', 'Notification'):
+            post_save.connect(invalidate_on_save, sender=self.get_model(model), dispatch_uid=f'bank.fragments.{model}')
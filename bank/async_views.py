@@ -0,0 +1,152 @@
+"""Async versions of the busiest views, for deployments behind ASGI (``testbank.asgi``).
+
+Reads use the async ORM; anything that needs ``transaction.atomic`` (transfers,
+OTP storage, marking notifications read) runs in Django's sync thread via
+``sync_to_async``.
+"""
+import asyncio
+
+from asgiref.sync import sync_to_async
+from django.contrib import messages
+from django.contrib.auth.decorators import login_required
+from django.db import connections
+from django.http import Http404, HttpResponseBadRequest, StreamingHttpResponse
+from django.shortcuts import redirect, render
+
+from . import authorizations, events, limits
+from .forms import TransferForm
+from .fragments import account_header, get_fragments, recent_transactions, unread_badge
+from .limits import LimitExceeded
+from .models import Account
+from .notifications import mark_read, unread_page
+from .outbox import enqueue_email, outbox_enabled
+from .pagination import InvalidCursor
+from .rates import RateUnavailable, get_rate_service, snapshot, to_base
+from .replicas import pin_to_primary
+from .transfers import TransferError, authorized_transfer, idempotency_key_for
+
+
+async def _user(request):
+    user = await request.auser()
+    # Later sync code (templates, context processors) must not query for the user from the event loop
+    request.user = user
+    return user
+
+
+async def _source_account(user, amount):
+    account = await Account.objects.aget(user=user)
+    await limits.aprecheck(account, amount)
+    return account
+
+
+@login_required
+async def transfer(request):
+    user = await _user(request)
+    if request.method != 'POST':
+        return render(request, 'bank/transfer.html')
+    try:
+        amount = float(request.POST.get('amount'))
+    except (TypeError, ValueError):
+        return HttpResponseBadRequest('Invalid amount')
+    to_account_number = request.POST.get('to_account')
+    currency = request.POST.get('currency', 'USD')
+    pin = request.POST.get('pin')
+    memo = request.POST.get('memo', '')[:140]
+
+    # The sender, the recipient and the FX quote don't depend on each other
+    results = await asyncio.gather(
+        _source_account(user, amount),
+        Account.objects.filter(account_number=to_account_number).afirst(),
+        get_rate_service().aget_quote('USD', currency),
+        return_exceptions=True,
+    )
+    for result in results:
+        if isinstance(result, (RateUnavailable, LimitExceeded)):
+            error = 'Exchange rates are currently unavailable' if isinstance(result, RateUnavailable) else str(result)
+            return render(request, 'bank/transfer.html', {'error': error})
+        if isinstance(result, Account.DoesNotExist):
+            raise Http404('Account does not exist')
+        if isinstance(result, BaseException):
+            raise result
+    from_account, to_account, quote = results
+    if to_account is None:
+        return render(request, 'bank/transfer.html', {'error': 'Account does not exist'})
+
+    def post():
+        authorized_transfer(user, from_account, to_account, to_base(amount, quote), pin,
+                            idempotency_key=idempotency_key_for(request), exchange_rate=snapshot(quote), memo=memo,
+                            authorized_amount=amount)
+        pin_to_primary(request)
+
+    try:
+        # The alert is an outbox row written in the same transaction; drain_outbox delivers it
+        await sync_to_async(post)()
+    except (TransferError, LimitExceeded) as e:
+        return render(request, 'bank/transfer.html', {'error': str(e)})
+
+    messages.success(request, 'Transfer successful.')
+    return redirect('dashboard')
+
+
+@login_required
+async def generate_otp(request):
+    user = await _user(request)
+    if request.method != 'POST':
+        return render(request, 'bank/generate_otp.html', {'form': TransferForm()})
+    form = TransferForm(request.POST)
+    if not form.is_valid():
+        return render(request, 'bank/generate_otp.html', {'form': form})
+    to_account_number = form.cleaned_data['to_account']
+    amount = form.cleaned_data['amount']
+    if not await Account.objects.filter(account_number=to_account_number).aexists():
+        raise Http404('Account does not exist')
+
+    try:
+        otp = await sync_to_async(authorizations.issue)(user, to_account_number, amount)
+    except authorizations.RateLimited as e:
+        return render(request, 'bank/generate_otp.html', {'form': form, 'error': str(e)})
+    # Without the outbox this is an SMTP round trip; keep it off the shared sync thread
+    await sync_to_async(enqueue_email, thread_sensitive=outbox_enabled())(
+        user.email, 'Your OTP for Transfer', f"Your OTP for transferring ${amount} is {otp}")
+    return render(request, 'bank/transfer.html', {'success': 'OTP sent to your email'})
+
+
+@login_required
+async def dashboard(request):
+    user = await _user(request)
+    # Fragment hits are cache reads; misses render on the primary in the sync thread
+    context = await sync_to_async(get_fragments)(user, {
+        'account_header': account_header(user),
+        'recent_transactions': recent_transactions(user, page_size=10),
+        'unread_badge': unread_badge(user),
+    })
+    return render(request, 'bank/dashboard.html', context)
+
+
+@login_required
+async def notifications(request):
+    user = await _user(request)
+
+    def page_and_mark_read():
+        page = unread_page(user, cursor=request.GET.get('cursor'))
+        if mark_read(user, page):
+            pin_to_primary(request)
+        return page
+
+    try:
+        page = await sync_to_async(page_and_mark_read)()
+    except InvalidCursor:
+        return HttpResponseBadRequest('Invalid cursor')
+    return render(request, 'bank/notifications.html', {'notifications': page, 'page': page})
+
+
+@login_required
+async def event_stream(request):
+    """Balance changes and notifications for the logged-in user as ``text/event-stream``; ASGI only."""
+    user = await _user(request)
+    last_event_id = events.parse_last_event_id(
+        request.headers.get('Last-Event-ID') or request.GET.get('last_event_id'))
+    # Django only releases the request's connections when the response ends, which for a stream is hours away
+    await sync_to_async(connections.close_all)()
+    return StreamingHttpResponse(events.stream(user.pk, last_event_id), content_type='text/event-stream',
+                                 headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
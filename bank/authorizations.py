@@ -0,0 +1,137 @@
+import hashlib
+import hmac
+import secrets
+import time
+from datetime import timedelta
+from decimal import Decimal
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import F
+from django.utils import timezone
+
+from .models import PendingAuthorization
+
+
+class RateLimited(Exception):
+    pass
+
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
+
+def authorization_key(user, to_account_number, amount):
+    amount = Decimal(str(amount)).quantize(Decimal('0.01'))
+    return hashlib.sha256(f'{user.pk}:{to_account_number}:{amount}'.encode()).hexdigest()
+
+
+def _hash(key, otp):
+    return hmac.new(settings.SECRET_KEY.encode(), f'{key}:{otp}'.encode(), hashlib.sha256).hexdigest()
+
+
+class CacheStore:
+    """Keeps pending OTPs in Django's cache; expiry is the cache TTL.
+
+    Only suitable when the cache is shared by every worker (e.g. Redis). The
+    cache isn't rolled back with the transfer, so a transfer that fails after
+    the check has still used up its OTP.
+    """
+
+    prefix = 'bank:otp:'
+
+    def save(self, key, user, otp_hash, ttl):
+        cache.set(self.prefix + key, otp_hash, ttl)
+        cache.set(self.prefix + key + ':attempts', 0, ttl)
+
+    def check(self, key, otp_hash, max_attempts):
+        stored = cache.get(self.prefix + key)
+        if stored is None:
+            return False
+        try:
+            attempts = cache.incr(self.prefix + key + ':attempts')
+        except ValueError:
+            return False
+        if attempts > max_attempts:
+            self.delete(key)
+            return False
+        if hmac.compare_digest(stored, otp_hash):
+            self.delete(key)
+            return True
+        return False
+
+    def delete(self, key):
+        cache.delete_many([self.prefix + key, self.prefix + key + ':attempts'])
+
+    def sweep(self, batch_size=5000):
+        return 0
+
+
+class DatabaseStore:
+    """Keeps pending OTPs in ``PendingAuthorization``, looked up by its unique key."""
+
+    def save(self, key, user, otp_hash, ttl):
+        PendingAuthorization.objects.update_or_create(
+            key=key, defaults={'user': user, 'otp_hash': otp_hash, 'attempts': 0,
+                               'expires_at': timezone.now() + timedelta(seconds=ttl)})
+
+    def check(self, key, otp_hash, max_attempts):
+        # Count the attempt first, atomically, so parallel guesses can't exceed the limit
+        live = PendingAuthorization.objects.filter(key=key, expires_at__gt=timezone.now(), attempts__lt=max_attempts)
+        if not live.update(attempts=F('attempts') + 1):
+            return False
+        stored = PendingAuthorization.objects.filter(key=key).values_list('otp_hash', flat=True).first()
+        if stored is None or not hmac.compare_digest(stored, otp_hash):
+            return False
+        # Single use: whoever deletes the row wins
+        return PendingAuthorization.objects.filter(key=key).delete()[0] > 0
+
+    def delete(self, key):
+        PendingAuthorization.objects.filter(key=key).delete()
+
+    def sweep(self, batch_size=5000):
+        deleted = 0
+        while True:
+            ids = list(PendingAuthorization.objects.filter(expires_at__lte=timezone.now())
+                       .values_list('pk', flat=True)[:batch_size])
+            if not ids:
+                return deleted
+            deleted += PendingAuthorization.objects.filter(pk__in=ids).delete()[0]
+
+
+STORES = {
+    'cache': CacheStore,
+    'database': DatabaseStore,
+}
+
+
+def get_store(name=None):
+    return STORES[name or _setting('BANK_OTP_STORE', 'database')]()
+
+
+def _check_rate(user):
+    window = _setting('BANK_OTP_RATE_WINDOW', 900)
+    key = f'bank:otp:rate:{user.pk}:{int(time.time() // window)}'
+    cache.add(key, 0, window)
+    try:
+        issued = cache.incr(key)
+    except ValueError:
+        issued = 1
+    if issued > _setting('BANK_OTP_MAX_ISSUES', 5):
+        raise RateLimited('Too many OTP requests. Please try again later.')
+
+
+def issue(user, to_account_number, amount, store=None):
+    """Create and return a new OTP authorizing this exact transfer."""
+    _check_rate(user)
+    key = authorization_key(user, to_account_number, amount)
+    otp = f'{secrets.randbelow(10 ** 6):06d}'
+    (store or get_store()).save(key, user, _hash(key, otp), _setting('BANK_OTP_TTL', 300))
+    return otp
+
+
+def verify(user, to_account_number, amount, otp, store=None):
+    if not otp:
+        return False
+    key = authorization_key(user, to_account_number, amount)
+    return (store or get_store()).check(key, _hash(key, otp), _setting('BANK_OTP_MAX_ATTEMPTS', 3))
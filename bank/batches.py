@@ -0,0 +1,158 @@
+import csv
+import io
+import json
+from decimal import Decimal, InvalidOperation
+
+from django.db import transaction
+from django.db.models import Case, DecimalField, F, Value, When
+from django.utils import timezone
+
+from . import ledger
+from .models import Account, Transaction, TransferBatch
+from .outbox import notify_user
+from .rates import RateUnavailable, get_rate_service, snapshot, to_base
+from .transfers import AccountFrozen, InsufficientFunds, TransferError
+from .utils import batched
+
+BASE_CURRENCY = 'USD'
+
+
+class BatchError(TransferError):
+    pass
+
+
+def parse_items(content, format='csv'):
+    """Parse ``to_account,amount,currency`` rows from CSV text or a JSON list."""
+    if format == 'json':
+        try:
+            rows = json.loads(content)
+        except ValueError as e:
+            raise BatchError(f'Invalid JSON: {e}') from e
+        if not isinstance(rows, list):
+            raise BatchError('Expected a JSON list of transfers')
+    else:
+        rows = list(csv.DictReader(io.StringIO(content)))
+
+    items = []
+    for line, row in enumerate(rows, start=1):
+        try:
+            amount = Decimal(str(row['amount'])).quantize(Decimal('0.01'))
+            to_account = str(row['to_account']).strip()
+        except (KeyError, TypeError, InvalidOperation) as e:
+            raise BatchError(f'Row {line}: expected to_account and a numeric amount') from e
+        if amount <= 0:
+            raise BatchError(f'Row {line}: amount must be greater than zero')
+        currency = (row.get('currency') or BASE_CURRENCY).strip().upper()
+        items.append({'to_account': to_account, 'amount': amount, 'currency': currency})
+    if not items:
+        raise BatchError('The batch is empty')
+    return items
+
+
+def _resolve(items, from_account):
+    numbers = {item['to_account'] for item in items}
+    recipients = {a.account_number: a for a in Account.objects.filter(account_number__in=numbers).only('pk', 'user_id', 'account_number')}
+    missing = sorted(numbers - set(recipients))
+    if missing:
+        raise BatchError(f"Unknown accounts: {', '.join(missing[:20])}")
+    if from_account.account_number in recipients:
+        raise BatchError('A batch cannot pay the source account')
+
+    service = get_rate_service()
+    rates = {}
+    for currency in {item['currency'] for item in items}:
+        try:
+            quote = service.get_quote(BASE_CURRENCY, currency)
+        except RateUnavailable as e:
+            raise BatchError(str(e)) from e
+        rates[currency] = (quote, snapshot(quote))
+
+    resolved = []
+    for item in items:
+        quote, exchange_rate = rates[item['currency']]
+        # Amounts are given in the payee's currency; move the equivalent in the base currency
+        resolved.append((recipients[item['to_account']], to_base(item['amount'], quote), exchange_rate))
+    return resolved
+
+
+def _apply_chunk(batch, chunk):
+    total = sum(amount for _, amount, _ in chunk)
+    credits = {}
+    for recipient, amount, _ in chunk:
+        credits[recipient.pk] = credits.get(recipient.pk, 0) + amount
+
+    with transaction.atomic():
+        locked = {pk: (is_frozen, balance) for pk, is_frozen, balance in
+                  Account.objects.select_for_update().filter(pk__in=[batch.from_account_id, *credits])
+                  .order_by('pk').values_list('pk', 'is_frozen', 'balance')}
+        if locked[batch.from_account_id][0]:
+            raise AccountFrozen('The paying account is frozen')
+        if not Account.objects.filter(pk=batch.from_account_id, balance__gte=total).update(balance=F('balance') - total):
+            raise InsufficientFunds('Insufficient funds for the remaining batch')
+        # One UPDATE credits every recipient in the chunk
+        Account.objects.filter(pk__in=credits).update(balance=F('balance') + Case(
+            *[When(pk=pk, then=Value(amount)) for pk, amount in credits.items()],
+            output_field=DecimalField(max_digits=12, decimal_places=2),
+        ))
+
+        rows = []
+        for recipient, amount, exchange_rate in chunk:
+            rows += [
+                Transaction(user_id=batch.from_account.user_id, account_id=batch.from_account_id,
+                            transaction_type='transfer', amount=amount, exchange_rate=exchange_rate, batch=batch),
+                Transaction(user_id=recipient.user_id, account_id=recipient.pk, transaction_type='deposit',
+                            amount=amount, exchange_rate=exchange_rate, batch=batch),
+            ]
+        rows = Transaction.objects.bulk_create(rows)
+        postings = []
+        for debit, credit in zip(rows[::2], rows[1::2]):
+            postings += ledger.transfer_legs(debit, credit, debit.amount)
+        entries = []
+        for (recipient, _, _), debit, credit in zip(chunk, rows[::2], rows[1::2]):
+            entries += [(debit, recipient), (credit, batch.from_account)]
+        # One balance event per account for the whole chunk
+        balances = [(batch.from_account, locked[batch.from_account_id][1] - total)]
+        balances += [(recipient, locked[recipient.pk][1] + credits[recipient.pk])
+                     for recipient in {recipient.pk: recipient for recipient, _, _ in chunk}.values()]
+        ledger.record(postings, entries, balances)
+        TransferBatch.objects.filter(pk=batch.pk).update(
+            processed_items=F('processed_items') + len(chunk), total_amount=F('total_amount') + total)
+
+
+def run_batch(batch, items, chunk_size=500):
+    """Pay every item from ``batch.from_account``, committing one chunk at a time.
+
+    Rerunning a failed batch with the same items resumes after the last
+    committed chunk.
+    """
+    try:
+        resolved = _resolve(items, batch.from_account)
+        TransferBatch.objects.filter(pk=batch.pk).update(status='running', total_items=len(resolved), error='')
+        batch.refresh_from_db()
+        for chunk in batched(resolved[batch.processed_items:], chunk_size):
+            _apply_chunk(batch, chunk)
+    except TransferError as e:
+        TransferBatch.objects.filter(pk=batch.pk).update(status='failed', error=str(e), completed_at=timezone.now())
+        batch.refresh_from_db()
+        raise
+
+    with transaction.atomic():
+        TransferBatch.objects.filter(pk=batch.pk).update(status='completed', completed_at=timezone.now())
+        batch.refresh_from_db()
+        notify_user(batch.from_account.user,
+                    f"Batch {batch.pk}: paid {batch.processed_items} recipients a total of ${batch.total_amount}",
+                    subject='Batch Transfer Complete')
+    return batch
+
+
+def resume_batch(batch, items, chunk_size=500):
+    """Rerun a failed ``batch``; refuses batches that completed or that another run is still paying."""
+    if not TransferBatch.objects.filter(pk=batch.pk, status='failed').update(status='running'):
+        batch.refresh_from_db()
+        raise BatchError(f'Batch {batch.pk} is {batch.status}; only failed batches can be resumed')
+    return run_batch(batch, items, chunk_size=chunk_size)
+
+
+def create_and_run(from_account, items, user=None, chunk_size=500):
+    batch = TransferBatch.objects.create(user=user or from_account.user, from_account=from_account)
+    return run_batch(batch, items, chunk_size=chunk_size)
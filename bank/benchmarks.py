@@ -0,0 +1,92 @@
+import os
+import random
+import shutil
+import statistics
+import tempfile
+import time
+from contextlib import contextmanager
+from datetime import timedelta
+from decimal import Decimal
+
+from django.db import connection
+from django.utils import timezone
+
+from .models import Transaction
+from .search import index
+from .utils import batched, explicit_timestamps
+
+
+@contextmanager
+def benchmark_database(keepdb=False, on_disk=False):
+    """Run the block against a throwaway copy of the schema, never the real database.
+
+    SQLite test databases live in shared-cache memory, where concurrent
+    writers fail with "table is locked" instead of waiting; ``on_disk``
+    uses a temporary file so threaded benchmarks queue like real workers.
+    """
+    test_settings = connection.settings_dict.setdefault('TEST', {})
+    original_test_name = test_settings.get('NAME')
+    directory = None
+    if on_disk and connection.vendor == 'sqlite' and not original_test_name:
+        directory = tempfile.mkdtemp(prefix='bank-bench-')
+        test_settings['NAME'] = os.path.join(directory, 'bench.sqlite3')
+    old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, keepdb=keepdb)
+    try:
+        yield
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0, keepdb=keepdb)
+        test_settings['NAME'] = original_test_name
+        if directory:
+            shutil.rmtree(directory, ignore_errors=True)
+
+
+def timed(func, repeat=1):
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        samples.append(time.perf_counter() - started)
+    return samples
+
+
+def summarize(samples):
+    """Latency percentiles in milliseconds for a list of durations in seconds."""
+    if not samples:
+        return {}
+    ordered = sorted(samples)
+
+    def pct(p):
+        return ordered[min(len(ordered) - 1, int(round(p / 100 * (len(ordered) - 1))))] * 1000
+
+    return {
+        'count': len(ordered),
+        'mean_ms': statistics.fmean(ordered) * 1000,
+        'p50_ms': pct(50),
+        'p95_ms': pct(95),
+        'p99_ms': pct(99),
+    }
+
+
+def format_summary(name, summary):
+    return (f"{name:<32} n={summary['count']:<6} p50={summary['p50_ms']:.2f}ms "
+            f"p95={summary['p95_ms']:.2f}ms p99={summary['p99_ms']:.2f}ms")
+
+
+def seed_transactions(account, rows, batch_size=10000, seed=0):
+    rng = random.Random(seed)
+    types = [choice for choice, _ in Transaction.TRANSACTION_TYPES]
+    start = timezone.now() - timedelta(minutes=rows)
+
+    def generate():
+        for i in range(rows):
+            yield Transaction(
+                user_id=account.user_id,
+                account=account,
+                amount=Decimal(rng.randint(100, 500000)) / 100,
+                transaction_type=rng.choice(types),
+                date=start + timedelta(minutes=i),
+            )
+
+    with explicit_timestamps(Transaction, 'date'):
+        for batch in batched(generate(), batch_size):
+            index((row, None) for row in Transaction.objects.bulk_create(batch))
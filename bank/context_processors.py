@@ -0,0 +1,10 @@
+from django.utils.functional import SimpleLazyObject
+
+from .notifications import unread_count
+
+
+def unread_notifications(request):
+    # Lazy so pages that don't show the badge never touch the cache
+    if not request.user.is_authenticated:
+        return {}
+    return {'unread_notification_count': SimpleLazyObject(lambda: unread_count(request.user))}
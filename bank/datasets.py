@@ -0,0 +1,350 @@
+"""Large datasets: synthetic banks (``manage.py seed_bank``) and external ledger feeds (``manage.py import_ledger``).
+
+Both write with ``bulk_create``, a batch per database transaction, and keep
+everything derived from the ledger consistent: postings, search rows,
+rollups, and cached balances that reconcile. Nothing calls ``save()``, so no
+per-row signals fire.
+"""
+import csv
+import json
+import random
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import ExitStack, contextmanager
+from datetime import datetime, timedelta
+from decimal import Decimal, InvalidOperation
+from multiprocessing import get_context
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.db import OperationalError, connection, reset_queries, transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from . import eod, ledger, rollups, search
+from .dbprofiles import setup_worker
+from .models import Account, Notification, Posting, Transaction, Transfer
+from .utils import batched, explicit_timestamps
+
+SECOND_ACCOUNT_RATE = 0.2  # Share of seeded users with a second account
+LOCK_RETRIES = 5
+TIMESTAMPS = [(Transaction, 'date'), (Posting, 'created_at'), (Transfer, 'timestamp'), (Notification, 'timestamp')]
+
+
+class FeedError(Exception):
+    pass
+
+
+@contextmanager
+def fast_load():
+    """Keep generated timestamps and, on SQLite, skip fsyncs while a throwaway dataset is loaded."""
+    with ExitStack() as stack:
+        for model, field in TIMESTAMPS:
+            stack.enter_context(explicit_timestamps(model, field))
+        # SQLite refuses to change it inside a transaction
+        if connection.vendor == 'sqlite' and not connection.in_atomic_block:
+            with connection.cursor() as cursor:
+                cursor.execute('PRAGMA synchronous')
+                synchronous = cursor.fetchone()[0]
+                cursor.execute('PRAGMA synchronous = OFF')
+
+            def restore():
+                with connection.cursor() as cursor:
+                    cursor.execute(f'PRAGMA synchronous = {synchronous}')
+
+            stack.callback(restore)
+        yield
+
+
+def _simulate(rng, spec, users):
+    """Accounts and a date-ordered history for one block of users; no balance ever goes negative.
+
+    Returns ``(accounts, history)``: accounts are ``[user index, number, balance in cents]``
+    and history entries ``(when, kind, account, counterparty or None, cents)``.
+    """
+    window = spec['days'] * 86400
+    accounts, opened = [], []
+    for index in users:
+        for position in range(2 if rng.random() < SECOND_ACCOUNT_RATE else 1):
+            accounts.append([index, f'5{index:010d}{position}', 0])
+            opened.append(rng.uniform(0, window / 10))
+    schedule = []
+    for account, opened_at in enumerate(opened):
+        schedule.append((opened_at, account))
+        schedule += [(rng.uniform(opened_at, window), account) for _ in range(rng.randint(0, 2 * spec['transactions']))]
+    schedule.sort()
+
+    seen, history = set(), []
+    for offset, account in schedule:
+        when = spec['end'] - timedelta(seconds=window - offset)
+        balance = accounts[account][2]
+        kind = 'deposit' if account not in seen else rng.choice(('deposit', 'withdrawal', 'transfer', 'transfer'))
+        seen.add(account)
+        counterparty = rng.randrange(len(accounts)) if kind == 'transfer' else None
+        if kind != 'deposit' and (balance < 100 or counterparty == account or
+                                  (counterparty is not None and counterparty not in seen)):
+            kind, counterparty = 'deposit', None
+        if kind == 'deposit':
+            cents = rng.randint(500, 250000)
+            accounts[account][2] += cents
+        else:
+            cents = rng.randint(100, min(balance, 100000))
+            accounts[account][2] -= cents
+            if counterparty is not None:
+                accounts[counterparty][2] += cents
+        history.append((when, kind, account, counterparty, cents))
+    return accounts, history
+
+
+def _write_block(spec, accounts, history):
+    counts = Counter()
+    with transaction.atomic():
+        indexes = sorted({index for index, _, _ in accounts})
+        users = User.objects.bulk_create(
+            User(username=f'{spec["prefix"]}{index}', email=f'{spec["prefix"]}{index}@example.com',
+                 password=make_password(None), date_joined=spec['end'] - timedelta(days=spec['days']))
+            for index in indexes
+        )
+        user_ids = {index: user.pk for index, user in zip(indexes, users)}
+        accounts = Account.objects.bulk_create(
+            Account(user_id=user_ids[index], account_number=number, balance=Decimal(cents).scaleb(-2))
+            for index, number, cents in accounts
+        )
+        usernames = {user.pk: user.username for user in users}
+        counts.update(users=len(users), accounts=len(accounts))
+
+        for chunk in batched(history, spec['batch_size']):
+            rows = []
+            for when, kind, account, counterparty, cents in chunk:
+                source, amount = accounts[account], Decimal(cents).scaleb(-2)
+                rows.append(Transaction(user_id=source.user_id, account_id=source.pk, transaction_type=kind,
+                                        amount=amount, date=when))
+                if counterparty is not None:
+                    destination = accounts[counterparty]
+                    rows.append(Transaction(user_id=destination.user_id, account_id=destination.pk,
+                                            transaction_type='deposit', amount=amount, date=when))
+            rows = iter(Transaction.objects.bulk_create(rows))
+            postings, entries, transfers, notifications = [], [], [], []
+            for when, kind, account, counterparty, cents in chunk:
+                row = next(rows)
+                if counterparty is None:
+                    legs = ledger.external_legs(row, row.amount if kind == 'deposit' else -row.amount)
+                    entries.append((row, None))
+                else:
+                    credit = next(rows)
+                    source, destination = accounts[account], accounts[counterparty]
+                    legs = ledger.transfer_legs(row, credit, row.amount)
+                    entries += [(row, destination), (credit, source)]
+                    transfers.append(Transfer(from_account_id=source.pk, to_account_id=destination.pk,
+                                              amount=row.amount, timestamp=when))
+                    notifications.append(Notification(
+                        user_id=destination.user_id, timestamp=when, delivery_status='sent', delivered_at=when,
+                        is_read=when < spec['end'] - timedelta(days=30),
+                        message=f'You received ${row.amount} from {usernames[source.user_id]}',
+                    ))
+                for leg in legs:
+                    leg.created_at = when
+                postings += legs
+            ledger.post(postings)
+            search.index(entries)
+            Transfer.objects.bulk_create(transfers)
+            Notification.objects.bulk_create(notifications)
+            counts.update(transactions=len(entries), postings=len(postings), search=len(entries),
+                          transfers=len(transfers), notifications=len(notifications))
+
+        account_ids = [account.pk for account in accounts]
+        counts['rollups'] += rollups.rebuild(account_ids)
+        counts['snapshots'] += ledger.take_snapshots(account_ids)
+    return counts
+
+
+def seed_block(spec, block):
+    """Generate and write one block of users; the same ``spec`` and block always give the same data."""
+    first = spec['start'] + block * spec['block_size']
+    users = range(first, min(first + spec['block_size'], spec['start'] + spec['users']))
+    rng = random.Random(f'{spec["seed"]}:{first}')
+    accounts, history = _simulate(rng, spec, users)
+    for attempt in range(LOCK_RETRIES):
+        try:
+            counts = _write_block(spec, accounts, history)
+            reset_queries()
+            return counts
+        except OperationalError:
+            # Another process held SQLite's write lock past busy_timeout; the block rolled back whole
+            if attempt == LOCK_RETRIES - 1:
+                raise
+            time.sleep(rng.uniform(0.5, 2))
+
+
+def _seed_block_in_process(spec, block):
+    with fast_load():
+        return seed_block(spec, block)
+
+
+def seed(users, transactions=50, days=365, seed=0, start=0, prefix='seed', block_size=200, batch_size=5000,
+         processes=1, end=None):
+    """Create ``users`` users with accounts and about ``transactions`` ledger rows per account.
+
+    Users are generated in blocks of ``block_size``, each from its own random
+    stream, so the data depends on ``seed`` and ``block_size`` but not on ``processes``.
+    History runs over the ``days`` before ``end`` (default: today's midnight).
+    Returns row counts per table.
+    """
+    end = end or timezone.make_aware(datetime.combine(timezone.localdate(), datetime.min.time()))
+    spec = {'users': users, 'transactions': transactions, 'days': days, 'seed': seed, 'start': start,
+            'prefix': prefix, 'block_size': block_size, 'batch_size': batch_size, 'end': end}
+    blocks = range(-(-users // block_size))
+    counts = Counter()
+    if processes <= 1:
+        with fast_load():
+            for block in blocks:
+                counts.update(seed_block(spec, block))
+        return counts
+    if connection.vendor == 'sqlite' and connection.is_in_memory_db():
+        raise ValueError('Parallel seeding needs a database the other processes can open')
+    # Spawned rather than forked, so children don't inherit this process's connection
+    with ProcessPoolExecutor(max_workers=processes, mp_context=get_context('spawn'), initializer=setup_worker,
+                             initargs=(connection.settings_dict['NAME'],)) as pool:
+        for block_counts in pool.map(_seed_block_in_process, [spec] * len(blocks), blocks):
+            counts.update(block_counts)
+    return counts
+
+
+def read_feed(stream, format='csv'):
+    """Yield ``(line number, row)`` from a CSV or NDJSON text stream, one row at a time."""
+    if format == 'ndjson':
+        for line, text in enumerate(stream, start=1):
+            if not text.strip():
+                continue
+            try:
+                yield line, json.loads(text)
+            except ValueError:
+                yield line, text
+        return
+    reader = csv.DictReader(stream)
+    for row in reader:
+        yield reader.line_num, row
+
+
+def parse_entry(row):
+    """Validate one feed row: account, type (deposit or withdrawal), amount, and optional date, reference, memo."""
+    if not isinstance(row, dict):
+        raise FeedError('expected an object')
+    try:
+        account = str(row['account']).strip()
+        amount = Decimal(str(row['amount'])).quantize(Decimal('0.01'))
+        kind = str(row['type']).strip().lower()
+    except (KeyError, InvalidOperation) as e:
+        raise FeedError('expected account, type and a numeric amount') from e
+    if kind not in ('deposit', 'withdrawal'):
+        raise FeedError(f'unknown type {kind!r}')
+    if not amount.is_finite() or not Decimal(0) < amount < Decimal(10 ** 8):
+        raise FeedError('amount out of range')
+    when = timezone.now()
+    if row.get('date'):
+        try:
+            when = parse_datetime(str(row['date']))
+        except ValueError:
+            when = None
+        if when is None:
+            raise FeedError(f'invalid date {row["date"]!r}')
+        if timezone.is_naive(when):
+            when = timezone.make_aware(when)
+    reference = str(row.get('reference') or '').strip() or None
+    if reference and len(reference) > 64:
+        raise FeedError('reference longer than 64 characters')
+    return {'account': account, 'type': kind, 'amount': amount, 'date': when, 'reference': reference,
+            'memo': str(row.get('memo') or '')[:140]}
+
+
+def _import_chunk(chunk, external_ledger, reject, results):
+    with transaction.atomic():
+        accounts = {account.account_number: account for account in
+                    Account.objects.select_for_update().filter(account_number__in={item['account'] for _, item in chunk})
+                    .order_by('pk').only('pk', 'user_id', 'account_number', 'balance', 'is_frozen')}
+        # References already imported on these accounts; a rerun of the same feed skips them
+        seen = set(Transaction.objects
+                   .filter(account__in=accounts.values(),
+                           idempotency_key__in={item['reference'] for _, item in chunk if item['reference']})
+                   .values_list('account_id', 'idempotency_key'))
+        balances = {account.pk: account.balance for account in accounts.values()}
+        rows = []
+        for line, item in chunk:
+            account = accounts.get(item['account'])
+            if account is None:
+                reject(line, f'unknown account {item["account"]}')
+                continue
+            if item['reference'] and (account.pk, item['reference']) in seen:
+                results['duplicate'] += 1
+                continue
+            if item['type'] == 'withdrawal':
+                if account.is_frozen:
+                    reject(line, f'account {account.account_number} is frozen')
+                    continue
+                if balances[account.pk] < item['amount']:
+                    reject(line, f'insufficient funds in account {account.account_number}')
+                    continue
+            balances[account.pk] += item['amount'] if item['type'] == 'deposit' else -item['amount']
+            seen.add((account.pk, item['reference']))
+            rows.append(Transaction(user_id=account.user_id, account_id=account.pk, transaction_type=item['type'],
+                                    amount=item['amount'], date=item['date'], idempotency_key=item['reference'],
+                                    memo=item['memo']))
+        if not rows:
+            return None
+        changed = {account.pk: account for account in accounts.values() if balances[account.pk] != account.balance}
+        # A feed chunk touches hundreds of accounts; like rollups, one prepared UPDATE per account beats a huge CASE
+        with connection.cursor() as cursor:
+            cursor.executemany(f'UPDATE {connection.ops.quote_name(Account._meta.db_table)} '
+                               f'SET balance = balance + %s WHERE id = %s',
+                               [(balances[pk] - account.balance, pk) for pk, account in changed.items()])
+        rows = Transaction.objects.bulk_create(rows)
+        postings = []
+        for row in rows:
+            legs = ledger.external_legs(row, row.amount if row.transaction_type == 'deposit' else -row.amount,
+                                        external_ledger)
+            # End-of-day balances bucket by posting time, so the ledger keeps the feed's date too
+            for leg in legs:
+                leg.created_at = row.date
+            postings += legs
+        ledger.record(postings, [(row, None) for row in rows],
+                      [(account, balances[pk]) for pk, account in changed.items()])
+        results['imported'] += len(rows)
+        return min(row.date for row in rows)
+
+
+def import_ledger(stream, format='csv', batch_size=500, external_ledger='cash', on_reject=None):
+    """Post deposits and withdrawals from an external feed, ``batch_size`` rows per transaction.
+
+    Rows with a ``reference`` already imported on the same account are
+    skipped, so a feed can be replayed after a failure. Rows that can't be
+    posted are passed to ``on_reject(line, reason)`` and the rest go ahead.
+    Closed days the feed reaches back into are reopened for ``close_days``.
+    Returns counts of ``imported``, ``duplicate`` and ``rejected`` rows.
+    """
+    results = Counter()
+
+    def reject(line, reason):
+        results['rejected'] += 1
+        if on_reject is not None:
+            on_reject(line, reason)
+
+    def entries():
+        for line, row in read_feed(stream, format):
+            try:
+                yield line, parse_entry(row)
+            except FeedError as e:
+                reject(line, str(e))
+
+    earliest = None
+    with explicit_timestamps(Transaction, 'date'), explicit_timestamps(Posting, 'created_at'):
+        for chunk in batched(entries(), batch_size):
+            first = _import_chunk(chunk, external_ledger, reject, results)
+            if first is not None:
+                earliest = min(earliest or first, first)
+            # With DEBUG on, the connection keeps the SQL of its last 9000 queries, bulk inserts included
+            reset_queries()
+    last_closed = eod.last_closed()
+    if earliest is not None and last_closed is not None and timezone.localdate(earliest) <= last_closed:
+        eod.reopen(timezone.localdate(earliest))
+    return results
@@ -0,0 +1,87 @@
+"""Database profiles selected by BANK_DB_PROFILE; imported by settings, so no model imports here."""
+import os
+
+from django.conf import settings
+
+# Applied to every new SQLite connection when BANK_SQLITE_TUNING is on
+SQLITE_PRAGMAS = {
+    'journal_mode': 'WAL',  # readers no longer block the writer
+    'synchronous': 'NORMAL',  # fsync at checkpoints only; safe with WAL
+    'busy_timeout': 5000,  # ms to wait for the write lock instead of failing
+    'temp_store': 'MEMORY',
+}
+
+
+def database_config(profile, base_dir):
+    """The ``DATABASES['default']`` entry for ``profile``."""
+    if profile in ('sqlite', 'sqlite-default'):
+        return {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': os.environ.get('BANK_DB_NAME', base_dir / 'db.sqlite3'),
+        }
+    if profile == 'postgres':
+        config = {
+            'ENGINE': 'django.db.backends.postgresql',
+            'NAME': os.environ.get('BANK_DB_NAME', 'bank'),
+            'USER': os.environ.get('BANK_DB_USER', 'bank'),
+            'PASSWORD': os.environ.get('BANK_DB_PASSWORD', ''),
+            'HOST': os.environ.get('BANK_DB_HOST', 'localhost'),
+            'PORT': os.environ.get('BANK_DB_PORT', '5432'),
+            'CONN_HEALTH_CHECKS': True,
+            'OPTIONS': {},
+        }
+        if os.environ.get('BANK_DB_POOL') == '1':
+            # psycopg pool (Django 5.1+); persistent connections must be off when pooling
+            config['CONN_MAX_AGE'] = 0
+            config['OPTIONS']['pool'] = {
+                'min_size': int(os.environ.get('BANK_DB_POOL_MIN', 2)),
+                'max_size': int(os.environ.get('BANK_DB_POOL_MAX', 20)),
+            }
+        else:
+            config['CONN_MAX_AGE'] = int(os.environ.get('BANK_DB_CONN_MAX_AGE', 60))
+        return config
+    raise ValueError(f'Unknown BANK_DB_PROFILE {profile!r}')
+
+
+def replica_config(primary):
+    """A read replica of ``primary`` from BANK_DB_REPLICA_*, or None when none is configured.
+
+    For SQLite the replica is a second file (see ``manage.py sync_sqlite_replica``).
+    """
+    if primary['ENGINE'].endswith('sqlite3'):
+        name = os.environ.get('BANK_DB_REPLICA_NAME')
+        if not name:
+            return None
+        config = {**primary, 'NAME': name}
+    else:
+        host = os.environ.get('BANK_DB_REPLICA_HOST')
+        if not host:
+            return None
+        config = {**primary, 'HOST': host, 'OPTIONS': dict(primary.get('OPTIONS', {}))}
+    # Tests read the replica through the primary's test database
+    config['TEST'] = {'MIRROR': 'default'}
+    return config
+
+
+def setup_worker(database_name):
+    """``ProcessPoolExecutor`` initializer: set Django up in a spawned process, on the parent's database."""
+    import django
+
+    # The parent may be writing to a test or benchmark database rather than the configured one
+    settings.DATABASES['default']['NAME'] = database_name
+    django.setup()
+
+
+def configure_sqlite(sender, connection, **kwargs):
+    """``connection_created`` receiver applying the SQLite tuning."""
+    if connection.vendor != 'sqlite' or not getattr(settings, 'BANK_SQLITE_TUNING', False):
+        return
+    # Shared-cache memory databases (the test database) use table locks that never wait; leave them alone
+    if connection.is_in_memory_db():
+        return
+    with connection.cursor() as cursor:
+        for name, value in getattr(settings, 'BANK_SQLITE_PRAGMAS', SQLITE_PRAGMAS).items():
+            cursor.execute(f'PRAGMA {name} = {value}')
+    # Take the write lock at BEGIN so two readers can't deadlock upgrading to writers
+    # (honoured by Django 5.1+, which reads this on every transaction)
+    connection.transaction_mode = 'IMMEDIATE'
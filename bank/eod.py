@@ -0,0 +1,132 @@
+"""End-of-day balances: a ``DailyBalance`` row per account for each day it had postings.
+
+``close_days`` (``manage.py close_days``, nightly) closes finished days in
+order, each from that day's postings alone, so a close only touches the
+accounts that moved. ``as_of`` then answers from one indexed lookup, plus the
+postings since when asked about a day that isn't closed yet.
+
+A day is closed BANK_EOD_GRACE seconds after it ends, so postings still
+committing at midnight land in it; anything later needs ``reopen``, which
+``import_ledger`` does for the days an imported feed reaches back into.
+"""
+from datetime import datetime, time, timedelta
+from decimal import Decimal
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Max, Min, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from .ledger import CENT
+from .models import Account, BalanceClose, DailyBalance, Posting
+from .utils import batched
+
+
+class DayAlreadyClosed(Exception):
+    pass
+
+
+def day_bounds(day):
+    """Aware ``[start, end)`` of ``day`` in TIME_ZONE."""
+    return (timezone.make_aware(datetime.combine(day, time.min)),
+            timezone.make_aware(datetime.combine(day + timedelta(days=1), time.min)))
+
+
+def last_closed():
+    return BalanceClose.objects.aggregate(last=Max('date'))['last']
+
+
+def closable_through(now=None):
+    """The latest day whose grace period is over."""
+    now = timezone.localtime(now) - timedelta(seconds=getattr(settings, 'BANK_EOD_GRACE', 300))
+    return now.date() - timedelta(days=1)
+
+
+def _latest_row(day, inclusive=True):
+    rows = DailyBalance.objects.filter(account=OuterRef('pk'))
+    rows = rows.filter(date__lte=day) if inclusive else rows.filter(date__lt=day)
+    return rows.order_by('-date')
+
+
+def close_day(day, batch_size=5000):
+    """Write ``day``'s end-of-day rows for the accounts with postings that day; returns how many."""
+    start, end = day_bounds(day)
+    totals = (Posting.objects
+              .filter(account__isnull=False, created_at__gte=start, created_at__lt=end)
+              .order_by()
+              .values('account')
+              .annotate(total=Sum('amount'), last=Max('id'))
+              .values_list('account', 'total', 'last'))
+    previous_balance = Subquery(_latest_row(day, inclusive=False).values('balance')[:1])
+    closed = 0
+    with transaction.atomic():
+        if BalanceClose.objects.filter(date__gte=day).exists():
+            raise DayAlreadyClosed(f'{day} is already closed')
+        for batch in batched(totals.iterator(chunk_size=batch_size), batch_size):
+            previous = dict(Account.objects.filter(pk__in=[account for account, _, _ in batch])
+                            .annotate(previous=previous_balance).values_list('pk', 'previous'))
+            # SQLite sums decimals as floats; round back to cents
+            DailyBalance.objects.bulk_create([
+                DailyBalance(account_id=account, date=day, posting_id=last,
+                             balance=((previous[account] or Decimal(0)) + total).quantize(CENT))
+                for account, total, last in batch
+            ])
+            closed += len(batch)
+        BalanceClose.objects.create(date=day, accounts=closed)
+    return closed
+
+
+def close_days(through=None, batch_size=5000):
+    """Close every finished day after the last closed one, up to ``through``; returns ``{day: accounts}``."""
+    through = min(through, closable_through()) if through else closable_through()
+    last = last_closed()
+    if last is None:
+        first = Posting.objects.aggregate(first=Min('created_at'))['first']
+        if first is None:
+            return {}
+        last = timezone.localdate(first) - timedelta(days=1)
+    closed = {}
+    day = last + timedelta(days=1)
+    while day <= through:
+        closed[day] = close_day(day, batch_size)
+        day += timedelta(days=1)
+    return closed
+
+
+def reopen(day):
+    """Drop the closes of ``day`` and every later day, e.g. after a posting committed past the grace period."""
+    with transaction.atomic():
+        DailyBalance.objects.filter(date__gte=day).delete()
+        return BalanceClose.objects.filter(date__gte=day).delete()[0]
+
+
+def as_of(account_ids, day):
+    """``{account_id: ledger balance at the end of day}``.
+
+    Each balance is the account's latest end-of-day row on or before ``day``;
+    for a day not closed yet, the postings made after that row are added.
+    """
+    latest = _latest_row(day)
+    rows = (Account.objects
+            .filter(pk__in=account_ids)
+            .annotate(closed_balance=Subquery(latest.values('balance')[:1]),
+                      closed_posting=Subquery(latest.values('posting_id')[:1])))
+    last = last_closed()
+    if last is not None and last >= day:
+        return {pk: balance or Decimal(0) for pk, balance in rows.values_list('pk', 'closed_balance')}
+
+    # An account with no row yet is summed from its first posting
+    tail = (Posting.objects
+            .filter(account=OuterRef('pk'), id__gt=Coalesce(OuterRef('closed_posting'), 0),
+                    created_at__lt=day_bounds(day)[1])
+            .order_by()
+            .values('account')
+            .annotate(total=Sum('amount'))
+            .values('total'))
+    return {pk: ((balance or Decimal(0)) + Decimal(tail or 0)).quantize(CENT)
+            for pk, balance, tail in rows.annotate(tail=Subquery(tail)).values_list('pk', 'closed_balance', 'tail')}
+
+
+def balance_as_of(account, day):
+    return as_of([account.pk], day)[account.pk]
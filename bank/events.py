@@ -0,0 +1,252 @@
+"""Account activity events for live clients, streamed by the async ``events`` view as server-sent events.
+
+Ledger writes and new notifications publish a small event for the user once
+the transaction commits. Each user's events are numbered, and the last
+BANK_EVENTS_HISTORY of them are kept, so a reconnecting ``EventSource``
+resumes from its ``Last-Event-ID``. When that is too far back the stream
+sends a ``reset`` event and the client reloads instead.
+
+BANK_EVENTS_BUS picks where events go: ``memory`` delivers to streams in this
+process only (one ASGI process); ``cache`` goes through BANK_EVENTS_CACHE,
+which every process must share (e.g. Redis), and streams poll it.
+"""
+import asyncio
+import json
+import threading
+from collections import OrderedDict, deque, namedtuple
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.test.signals import setting_changed
+
+Event = namedtuple('Event', ['id', 'kind', 'data'])
+
+HISTORY_USERS = 10000  # Users whose recent events the memory bus keeps for resuming
+
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
+
+def format_event(event):
+    return f'id: {event.id}\nevent: {event.kind}\ndata: {json.dumps(event.data, separators=(",", ":"))}\n\n'
+
+
+RESET = 'event: reset\ndata: {}\n\n'
+
+
+class Subscription:
+    """One stream's bounded queue, fed on the stream's own event loop.
+
+    A client that stops reading fills the queue; the stream then ends with a
+    ``reset`` instead of buffering without limit.
+    """
+
+    def __init__(self, user_id, size):
+        self.user_id = user_id
+        self.loop = asyncio.get_running_loop()
+        self.queue = asyncio.Queue(size)
+        self.overflowed = False
+        self.poller = None
+
+    def deliver(self, event):
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            self.overflowed = True
+
+    def deliver_threadsafe(self, event):
+        try:
+            self.loop.call_soon_threadsafe(self.deliver, event)
+        except RuntimeError:
+            pass  # The loop has closed; the stream is gone
+
+
+class MemoryBus:
+    def __init__(self, history=None):
+        self.history = history or _setting('BANK_EVENTS_HISTORY', 100)
+        self._subscribers = {}
+        self._events = OrderedDict()
+        self._last_ids = {}
+        self._lock = threading.Lock()
+
+    def publish(self, user_id, kind, data):
+        with self._lock:
+            event = Event(self._last_ids.get(user_id, 0) + 1, kind, data)
+            self._last_ids[user_id] = event.id
+            if user_id not in self._events:
+                self._events[user_id] = deque(maxlen=self.history)
+                if len(self._events) > HISTORY_USERS:
+                    # Ids carry on from _last_ids, so a stream resuming across the eviction gets a reset
+                    self._events.popitem(last=False)
+            self._events.move_to_end(user_id)
+            self._events[user_id].append(event)
+            subscribers = list(self._subscribers.get(user_id, ()))
+        for subscription in subscribers:
+            subscription.deliver_threadsafe(event)
+        return event
+
+    def since(self, user_id, last_id):
+        """Events after ``last_id``, or None when some of them are no longer kept."""
+        with self._lock:
+            last = self._last_ids.get(user_id, 0)
+            events = list(self._events.get(user_id, ()))
+        if last_id > last or (last_id < last and (not events or events[0].id > last_id + 1)):
+            return None
+        return [event for event in events if event.id > last_id]
+
+    def subscribe(self, user_id, size):
+        subscription = Subscription(user_id, size)
+        with self._lock:
+            self._subscribers.setdefault(user_id, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            subscribers = self._subscribers.get(subscription.user_id, set())
+            subscribers.discard(subscription)
+            if not subscribers:
+                self._subscribers.pop(subscription.user_id, None)
+
+    @property
+    def stream_count(self):
+        return sum(len(subscribers) for subscribers in self._subscribers.values())
+
+
+class CacheBus:
+    """Events in a shared cache: a per-user counter plus one key per event, polled by each stream."""
+
+    prefix = 'bank:events:'
+
+    def __init__(self, alias=None, history=None, poll_interval=None):
+        self.alias = alias or _setting('BANK_EVENTS_CACHE', 'default')
+        self.history = history or _setting('BANK_EVENTS_HISTORY', 100)
+        self.poll_interval = poll_interval or _setting('BANK_EVENTS_POLL_INTERVAL', 0.5)
+        self.ttl = _setting('BANK_EVENTS_TTL', 3600)
+
+    def _last(self, cache, user_id):
+        return cache.get(f'{self.prefix}{user_id}:last', 0)
+
+    def publish(self, user_id, kind, data):
+        cache = caches[self.alias]
+        key = f'{self.prefix}{user_id}:last'
+        cache.add(key, 0, None)
+        event_id = cache.incr(key)
+        cache.set(f'{self.prefix}{user_id}:{event_id}', (kind, data), self.ttl)
+        return Event(event_id, kind, data)
+
+    def since(self, user_id, last_id):
+        cache = caches[self.alias]
+        last = self._last(cache, user_id)
+        if last_id > last or last - last_id > self.history:
+            return None
+        keys = {f'{self.prefix}{user_id}:{event_id}': event_id for event_id in range(last_id + 1, last + 1)}
+        found = cache.get_many(keys)
+        if len(found) < len(keys):
+            return None
+        return [Event(keys[key], *found[key]) for key in keys]
+
+    async def _poll(self, subscription):
+        last_id = self._last(caches[self.alias], subscription.user_id)
+        while True:
+            await asyncio.sleep(self.poll_interval)
+            # Plain cache calls: the async cache API would queue every stream behind Django's one sync thread
+            events = self.since(subscription.user_id, last_id)
+            if events is None:
+                subscription.overflowed = True
+                return
+            for event in events:
+                subscription.deliver(event)
+                last_id = event.id
+
+    def subscribe(self, user_id, size):
+        subscription = Subscription(user_id, size)
+        subscription.poller = asyncio.ensure_future(self._poll(subscription))
+        return subscription
+
+    def unsubscribe(self, subscription):
+        subscription.poller.cancel()
+
+
+BUSES = {
+    'memory': MemoryBus,
+    'cache': CacheBus,
+}
+
+_bus = None
+_bus_lock = threading.Lock()
+
+
+def get_bus():
+    global _bus
+    if _bus is None:
+        with _bus_lock:
+            if _bus is None:
+                _bus = BUSES[_setting('BANK_EVENTS_BUS', 'memory')]()
+    return _bus
+
+
+def set_bus(bus):
+    global _bus
+    _bus = bus
+
+
+def _reset_bus(setting, **kwargs):
+    if setting.startswith('BANK_EVENTS_'):
+        set_bus(None)
+
+
+setting_changed.connect(_reset_bus)
+
+
+def publish_on_commit(user_id, kind, data):
+    transaction.on_commit(lambda: get_bus().publish(user_id, kind, data))
+
+
+def balance_changed(account, balance, row=None):
+    """Publish ``account``'s new balance after commit; ``row`` is the ledger row that changed it, if just one."""
+    data = {'account': account.account_number, 'balance': str(balance)}
+    if row is not None:
+        data.update(transaction=row.pk, type=row.transaction_type, amount=str(row.amount))
+    publish_on_commit(account.user_id, 'balance', data)
+
+
+async def stream(user_id, last_event_id=None, bus=None):
+    """Server-sent events for ``user_id``: missed events first, then live ones, with heartbeats in between."""
+    bus = bus or get_bus()
+    heartbeat = _setting('BANK_EVENTS_HEARTBEAT', 15)
+    # Subscribe before replaying so nothing published in between is lost; ids drop the duplicates
+    subscription = bus.subscribe(user_id, _setting('BANK_EVENTS_QUEUE_SIZE', 100))
+    try:
+        yield f'retry: {_setting("BANK_EVENTS_RETRY", 3000)}\n\n'
+        sent = 0
+        if last_event_id is not None:
+            missed = bus.since(user_id, last_event_id)
+            if missed is None:
+                yield RESET
+            else:
+                for event in missed:
+                    yield format_event(event)
+                sent = last_event_id if not missed else missed[-1].id
+        while True:
+            if subscription.overflowed:
+                yield RESET
+                return
+            try:
+                event = await asyncio.wait_for(subscription.queue.get(), heartbeat)
+            except asyncio.TimeoutError:
+                yield ': heartbeat\n\n'
+                continue
+            if event.id > sent:
+                sent = event.id
+                yield format_event(event)
+    finally:
+        bus.unsubscribe(subscription)
+
+
+def parse_last_event_id(value):
+    try:
+        return int(value) if value else None
+    except ValueError:
+        return None
@@ -1,7 +1,12 @@
+from datetime import timedelta
+
 from django import forms
 from django.contrib.auth.models import User
 from django.contrib.auth.forms import UserCreationForm
 
+from .passwords import make_password
+from .search import text_filter
+
 class RegisterForm(UserCreationForm):
     email = forms.EmailField(required=True)
 
@@ -10,7 +15,9 @@ class RegisterForm(UserCreationForm):
         fields = ['username', 'email', 'password1', 'password2']
 
     def save(self, commit=True):
-        user = super(RegisterForm, self).save(commit=False)
+        # ModelForm.save rather than UserCreationForm's, which hashes in the request thread
+        user = forms.ModelForm.save(self, commit=False)
+        user.password = make_password(self.cleaned_data['password1'])
         user.email = self.cleaned_data['email']
         if commit:
             user.save()
@@ -43,4 +50,25 @@ class TransactionFilterForm(forms.Form):
     date_to = forms.DateField(required=False, widget=forms.TextInput(attrs={'type': 'date'}))
     transaction_type = forms.ChoiceField(choices=[('', 'All'), ('deposit', 'Deposit'), ('withdrawal', 'Withdrawal'), ('transfer', 'Transfer')], required=False)
     min_amount = forms.DecimalField(required=False, decimal_places=2, max_digits=10)
-    max_amount = forms.DecimalField(required=False, decimal_places=2, max_digits=10)
\ No newline at end of file
+    max_amount = forms.DecimalField(required=False, decimal_places=2, max_digits=10)
+    q = forms.CharField(required=False, max_length=100, label='Search')  # Counterparty account, username or memo
+
+    def filter(self, transactions):
+        """Apply the filters to a ``TransactionSearch`` queryset; ``q`` goes through ``bank.search.text_filter``."""
+        if not self.is_valid():
+            return transactions
+        data = self.cleaned_data
+        if data['date_from']:
+            transactions = transactions.filter(date__gte=data['date_from'])
+        if data['date_to']:
+            # Whole of the end day, as a range so the date index can be used
+            transactions = transactions.filter(date__lt=data['date_to'] + timedelta(days=1))
+        if data['transaction_type']:
+            transactions = transactions.filter(transaction_type=data['transaction_type'])
+        if data['min_amount'] is not None:
+            transactions = transactions.filter(amount__gte=data['min_amount'])
+        if data['max_amount'] is not None:
+            transactions = transactions.filter(amount__lte=data['max_amount'])
+        if data['q'].strip():
+            transactions = text_filter(transactions, data['q'])
+        return transactions
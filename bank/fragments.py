@@ -0,0 +1,174 @@
+import threading
+import time
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.template.loader import render_to_string
+
+from .models import Account, Notification, Transaction
+from .pagination import paginate
+from .replicas import use_replica
+
+
+def _cache():
+    # Any backend with add/incr works: locmem, file, or Redis for cross-process sharing
+    return caches[getattr(settings, 'BANK_FRAGMENT_CACHE', 'default')]
+
+
+def fragments_enabled():
+    return getattr(settings, 'BANK_FRAGMENT_CACHE_ENABLED', True)
+
+
+class FragmentStats:
+    """Per-fragment hit/miss/wait counters for this process."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counts = defaultdict(lambda: {'hit': 0, 'miss': 0, 'wait': 0})
+
+    def record(self, name, result):
+        with self._lock:
+            self.counts[name][result] += 1
+
+    def report(self):
+        with self._lock:
+            counts = {name: dict(results) for name, results in self.counts.items()}
+        for results in counts.values():
+            total = results['hit'] + results['miss'] + results['wait']
+            results['hit_rate'] = results['hit'] / total if total else 0
+        return counts
+
+    def prometheus(self):
+        lines = ['# HELP bank_fragment_cache_requests_total Dashboard fragment lookups by result',
+                 '# TYPE bank_fragment_cache_requests_total counter']
+        with self._lock:
+            for name, results in self.counts.items():
+                for result, count in results.items():
+                    lines.append(f'bank_fragment_cache_requests_total{{fragment="{name}",result="{result}"}} {count}')
+        return '\n'.join(lines) + '\n'
+
+    def reset(self):
+        with self._lock:
+            self.counts.clear()
+
+
+stats = FragmentStats()
+
+
+def _version_key(user_id):
+    return f'bank:fragments:version:{user_id}'
+
+
+def _new_version():
+    # Seeded from the clock so an evicted counter never restarts at a version still cached
+    return time.time_ns() // 1000
+
+
+def version(user_id):
+    cache = _cache()
+    key = _version_key(user_id)
+    current = cache.get(key)
+    if current is None:
+        cache.add(key, _new_version(), None)
+        current = cache.get(key)
+    return current
+
+
+def bump(user_ids):
+    """Move each user to a new version; their old fragments are simply never read again."""
+    cache = _cache()
+    for user_id in set(user_ids):
+        try:
+            cache.incr(_version_key(user_id))
+        except ValueError:
+            cache.add(_version_key(user_id), _new_version(), None)
+
+
+def touch(user_ids):
+    """Bump after the current transaction commits, so nobody recomputes from uncommitted state."""
+    user_ids = set(user_ids)
+    transaction.on_commit(lambda: bump(user_ids))
+
+
+def _compute_once(name, key, compute):
+    """Single flight: one caller recomputes a missing fragment while the others wait for it."""
+    cache = _cache()
+    lock_key = key + ':lock'
+    lock_timeout = getattr(settings, 'BANK_FRAGMENT_LOCK_TIMEOUT', 5)
+    if cache.add(lock_key, 1, lock_timeout):
+        try:
+            value = compute()
+            cache.set(key, value, getattr(settings, 'BANK_FRAGMENT_TTL', 300))
+        finally:
+            cache.delete(lock_key)
+        stats.record(name, 'miss')
+        return value
+
+    deadline = time.monotonic() + lock_timeout
+    while time.monotonic() < deadline:
+        time.sleep(0.01)
+        value = cache.get(key)
+        if value is not None:
+            stats.record(name, 'wait')
+            return value
+    # The holder died or is very slow; compute without caching rather than fail the page
+    stats.record(name, 'miss')
+    return compute()
+
+
+def get_fragments(user, computes):
+    """``{name: html}`` for ``computes`` (``{name: callable}``), from the cache where possible.
+
+    Costs two cache round trips when every fragment is cached.
+    """
+    if not fragments_enabled():
+        return {name: compute() for name, compute in computes.items()}
+    current = version(user.pk)
+    keys = {name: f'bank:fragments:{name}:{user.pk}:{current}' for name in computes}
+    cached = _cache().get_many(keys.values())
+    fragments = {}
+    for name, compute in computes.items():
+        if keys[name] in cached:
+            stats.record(name, 'hit')
+            fragments[name] = cached[keys[name]]
+        else:
+            fragments[name] = _compute_once(name, keys[name], compute)
+    return fragments
+
+
+def _primary(func):
+    # A lagging replica would get stale data cached under the new version
+    def compute():
+        with use_replica(None):
+            return func()
+    return compute
+
+
+def account_header(user):
+    def compute():
+        account = Account.objects.get(user=user)
+        return render_to_string('bank/fragments/account_header.html', {'account': account})
+    return _primary(compute)
+
+
+def recent_transactions(user, page_size=10, cursor=None):
+    def compute():
+        account = Account.objects.get(user=user)
+        transactions = Transaction.objects.filter(account=account).prefetch_related('user')
+        page = paginate(transactions, cursor=cursor, page_size=page_size)
+        return render_to_string('bank/fragments/recent_transactions.html', {'transactions': page, 'page': page})
+    return _primary(compute)
+
+
+def unread_badge(user):
+    def compute():
+        count = Notification.objects.filter(user=user, is_read=False).count()
+        return render_to_string('bank/fragments/unread_badge.html', {'unread_notification_count': count})
+    return _primary(compute)
+
+
+def invalidate_on_save(sender, instance, **kwargs):
+    """``post_save`` receiver for models shown in the fragments (limit edits in AccountAdmin, new notifications)."""
+    touch([instance.user_id])
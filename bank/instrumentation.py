@@ -0,0 +1,263 @@
+import bisect
+import contextvars
+import random
+import threading
+import time
+import tracemalloc
+from collections import defaultdict
+from contextlib import contextmanager
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500)
+BYTE_BUCKETS = (2 ** 14, 2 ** 16, 2 ** 18, 2 ** 20, 2 ** 22, 2 ** 24, 2 ** 26)
+
+_current = contextvars.ContextVar('bank_request_stats', default=None)
+
+
+def instrumentation_enabled():
+    return getattr(settings, 'BANK_INSTRUMENTATION_ENABLED', False)
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, q):
+        """Upper bound of the bucket holding the ``q`` quantile."""
+        if not self.count:
+            return 0
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(self.buckets, self.counts):
+            seen += count
+            if seen >= rank:
+                return bound
+        return float('inf')
+
+
+class ViewStats:
+    def __init__(self):
+        self.latency = Histogram(LATENCY_BUCKETS)
+        self.queries = Histogram(QUERY_BUCKETS)
+        self.db_time = Histogram(LATENCY_BUCKETS)
+        self.external = defaultdict(lambda: Histogram(LATENCY_BUCKETS))
+        self.allocations = Histogram(BYTE_BUCKETS)
+
+    def as_dict(self):
+        return {
+            'requests': self.latency.count,
+            'mean_ms': self.latency.sum / self.latency.count * 1000 if self.latency.count else 0,
+            'p95_ms': self.latency.quantile(0.95) * 1000,
+            'queries_per_request': self.queries.sum / self.queries.count if self.queries.count else 0,
+            'db_ms_per_request': self.db_time.sum / self.db_time.count * 1000 if self.db_time.count else 0,
+            'external_ms': {kind: h.sum * 1000 for kind, h in self.external.items()},
+            'peak_alloc_bytes': self.allocations.sum / self.allocations.count if self.allocations.count else None,
+        }
+
+
+class Registry:
+    """Per-view histograms for this process."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.views = defaultdict(ViewStats)
+
+    def record(self, view, stats, elapsed):
+        with self._lock:
+            view_stats = self.views[view]
+            view_stats.latency.observe(elapsed)
+            view_stats.queries.observe(stats.queries)
+            view_stats.db_time.observe(stats.db_time)
+            for kind, seconds in stats.external.items():
+                view_stats.external[kind].observe(seconds)
+            if stats.peak_alloc is not None:
+                view_stats.allocations.observe(stats.peak_alloc)
+
+    def report(self, top=None, sort='p95_ms'):
+        with self._lock:
+            rows = [dict(view=view, **stats.as_dict()) for view, stats in self.views.items()]
+        rows.sort(key=lambda row: row[sort] or 0, reverse=True)
+        return rows[:top] if top else rows
+
+    def prometheus(self):
+        lines = []
+        with self._lock:
+            views = list(self.views.items())
+        for name, attr, buckets, help_text in (
+            ('bank_request_seconds', 'latency', LATENCY_BUCKETS, 'View wall time'),
+            ('bank_request_db_queries', 'queries', QUERY_BUCKETS, 'Database queries per request'),
+            ('bank_request_db_seconds', 'db_time', LATENCY_BUCKETS, 'Database time per request'),
+            ('bank_request_alloc_bytes', 'allocations', BYTE_BUCKETS, 'Peak allocations of sampled requests'),
+        ):
+            lines += [f'# HELP {name} {help_text}', f'# TYPE {name} histogram']
+            for view, stats in views:
+                lines += _histogram_lines(name, f'view="{view}"', getattr(stats, attr))
+        lines += ['# HELP bank_request_external_seconds External call time per request',
+                  '# TYPE bank_request_external_seconds histogram']
+        for view, stats in views:
+            for kind, histogram in stats.external.items():
+                lines += _histogram_lines('bank_request_external_seconds', f'view="{view}",kind="{kind}"', histogram)
+        return '\n'.join(lines) + '\n'
+
+    def reset(self):
+        with self._lock:
+            self.views.clear()
+
+
+def _histogram_lines(name, labels, histogram):
+    lines = []
+    cumulative = 0
+    for bound, count in zip(histogram.buckets, histogram.counts):
+        cumulative += count
+        lines.append(f'{name}_bucket{{{labels},le="{bound}"}} {cumulative}')
+    lines.append(f'{name}_bucket{{{labels},le="+Inf"}} {histogram.count}')
+    lines.append(f'{name}_sum{{{labels}}} {histogram.sum}')
+    lines.append(f'{name}_count{{{labels}}} {histogram.count}')
+    return lines
+
+
+registry = Registry()
+
+
+class RequestStats:
+    def __init__(self):
+        self.queries = 0
+        self.db_time = 0
+        self.external = defaultdict(float)
+        self.peak_alloc = None
+
+    def __call__(self, execute, sql, params, many, context):
+        # connection.execute_wrapper hook
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.db_time += time.perf_counter() - started
+            self.queries += 1
+
+
+@contextmanager
+def external_call(kind):
+    """Attribute the block's wall time to ``kind`` (smtp, sms, fx) on the current request."""
+    stats = _current.get()
+    if stats is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        stats.external[kind] += time.perf_counter() - started
+
+
+def observe_queries(sender, connection, **kwargs):
+    """``connection_created`` receiver: count each connection's queries toward the request being measured.
+
+    Installed on the connection rather than per request so queries that async
+    views run in ``sync_to_async`` threads are counted too.
+    """
+    if _record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_record_query)
+
+
+def _record_query(execute, sql, params, many, context):
+    stats = _current.get()
+    if stats is None:
+        return execute(sql, params, many, context)
+    return stats(execute, sql, params, many, context)
+
+
+async def _timed_async_stream(content, done):
+    try:
+        async for chunk in content:
+            yield chunk
+    finally:
+        done()
+
+
+def _timed_stream(content, done):
+    try:
+        yield from content
+    finally:
+        done()
+
+
+class InstrumentationMiddleware:
+    """Records per-view latency, queries and external call time into ``registry``.
+
+    Runs in the mode of the chain below it, so async views and the event
+    stream aren't moved to a thread. Removes itself from the chain when
+    BANK_INSTRUMENTATION_ENABLED is off.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not instrumentation_enabled():
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.sample_rate = getattr(settings, 'BANK_INSTRUMENTATION_ALLOC_SAMPLE_RATE', 0)
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def _start(self):
+        stats = RequestStats()
+        sampled = self.sample_rate and random.random() < self.sample_rate and not tracemalloc.is_tracing()
+        if sampled:
+            tracemalloc.start()
+        return stats, _current.set(stats), sampled
+
+    def _stop(self, stats, token, sampled):
+        if sampled:
+            stats.peak_alloc = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+        _current.reset(token)
+
+    def _record(self, request, response, stats, started):
+        match = getattr(request, 'resolver_match', None)
+        view = match.view_name if match else 'unresolved'
+        if not response.streaming or getattr(response, 'file_to_stream', None) is not None:
+            registry.record(view, stats, time.perf_counter() - started)
+            return response
+        # A stream's view returns before its body is produced; time it until the last chunk
+        def done():
+            registry.record(view, stats, time.perf_counter() - started)
+
+        wrap = _timed_async_stream if response.is_async else _timed_stream
+        response.streaming_content = wrap(response.streaming_content, done)
+        return response
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        stats, token, sampled = self._start()
+        started = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            self._stop(stats, token, sampled)
+        return self._record(request, response, stats, started)
+
+    async def __acall__(self, request):
+        stats, token, sampled = self._start()
+        started = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            self._stop(stats, token, sampled)
+        return self._record(request, response, stats, started)
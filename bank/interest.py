@@ -0,0 +1,95 @@
+"""Daily interest accrual and its posting (``manage.py accrue_interest``).
+
+Accrual is one UPDATE per chunk of accounts: each account's
+``accrued_interest`` grows by its end-of-day balance times its annual rate over
+BANK_INTEREST_DAY_COUNT, to eight places, and ``interest_accrued_through``
+moves to the day, so running a day twice accrues it once. Posting credits the
+whole cents accrued as ``interest`` ledger entries and carries the rest over.
+"""
+from datetime import timedelta
+from decimal import ROUND_DOWN, Decimal
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import DecimalField, ExpressionWrapper, F, Max, Min, OuterRef, Q, Subquery, Value
+from django.db.models.functions import Coalesce
+
+from . import eod, ledger
+from .ledger import CENT
+from .models import Account, DailyBalance, Transaction
+from .utils import batched
+
+
+class DayNotClosed(Exception):
+    pass
+
+
+def accrue(day, chunk_size=10000):
+    """Accrue ``day``'s interest on every account with a rate; returns how many were accrued."""
+    last = eod.last_closed()
+    if last is None or last < day:
+        raise DayNotClosed(f'{day} is not closed yet; run close_days first')
+    closing = DailyBalance.objects.filter(account=OuterRef('pk'), date__lte=day).order_by('-date').values('balance')
+    accrual = ExpressionWrapper(
+        Coalesce(Subquery(closing[:1]), Value(Decimal(0))) * F('interest_rate')
+        / Value(Decimal(getattr(settings, 'BANK_INTEREST_DAY_COUNT', 365))),
+        output_field=DecimalField(max_digits=16, decimal_places=8),
+    )
+    due = Account.objects.filter(Q(interest_accrued_through__isnull=True) | Q(interest_accrued_through__lt=day),
+                                 interest_rate__gt=0)
+    bounds = due.aggregate(first=Min('pk'), last=Max('pk'))
+    if bounds['first'] is None:
+        return 0
+    accrued = 0
+    # Each chunk commits on its own; a rerun after a crash skips the chunks already done
+    for start in range(bounds['first'], bounds['last'] + 1, chunk_size):
+        accrued += due.filter(pk__gte=start, pk__lt=start + chunk_size).update(
+            accrued_interest=F('accrued_interest') + accrual, interest_accrued_through=day)
+    return accrued
+
+
+def accrue_through(day, chunk_size=10000):
+    """Accrue every day up to ``day`` that some account hasn't accrued yet; returns ``{day: accounts}``."""
+    earliest = Account.objects.filter(interest_rate__gt=0).aggregate(
+        earliest=Min('interest_accrued_through'))['earliest']
+    current = earliest + timedelta(days=1) if earliest else day
+    accrued = {}
+    while current <= day:
+        accrued[current] = accrue(current, chunk_size)
+        current += timedelta(days=1)
+    return accrued
+
+
+def _post_chunk(account_ids):
+    with transaction.atomic():
+        accounts = list(Account.objects.select_for_update().filter(pk__in=account_ids, accrued_interest__gte=CENT)
+                        .order_by('pk').only('pk', 'user_id', 'account_number', 'balance', 'accrued_interest'))
+        amounts = {account.pk: account.accrued_interest.quantize(CENT, rounding=ROUND_DOWN) for account in accounts}
+        if not accounts:
+            return 0, Decimal(0)
+        with connection.cursor() as cursor:
+            cursor.executemany(f'UPDATE {connection.ops.quote_name(Account._meta.db_table)} '
+                               f'SET balance = balance + %s, accrued_interest = accrued_interest - %s WHERE id = %s',
+                               [(amounts[pk], amounts[pk], pk) for pk in amounts])
+        rows = Transaction.objects.bulk_create([
+            Transaction(user_id=account.user_id, account_id=account.pk, transaction_type='deposit',
+                        amount=amounts[account.pk], memo='Interest')
+            for account in accounts
+        ])
+        postings = []
+        for row in rows:
+            postings += ledger.external_legs(row, row.amount, 'interest')
+        ledger.record(postings, [(row, None) for row in rows],
+                      [(account, account.balance + row.amount, row) for account, row in zip(accounts, rows)])
+    return len(rows), sum(amounts.values())
+
+
+def post(chunk_size=1000):
+    """Credit every account's whole cents of accrued interest; returns ``(accounts, total)``."""
+    due = list(Account.objects.filter(accrued_interest__gte=CENT).order_by('pk').values_list('pk', flat=True))
+    posted, total = 0, Decimal(0)
+    for chunk in batched(due, chunk_size):
+        accounts, amount = _post_chunk(chunk)
+        posted += accounts
+        total += amount
+    return posted, total
@@ -0,0 +1,161 @@
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal
+
+from django.db import connection, transaction
+from django.db.models import DecimalField, Max, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+
+from . import events, fragments, search
+from .models import Account, BalanceSnapshot, Posting
+from .rollups import record_transactions
+from .utils import batched
+
+
+CENT = Decimal('0.01')
+
+
+class UnbalancedEntry(Exception):
+    pass
+
+
+def post(legs):
+    """Write the legs of one journal entry; they must sum to zero."""
+    if sum(leg.amount for leg in legs) != 0:
+        raise UnbalancedEntry(f'Journal legs sum to {sum(leg.amount for leg in legs)}')
+    return Posting.objects.bulk_create(legs)
+
+
+def record(legs, entries, balances=()):
+    """Post ``legs`` and bring every store derived from the ledger up to date.
+
+    ``entries`` are the ``(transaction, counterparty account or None)`` pairs
+    just written, as ``search.index`` takes them; ``balances`` are ``(account,
+    new balance[, row])`` tuples published as balance events. Must run inside
+    the transaction that wrote the rows.
+    """
+    entries = list(entries)
+    rows = [row for row, _ in entries]
+    post(legs)
+    record_transactions(rows)
+    search.index(entries)
+    fragments.touch(row.user_id for row in rows)
+    for account, balance, *row in balances:
+        events.balance_changed(account, balance, *row)
+
+
+def transfer_legs(source_row, destination_row, amount):
+    journal = uuid.uuid4()
+    return [
+        Posting(journal=journal, account_id=source_row.account_id, transaction=source_row, amount=-amount),
+        Posting(journal=journal, account_id=destination_row.account_id, transaction=destination_row, amount=amount),
+    ]
+
+
+def external_legs(row, amount, external_ledger='cash'):
+    """Legs for money entering (positive ``amount``) or leaving the bank."""
+    journal = uuid.uuid4()
+    return [
+        Posting(journal=journal, account_id=row.account_id, transaction=row, amount=amount),
+        Posting(journal=journal, external_ledger=external_ledger, transaction=row, amount=-amount),
+    ]
+
+
+def post_opening_balance(account):
+    """Book an account's current balance as an opening entry, e.g. for accounts created by hand."""
+    journal = uuid.uuid4()
+    return post([
+        Posting(journal=journal, account_id=account.pk, amount=account.balance),
+        Posting(journal=journal, external_ledger='opening', amount=-account.balance),
+    ])
+
+
+def _money(expression):
+    return Coalesce(expression, Value(Decimal(0)), output_field=DecimalField(max_digits=14, decimal_places=2))
+
+
+def ledger_balances(account_ids):
+    """``{account_id: (ledger_balance, cached_balance)}`` computed in one query.
+
+    Each balance is the account's latest snapshot plus the postings made
+    after it, so only the short tail is summed.
+    """
+    latest = BalanceSnapshot.objects.filter(account=OuterRef('pk')).order_by('-posting_id')
+    tail = (Posting.objects
+            .filter(account=OuterRef('pk'), id__gt=Coalesce(OuterRef('snapshot_posting'), Value(0)))
+            .order_by()
+            .values('account')
+            .annotate(total=Sum('amount'))
+            .values('total'))
+    rows = (Account.objects
+            .filter(pk__in=account_ids)
+            .annotate(snapshot_posting=Subquery(latest.values('posting_id')[:1]),
+                      snapshot_balance=_money(Subquery(latest.values('balance')[:1])),
+                      tail=_money(Subquery(tail)))
+            .values_list('pk', 'snapshot_balance', 'tail', 'balance'))
+    # SQLite sums decimals as floats; round back to cents before comparing or snapshotting
+    return {pk: ((snapshot + tail).quantize(CENT), balance) for pk, snapshot, tail, balance in rows}
+
+
+def balance(account):
+    return ledger_balances([account.pk])[account.pk][0]
+
+
+def take_snapshots(account_ids=None, chunk_size=1000):
+    """Snapshot ledger balances so later reads only sum postings after them.
+
+    Accounts are locked while their snapshot is taken so no posting can
+    commit below the recorded ``posting_id`` afterwards.
+    """
+    account_ids = account_ids if account_ids is not None else Account.objects.order_by('pk').values_list('pk', flat=True).iterator()
+    taken = 0
+    for chunk in batched(account_ids, chunk_size):
+        with transaction.atomic():
+            list(Account.objects.select_for_update().filter(pk__in=chunk).order_by('pk').values_list('pk'))
+            last_posting = dict(Posting.objects.filter(account_id__in=chunk).order_by()
+                                .values('account').annotate(last=Max('id')).values_list('account', 'last'))
+            snapshotted = dict(BalanceSnapshot.objects.filter(account_id__in=chunk).order_by()
+                               .values('account').annotate(last=Max('posting_id')).values_list('account', 'last'))
+            # Skip accounts with no postings since their last snapshot
+            stale = [pk for pk, posting_id in last_posting.items() if snapshotted.get(pk) != posting_id]
+            balances = ledger_balances(stale)
+            BalanceSnapshot.objects.bulk_create([
+                BalanceSnapshot(account_id=pk, posting_id=last_posting[pk], balance=balances[pk][0]) for pk in stale
+            ])
+        taken += len(stale)
+    return taken
+
+
+def _mismatches(chunk):
+    return [(pk, ledger, cached) for pk, (ledger, cached) in ledger_balances(chunk).items() if ledger != cached]
+
+
+def _mismatches_in_thread(chunk):
+    try:
+        return _mismatches(chunk)
+    finally:
+        # Pool threads each open their own connection; don't leak it
+        connection.close()
+
+
+def reconcile(chunk_size=1000, workers=4):
+    """Yield ``(account_id, ledger_balance, cached_balance)`` for every account that disagrees.
+
+    Account ids are streamed in chunks and at most ``workers * 2`` chunks
+    are in flight, so memory stays bounded however many postings exist.
+    """
+    account_ids = Account.objects.order_by('pk').values_list('pk', flat=True).iterator(chunk_size=chunk_size)
+    chunks = batched(account_ids, chunk_size)
+    if workers <= 1:
+        for chunk in chunks:
+            yield from _mismatches(chunk)
+        return
+
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='reconcile') as pool:
+        in_flight = []
+        for chunk in chunks:
+            in_flight.append(pool.submit(_mismatches_in_thread, chunk))
+            if len(in_flight) >= workers * 2:
+                yield from in_flight.pop(0).result()
+        for future in in_flight:
+            yield from future.result()
@@ -0,0 +1,91 @@
+from datetime import datetime, time, timedelta
+from decimal import Decimal
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import DailyUsage
+
+
+class LimitExceeded(Exception):
+    pass
+
+
+def fast_path_enabled():
+    return getattr(settings, 'BANK_LIMITS_CACHE_FASTPATH', False)
+
+
+def _cache_key(account_id, day):
+    return f'bank:limits:{account_id}:{day.isoformat()}'
+
+
+def _seconds_until_tomorrow():
+    now = timezone.localtime()
+    midnight = timezone.make_aware(datetime.combine(now.date() + timedelta(days=1), time.min))
+    return max(1, int((midnight - now).total_seconds()))
+
+
+def _over_limit(account, count, total, amount):
+    return count >= account.max_transaction_count or total + amount > account.daily_transaction_limit
+
+
+def precheck(account, amount):
+    """Reject obviously over-limit requests from the cache without a query.
+
+    Usage only grows during a day, so a cached snapshot can only under-count;
+    anything it rejects would also be rejected by :func:`consume`.
+    """
+    if not fast_path_enabled():
+        return
+    usage = cache.get(_cache_key(account.pk, timezone.localdate()))
+    if usage is not None and _over_limit(account, usage[0], usage[1], Decimal(str(amount))):
+        raise LimitExceeded('Transaction limit exceeded. Please contact admin.')
+
+
+async def aprecheck(account, amount):
+    if not fast_path_enabled():
+        return
+    usage = await cache.aget(_cache_key(account.pk, timezone.localdate()))
+    if usage is not None and _over_limit(account, usage[0], usage[1], Decimal(str(amount))):
+        raise LimitExceeded('Transaction limit exceeded. Please contact admin.')
+
+
+def consume(account, amount):
+    """Count one transaction of ``amount`` against today's limits or raise ``LimitExceeded``.
+
+    Call inside the transaction that moves the money; the check and the
+    increment are a single conditional UPDATE.
+    """
+    today = timezone.localdate()
+    DailyUsage.objects.bulk_create([DailyUsage(account_id=account.pk, date=today)], ignore_conflicts=True)
+    updated = (DailyUsage.objects
+               .filter(account_id=account.pk, date=today,
+                       count__lt=account.max_transaction_count,
+                       total__lte=account.daily_transaction_limit - amount)
+               .update(count=F('count') + 1, total=F('total') + amount))
+    if not fast_path_enabled():
+        if not updated:
+            raise LimitExceeded('Transaction limit exceeded. Please contact admin.')
+        return
+
+    usage = DailyUsage.objects.filter(account_id=account.pk, date=today).values_list('count', 'total').get()
+    key = _cache_key(account.pk, today)
+    if not updated:
+        cache.set(key, usage, _seconds_until_tomorrow())
+        raise LimitExceeded('Transaction limit exceeded. Please contact admin.')
+    transaction.on_commit(lambda: cache.set(key, usage, _seconds_until_tomorrow()))
+
+
+def usage_today(account):
+    usage = DailyUsage.objects.filter(account_id=account.pk, date=timezone.localdate()).first()
+    return (usage.count, usage.total) if usage else (0, Decimal(0))
+
+
+def reset(account_ids):
+    """Clear today's usage, e.g. after an admin lifts a block."""
+    today = timezone.localdate()
+    DailyUsage.objects.filter(account_id__in=account_ids, date=today).delete()
+    cache.delete_many([_cache_key(account_id, today) for account_id in account_ids])
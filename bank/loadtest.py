@@ -0,0 +1,172 @@
+"""View-level load tests driven through the Django test client; see ``manage.py bench``."""
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack
+from decimal import Decimal
+
+from django.contrib.auth.models import User
+from django.db import OperationalError, connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.urls import reverse
+
+from . import authorizations, screening
+from .benchmarks import seed_transactions, summarize
+from .models import Account, Notification
+from .rates import FakeRateProvider, RateService, set_rate_service
+from .rollups import rebuild
+from .utils import batched
+
+# The repo ships no page templates; these render the same context so lazy querysets are still evaluated
+TEMPLATES = {
+    'bank/dashboard.html': '{{ account_header }}{{ recent_transactions }}{{ unread_badge }}',
+    'bank/account_summary.html': '{{ account_header }}{{ summary_transactions }}',
+    'transaction_history.html': '{{ form }}{% for t in transactions %}{{ t.amount }}{{ t.user.username }}{% endfor %}',
+    'bank/notifications.html': '{% for n in notifications %}{{ n.message }}{% endfor %}',
+    'bank/transfer.html': '{{ error }}{{ success }}',
+    'bank/generate_otp.html': '{{ form }}{{ error }}',
+    'user_analytics.html': '{{ data }}',
+}
+
+# Every rule still runs, but a benchmark's bursts of transfers must not be held
+SHADOW_SCREENING_RULES = [{**rule, 'action': screening.ALLOW} for rule in screening.DEFAULT_RULES]
+
+SETTINGS = {
+    'ALLOWED_HOSTS': ['testserver'],
+    'BANK_SCREENING_RULES': SHADOW_SCREENING_RULES,
+    'EMAIL_BACKEND': 'django.core.mail.backends.locmem.EmailBackend',
+    'BANK_OTP_MAX_ISSUES': 10 ** 9,
+    'TEMPLATES': [{
+        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        'OPTIONS': {
+            'loaders': [
+                ('django.template.loaders.locmem.Loader', TEMPLATES),
+                'django.template.loaders.app_directories.Loader',
+            ],
+            'context_processors': [
+                'django.template.context_processors.request',
+                'django.contrib.auth.context_processors.auth',
+                'django.contrib.messages.context_processors.messages',
+                'bank.context_processors.unread_notifications',
+            ],
+        },
+    }],
+}
+
+
+def seed(users=10, transactions=100000, notifications=1000, batch_size=10000):
+    """Create ``users`` funded accounts sharing ``transactions`` ledger rows; returns the accounts."""
+    User.objects.bulk_create(User(username=f'bench{i}', email=f'bench{i}@example.com') for i in range(users))
+    user_ids = User.objects.filter(username__startswith='bench').order_by('pk').values_list('pk', flat=True)
+    Account.objects.bulk_create(
+        Account(user_id=pk, balance=Decimal('1000000'), account_number=f'{900000000 + pk}',
+                daily_transaction_limit=Decimal('1000000000'), max_transaction_count=10 ** 9)
+        for pk in user_ids)
+    accounts = list(Account.objects.filter(user_id__in=user_ids).select_related('user').order_by('pk'))
+    for i, account in enumerate(accounts):
+        seed_transactions(account, transactions // users, batch_size=batch_size, seed=i)
+        for batch in batched((Notification(user_id=account.user_id, message=f'You received ${n}')
+                              for n in range(notifications)), batch_size):
+            Notification.objects.bulk_create(batch)
+    rebuild([account.pk for account in accounts])
+    return accounts
+
+
+def _transfer(client, account, payee):
+    amount = Decimal('1.00')
+    while True:
+        try:
+            otp = authorizations.issue(account.user, payee.account_number, amount)
+            break
+        except OperationalError:
+            # Setup isn't timed; just wait out the other writers
+            time.sleep(0.001)
+    return lambda: client.post(reverse('transfer'), {'to_account': payee.account_number, 'amount': amount, 'pin': otp})
+
+
+def _consume(response):
+    if response.streaming:
+        for _ in response.streaming_content:
+            pass
+    return response
+
+
+SCENARIOS = {
+    'dashboard': lambda client, account, payee: lambda: client.get(reverse('dashboard')),
+    'transfer': _transfer,
+    'generate_otp': lambda client, account, payee: lambda: client.post(
+        reverse('generate_otp'), {'to_account': payee.account_number, 'amount': '1.00'}),
+    'notifications': lambda client, account, payee: lambda: client.get(reverse('notifications')),
+    'transaction_history': lambda client, account, payee: lambda: client.get(reverse('transaction_history')),
+    'account_summary': lambda client, account, payee: lambda: client.get(reverse('account_summary')),
+    'account_statement': lambda client, account, payee: lambda: _consume(
+        client.get(reverse('account_statement'), {'format': 'csv'})),
+    'user_analytics': lambda client, account, payee: lambda: client.get(reverse('user_analytics')),
+}
+
+
+def _client(account):
+    client = Client(raise_request_exception=False)
+    client.force_login(account.user)
+    return client
+
+
+def _run(scenario, client, account, payee, requests):
+    """Time ``requests`` calls; returns (latencies, query counts, errors)."""
+    latencies, queries, errors = [], [], 0
+    for _ in range(requests):
+        request = SCENARIOS[scenario](client, account, payee)
+        with CaptureQueriesContext(connection) as captured:
+            started = time.perf_counter()
+            response = request()
+            latencies.append(time.perf_counter() - started)
+        queries.append(len(captured))
+        if response.status_code >= 400:
+            errors += 1
+    return latencies, queries, errors
+
+
+def _run_in_thread(*args):
+    try:
+        return _run(*args)
+    finally:
+        connection.close()
+
+
+def run(accounts, scenarios=None, requests=50, threads=4, log=None):
+    """Drive each scenario sequentially (latency, queries) then from ``threads`` clients at once (throughput)."""
+    results = {}
+    with ExitStack() as stack:
+        stack.enter_context(override_settings(**SETTINGS))
+        set_rate_service(RateService(provider=FakeRateProvider(), ttl=3600))
+        stack.callback(set_rate_service, None)
+        # Failed requests are counted in the results; don't print a traceback for each
+        request_logger = logging.getLogger('django.request')
+        stack.callback(request_logger.setLevel, request_logger.level)
+        request_logger.setLevel(logging.CRITICAL)
+
+        for scenario in scenarios or SCENARIOS:
+            account, payee = accounts[0], accounts[1 % len(accounts)]
+            latencies, queries, errors = _run(scenario, _client(account), account, payee, requests)
+            result = {'sequential': dict(summarize(latencies), errors=errors,
+                                         queries_mean=sum(queries) / len(queries), queries_max=max(queries))}
+
+            if threads > 1:
+                clients = [(_client(accounts[i % len(accounts)]), accounts[i % len(accounts)],
+                            accounts[(i + 1) % len(accounts)]) for i in range(threads)]
+                started = time.perf_counter()
+                with ThreadPoolExecutor(max_workers=threads, thread_name_prefix='bench') as pool:
+                    futures = [pool.submit(_run_in_thread, scenario, client, account, payee, requests)
+                               for client, account, payee in clients]
+                    outcomes = [future.result() for future in futures]
+                elapsed = time.perf_counter() - started
+                latencies = [sample for outcome in outcomes for sample in outcome[0]]
+                result['concurrent'] = dict(summarize(latencies), threads=threads,
+                                            errors=sum(outcome[2] for outcome in outcomes),
+                                            throughput_rps=len(latencies) / elapsed)
+            results[scenario] = result
+            if log:
+                log(scenario, result)
+    return results
+
@@ -0,0 +1,68 @@
+"""Login throughput controls for ``CustomLoginView``: pooled password checks and cache-backed throttling."""
+import hashlib
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.backends import ModelBackend
+from django.core.cache import caches
+
+from .passwords import check_password, make_password
+
+
+class LoginThrottled(Exception):
+    pass
+
+
+class PooledHashBackend(ModelBackend):
+    """``ModelBackend`` with the password check (and any rehash) done by ``bank.passwords``."""
+
+    def authenticate(self, request, username=None, password=None, **kwargs):
+        User = get_user_model()
+        if username is None:
+            username = kwargs.get(User.USERNAME_FIELD)
+        if username is None or password is None:
+            return None
+        try:
+            user = User._default_manager.get_by_natural_key(username)
+        except User.DoesNotExist:
+            # Hash anyway, so response times don't reveal which usernames exist
+            make_password(password)
+            return None
+        if check_password(user, password) and self.user_can_authenticate(user):
+            return user
+        return None
+
+
+def _cache():
+    return caches[getattr(settings, 'BANK_LOGIN_CACHE', 'default')]
+
+
+def _counters(request, username):
+    user_key = hashlib.sha256(username.lower().encode()).hexdigest()
+    return [
+        (f'bank:login:user:{user_key}', getattr(settings, 'BANK_LOGIN_MAX_FAILURES_PER_USER', 5)),
+        (f'bank:login:ip:{request.META.get("REMOTE_ADDR", "")}', getattr(settings, 'BANK_LOGIN_MAX_FAILURES_PER_IP', 50)),
+    ]
+
+
+def check_throttle(request, username):
+    """Raise ``LoginThrottled`` before any hashing when the username or client has failed too often."""
+    failures = _cache().get_many([key for key, _ in _counters(request, username)])
+    for key, limit in _counters(request, username):
+        if failures.get(key, 0) >= limit:
+            raise LoginThrottled('Too many failed login attempts. Please try again later.')
+
+
+def record_failure(request, username):
+    cache, window = _cache(), getattr(settings, 'BANK_LOGIN_WINDOW', 900)
+    for key, _ in _counters(request, username):
+        # The window starts at the first failure
+        cache.add(key, 0, window)
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.set(key, 1, window)
+
+
+def clear_failures(request, username):
+    _cache().delete(_counters(request, username)[0][0])
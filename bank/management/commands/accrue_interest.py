@@ -0,0 +1,28 @@
+from datetime import date, timedelta
+
+from django.core.management.base import BaseCommand
+
+from bank import eod, interest
+
+
+class Command(BaseCommand):
+    help = 'Close finished days, accrue interest on them and post it at month end. Run nightly.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--through', type=date.fromisoformat, help='Last day to accrue (YYYY-MM-DD).')
+        parser.add_argument('--chunk-size', type=int, default=10000, help='Accounts accrued per UPDATE.')
+        parser.add_argument('--post', action='store_true', help='Post accrued interest even before month end.')
+
+    def handle(self, *args, **options):
+        eod.close_days(options['through'])
+        through = eod.last_closed()
+        if options['through']:
+            through = min(through, options['through']) if through else None
+        if through is None:
+            self.stdout.write('Nothing closed yet')
+            return
+        for day, accounts in interest.accrue_through(through, options['chunk_size']).items():
+            self.stdout.write(f'Accrued {day} on {accounts} accounts')
+        if options['post'] or (through + timedelta(days=1)).day == 1:
+            accounts, total = interest.post()
+            self.stdout.write(f'Posted ${total} of interest to {accounts} accounts')
@@ -0,0 +1,31 @@
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+
+from bank.batches import create_and_run, parse_items, resume_batch
+from bank.models import Account, TransferBatch
+from bank.transfers import TransferError
+
+
+class Command(BaseCommand):
+    help = 'Pay a CSV or JSON list of (to_account, amount, currency) from one account.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('from_account', help='Account number to debit.')
+        parser.add_argument('file', help='CSV with to_account,amount,currency columns, or a .json list.')
+        parser.add_argument('--chunk-size', type=int, default=500, help='Transfers committed per transaction.')
+        parser.add_argument('--resume', type=int, metavar='BATCH_ID', help='Resume a failed batch with the same file.')
+
+    def handle(self, *args, **options):
+        path = Path(options['file'])
+        try:
+            from_account = Account.objects.select_related('user').get(account_number=options['from_account'])
+            items = parse_items(path.read_text(encoding='utf-8'), 'json' if path.suffix == '.json' else 'csv')
+            if options['resume']:
+                batch = TransferBatch.objects.get(pk=options['resume'], from_account=from_account)
+                batch = resume_batch(batch, items, chunk_size=options['chunk_size'])
+            else:
+                batch = create_and_run(from_account, items, chunk_size=options['chunk_size'])
+        except (Account.DoesNotExist, TransferBatch.DoesNotExist, OSError, UnicodeDecodeError, TransferError) as e:
+            raise CommandError(str(e))
+        self.stdout.write(f'Batch {batch.pk}: paid {batch.processed_items} recipients, total {batch.total_amount}')
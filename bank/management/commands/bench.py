@@ -0,0 +1,53 @@
+import json
+import time
+
+import django
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from bank import loadtest
+from bank.benchmarks import benchmark_database, format_summary
+
+
+class Command(BaseCommand):
+    help = 'Seed a throwaway database and load-test every bank view, writing the results as JSON.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=20)
+        parser.add_argument('--transactions', type=int, default=1000000, help='Total ledger rows across all accounts.')
+        parser.add_argument('--notifications', type=int, default=1000, help='Unread notifications per user.')
+        parser.add_argument('--requests', type=int, default=50, help='Requests per scenario per client.')
+        parser.add_argument('--threads', type=int, default=4, help='Concurrent clients; 1 skips the concurrent pass.')
+        parser.add_argument('--scenario', action='append', choices=sorted(loadtest.SCENARIOS),
+                            help='Run only these scenarios (repeatable).')
+        parser.add_argument('--output', default='bench-results.json')
+
+    def log(self, scenario, result):
+        self.stdout.write(format_summary(f'{scenario} (sequential)', result['sequential'])
+                          + f" queries={result['sequential']['queries_mean']:.1f}")
+        if 'concurrent' in result:
+            concurrent = result['concurrent']
+            self.stdout.write(format_summary(f'{scenario} (x{concurrent["threads"]})', concurrent)
+                              + f" {concurrent['throughput_rps']:.0f} req/s errors={concurrent['errors']}")
+
+    def handle(self, *args, **options):
+        if options['users'] < 2:
+            raise CommandError('--users must be at least 2 so transfers have a payee')
+        with benchmark_database(on_disk=True):
+            self.stdout.write(f"Seeding {options['users']} users and {options['transactions']} transactions...")
+            accounts = loadtest.seed(options['users'], options['transactions'], options['notifications'])
+            with connection.cursor() as cursor:
+                cursor.execute('ANALYZE')
+            results = loadtest.run(accounts, scenarios=options['scenario'], requests=options['requests'],
+                                   threads=options['threads'], log=self.log)
+
+        report = {
+            'created_at': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+            'django': django.get_version(),
+            'database': connection.vendor,
+            'options': {key: options[key] for key in ('users', 'transactions', 'notifications', 'requests', 'threads')},
+            'views': results,
+        }
+        with open(options['output'], 'w') as f:
+            json.dump(report, f, indent=2, sort_keys=True)
+        self.stdout.write(f"Wrote {options['output']}")
@@ -0,0 +1,56 @@
+from django.contrib import admin
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test import RequestFactory
+from django.test.utils import CaptureQueriesContext
+
+from bank.benchmarks import benchmark_database, format_summary, seed_transactions, summarize, timed
+from bank.models import Account, Transaction
+
+
+class Command(BaseCommand):
+    help = 'Benchmark the Transaction admin changelist against a throwaway database.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=1000000)
+        parser.add_argument('--accounts', type=int, default=10)
+        parser.add_argument('--repeat', type=int, default=20)
+
+    def handle(self, *args, **options):
+        rows, repeat = options['rows'], options['repeat']
+        with benchmark_database():
+            superuser = User.objects.create_superuser('bench', 'bench@example.com', 'bench')
+            self.stdout.write(f'Seeding {rows} transactions...')
+            for i in range(options['accounts']):
+                user = User.objects.create(username=f'bench{i}')
+                account = Account.objects.create(user=user, balance=0, account_number=str(900000 + i))
+                seed_transactions(account, rows // options['accounts'], seed=i)
+            with connection.cursor() as cursor:
+                cursor.execute('ANALYZE')
+
+            day = Transaction.objects.order_by('-date').values_list('date', flat=True)[rows // 2]
+            pages = {
+                'unfiltered': {},
+                'type filter': {'transaction_type__exact': 'deposit'},
+                'month drill-down': {'date__year': day.year, 'date__month': day.month},
+                'account search': {'q': '900003'},
+            }
+            admins = {
+                'default ModelAdmin': admin.ModelAdmin(Transaction, admin.site),
+                'TransactionAdmin': admin.site._registry[Transaction],
+            }
+            factory = RequestFactory()
+            for name, params in pages.items():
+                for label, model_admin in admins.items():
+                    def render():
+                        request = factory.get('/admin/bank/transaction/', params)
+                        request.user = superuser
+                        return model_admin.changelist_view(request).render()
+
+                    connection.queries_log.clear()  # Seeding filled the log past its cap
+                    with CaptureQueriesContext(connection) as queries:
+                        render()
+                    samples = timed(render, repeat=repeat)
+                    self.stdout.write(format_summary(f'{name}: {label}', summarize(samples))
+                                      + f' queries={len(queries)}')
@@ -0,0 +1,39 @@
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db.models import Count, Sum
+from django.db.models.functions import TruncMonth
+
+from bank.benchmarks import benchmark_database, format_summary, seed_transactions, summarize, timed
+from bank.models import Account, Transaction
+from bank.rollups import monthly_summary, rebuild
+
+
+class Command(BaseCommand):
+    help = 'Benchmark rollup-backed analytics against on-the-fly aggregation.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', default='10000,100000,1000000', help='Comma separated transactions per account.')
+        parser.add_argument('--repeat', type=int, default=20)
+
+    def handle(self, *args, **options):
+        sizes = [int(size) for size in options['sizes'].split(',')]
+        with benchmark_database():
+            for size in sizes:
+                user = User.objects.create(username=f'bench{size}')
+                account = Account.objects.create(user=user, balance=0, account_number=str(900000 + size))
+                self.stdout.write(f'Seeding {size} transactions...')
+                seed_transactions(account, size)
+                rebuild(accounts=[account.pk])
+
+                def on_the_fly():
+                    return list(Transaction.objects
+                                .filter(account__user=user)
+                                .annotate(month=TruncMonth('date'))
+                                .values('month', 'transaction_type')
+                                .annotate(count=Count('id'), total=Sum('amount'))
+                                .order_by())
+
+                self.stdout.write(format_summary(f'{size} rows: rollups', summarize(
+                    timed(lambda: monthly_summary(user), repeat=options['repeat']))))
+                self.stdout.write(format_summary(f'{size} rows: aggregate', summarize(
+                    timed(on_the_fly, repeat=options['repeat']))))
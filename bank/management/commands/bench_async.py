@@ -0,0 +1,108 @@
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal
+
+from asgiref.sync import sync_to_async
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test import AsyncClient, Client
+from django.test.utils import override_settings
+from django.urls import reverse
+
+from bank import authorizations, loadtest
+from bank.benchmarks import benchmark_database, format_summary, summarize
+from bank.rates import FakeRateProvider, RateService, set_rate_service
+
+
+class UpstreamEveryRequest(RateService):
+    """Skips the rate cache so every transfer waits on the (stubbed) FX API."""
+
+    def get_rates(self, base_currency):
+        return self._fetch(base_currency)
+
+    async def aget_rates(self, base_currency):
+        return await self._afetch(base_currency)
+
+
+class Command(BaseCommand):
+    help = 'Compare sync WSGI against async ASGI throughput for dashboard and transfer with stubbed upstreams.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=400, help='Requests per scenario per mode.')
+        parser.add_argument('--threads', type=int, default=8, help='WSGI worker threads.')
+        parser.add_argument('--concurrency', type=int, default=64, help='In-flight ASGI requests on one event loop.')
+        parser.add_argument('--fx-latency', type=float, default=0.05, help='Seconds the stubbed FX API takes.')
+        parser.add_argument('--users', type=int, default=64)
+
+    def payee(self, account):
+        return self.accounts[(self.accounts.index(account) + 1) % len(self.accounts)]
+
+    def sync_request(self, scenario, client, account):
+        if scenario == 'dashboard':
+            return client.get(reverse('dashboard'))
+        payee = self.payee(account)
+        otp = authorizations.issue(account.user, payee.account_number, Decimal('1.00'))
+        return client.post(reverse('transfer'), {'to_account': payee.account_number, 'amount': '1.00', 'currency': 'EUR', 'pin': otp})
+
+    async def async_request(self, scenario, client, account):
+        if scenario == 'dashboard':
+            return await client.get(reverse('async_dashboard'))
+        payee = self.payee(account)
+        otp = await sync_to_async(authorizations.issue)(account.user, payee.account_number, Decimal('1.00'))
+        return await client.post(reverse('async_transfer'),
+                                 {'to_account': payee.account_number, 'amount': '1.00', 'currency': 'EUR', 'pin': otp})
+
+    def wsgi(self, scenario, requests, threads):
+        def worker(i):
+            account = self.accounts[i % len(self.accounts)]
+            client = Client(raise_request_exception=False)
+            client.force_login(account.user)
+            samples, errors = [], 0
+            try:
+                for _ in range(requests // threads):
+                    started = time.perf_counter()
+                    errors += self.sync_request(scenario, client, account).status_code >= 400
+                    samples.append(time.perf_counter() - started)
+            finally:
+                connection.close()
+            return samples, errors
+
+        with ThreadPoolExecutor(max_workers=threads) as pool:
+            return list(pool.map(worker, range(threads)))
+
+    async def asgi(self, scenario, requests, concurrency):
+        async def worker(i):
+            account = self.accounts[i % len(self.accounts)]
+            client = AsyncClient(raise_request_exception=False)
+            await client.aforce_login(account.user)
+            samples, errors = [], 0
+            for _ in range(requests // concurrency):
+                started = time.perf_counter()
+                errors += (await self.async_request(scenario, client, account)).status_code >= 400
+                samples.append(time.perf_counter() - started)
+            return samples, errors
+
+        return await asyncio.gather(*(worker(i) for i in range(concurrency)))
+
+    def report(self, label, outcomes, elapsed):
+        samples = [sample for outcome, _ in outcomes for sample in outcome]
+        errors = sum(failed for _, failed in outcomes)
+        self.stdout.write(format_summary(label, summarize(samples)) + f' {len(samples) / elapsed:.0f} req/s errors={errors}')
+
+    def handle(self, *args, **options):
+        requests = options['requests']
+        with benchmark_database(on_disk=True), override_settings(**loadtest.SETTINGS):
+            self.accounts = loadtest.seed(options['users'], options['users'] * 100, 100)
+            set_rate_service(UpstreamEveryRequest(provider=FakeRateProvider(latency=options['fx_latency']), ttl=0))
+            try:
+                for scenario in ('dashboard', 'transfer'):
+                    started = time.perf_counter()
+                    outcomes = self.wsgi(scenario, requests, options['threads'])
+                    self.report(f"{scenario} WSGI x{options['threads']} threads", outcomes, time.perf_counter() - started)
+
+                    started = time.perf_counter()
+                    outcomes = asyncio.run(self.asgi(scenario, requests, options['concurrency']))
+                    self.report(f"{scenario} ASGI x{options['concurrency']} tasks", outcomes, time.perf_counter() - started)
+            finally:
+                set_rate_service(None)
@@ -0,0 +1,38 @@
+import time
+from decimal import Decimal
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+
+from bank.batches import create_and_run
+from bank.benchmarks import benchmark_database
+from bank.models import Account
+from bank.rates import FakeRateProvider, RateService, set_rate_service
+
+
+class Command(BaseCommand):
+    help = 'Benchmark a payroll-sized batch transfer against a throwaway database.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=10000)
+        parser.add_argument('--chunk-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        rows = options['rows']
+        set_rate_service(RateService(provider=FakeRateProvider()))
+        with benchmark_database():
+            users = User.objects.bulk_create([User(username=f'payee{i}') for i in range(rows + 1)])
+            payer = Account.objects.create(user=users[0], balance=Decimal(rows) * 1000, account_number='800000')
+            payees = Account.objects.bulk_create([
+                Account(user=user, balance=0, account_number=str(800001 + i)) for i, user in enumerate(users[1:])
+            ])
+            currencies = ['USD', 'EUR', 'GBP']
+            items = [{'to_account': payee.account_number, 'amount': Decimal('125.50'), 'currency': currencies[i % 3]}
+                     for i, payee in enumerate(payees)]
+
+            started = time.perf_counter()
+            batch = create_and_run(payer, items, chunk_size=options['chunk_size'])
+            elapsed = time.perf_counter() - started
+            self.stdout.write(f'{batch.processed_items} transfers in {elapsed:.2f}s '
+                              f'({batch.processed_items / elapsed:,.0f} transfers/s, chunk size {options["chunk_size"]})')
+        set_rate_service(None)
@@ -0,0 +1,64 @@
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import OperationalError, connection
+from django.test.utils import override_settings
+
+from bank.benchmarks import benchmark_database, format_summary, summarize
+from bank.loadtest import SHADOW_SCREENING_RULES
+from bank.models import Account
+from bank.transfers import transfer_funds
+
+
+class Command(BaseCommand):
+    help = 'Compare parallel transfers on stock SQLite against the WAL/IMMEDIATE tuned profile.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=8)
+        parser.add_argument('--transfers', type=int, default=200, help='Transfers per thread.')
+        parser.add_argument('--accounts', type=int, default=100)
+
+    def worker(self, accounts, transfers, seed):
+        rng = random.Random(seed)
+        samples, failures = [], 0
+        try:
+            for _ in range(transfers):
+                source, destination = rng.sample(accounts, 2)
+                started = time.perf_counter()
+                try:
+                    transfer_funds(source, destination, Decimal('1.00'))
+                except OperationalError:
+                    # "database is locked": the request would have failed
+                    failures += 1
+                    continue
+                samples.append(time.perf_counter() - started)
+        finally:
+            connection.close()
+        return samples, failures
+
+    def run(self, label, tuned, options):
+        with override_settings(BANK_SQLITE_TUNING=tuned, BANK_SCREENING_RULES=SHADOW_SCREENING_RULES), benchmark_database(on_disk=True):
+            users = User.objects.bulk_create(User(username=f'bench{i}') for i in range(options['accounts']))
+            accounts = Account.objects.bulk_create(
+                Account(user=user, balance=Decimal('1000000'), account_number=str(700000 + i),
+                        daily_transaction_limit=Decimal('1000000000'), max_transaction_count=10 ** 9)
+                for i, user in enumerate(users))
+            started = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=options['threads']) as pool:
+                outcomes = list(pool.map(lambda seed: self.worker(accounts, options['transfers'], seed),
+                                         range(options['threads'])))
+            elapsed = time.perf_counter() - started
+        samples = [sample for outcome, _ in outcomes for sample in outcome]
+        failures = sum(failed for _, failed in outcomes)
+        self.stdout.write(format_summary(label, summarize(samples))
+                          + f' {len(samples) / elapsed:.0f} transfers/s failed={failures}')
+
+    def handle(self, *args, **options):
+        connection.close()
+        self.run('stock sqlite', False, options)
+        connection.close()
+        self.run('tuned sqlite (WAL, IMMEDIATE)', True, options)
@@ -0,0 +1,125 @@
+import random
+import time
+import uuid
+from datetime import timedelta
+from decimal import Decimal
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import reset_queries, transaction
+from django.db.models import F, Sum
+from django.test.utils import override_settings
+from django.utils import timezone
+
+from bank import eod, interest
+from bank.benchmarks import benchmark_database, format_summary, summarize, timed
+from bank.datasets import fast_load
+from bank.models import Account, Posting
+from bank.utils import batched
+
+
+class Command(BaseCommand):
+    help = 'Close days, query point-in-time balances and accrue interest over a large set of accounts.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--accounts', type=int, default=1000000)
+        parser.add_argument('--accounts-per-user', type=int, default=1000)
+        parser.add_argument('--active', type=float, default=0.1, help='Fraction of accounts moving each day.')
+        parser.add_argument('--lookups', type=int, default=2000)
+        parser.add_argument('--hot', type=int, default=100, help='Accounts given a long posting history.')
+        parser.add_argument('--history', type=int, default=2000, help='Postings on each hot account.')
+        parser.add_argument('--post', action='store_true', help='Also post the accrued interest (slow: a ledger '
+                                                                 'entry per account).')
+
+    def handle(self, *args, **options):
+        with benchmark_database(on_disk=True), override_settings(BANK_EOD_GRACE=0):
+            today = timezone.localdate()
+            started = time.perf_counter()
+            with fast_load():
+                pks = self.seed(options, today)
+            self.stdout.write(f'Seeded {len(pks):,} accounts and {Posting.objects.count():,} postings '
+                              f'in {time.perf_counter() - started:.1f}s')
+
+            started = time.perf_counter()
+            closed = eod.close_days()
+            elapsed = time.perf_counter() - started
+            self.stdout.write(f'close_days: {len(closed)} days, {sum(closed.values()):,} end-of-day rows '
+                              f'in {elapsed:.1f}s ({sum(closed.values()) / elapsed:,.0f} rows/s)')
+
+            rng = random.Random(0)
+            yesterday = today - timedelta(days=1)
+            end = eod.day_bounds(yesterday)[1]
+            for name, population in (('', pks), (' hot', pks[:options['hot']])):
+                sample = [rng.choice(population) for _ in range(options['lookups'])]
+                for label, day in (('as_of closed day', yesterday), ('as_of today (tail)', today)):
+                    accounts = iter(sample)
+                    samples = timed(lambda: eod.as_of([next(accounts)], day), repeat=len(sample))
+                    self.stdout.write(format_summary(label + name, summarize(samples)))
+                # The alternative: replay the account's postings up to the day
+                accounts = iter(sample)
+                samples = timed(lambda: Posting.objects.filter(account=next(accounts), created_at__lt=end)
+                                .aggregate(total=Sum('amount')), repeat=len(sample))
+                self.stdout.write(format_summary('replay postings' + name, summarize(samples)))
+            chunk = pks[:1000]
+            self.stdout.write(format_summary('as_of 1000 accounts',
+                                             summarize(timed(lambda: eod.as_of(chunk, yesterday), repeat=5))))
+            reset_queries()
+
+            Account.objects.update(interest_accrued_through=yesterday - timedelta(days=1))
+            started = time.perf_counter()
+            accrued = interest.accrue(yesterday)
+            elapsed = time.perf_counter() - started
+            self.stdout.write(f'accrue: {accrued:,} accounts in {elapsed:.1f}s ({accrued / elapsed:,.0f}/s)')
+
+            if options['post']:
+                started = time.perf_counter()
+                posted, total = interest.post()
+                elapsed = time.perf_counter() - started
+                self.stdout.write(f'post: ${total:,} to {posted:,} accounts in {elapsed:.1f}s '
+                                  f'({posted / elapsed:,.0f}/s)')
+
+    def seed(self, options, today):
+        per_user = options['accounts_per_user']
+        users = User.objects.bulk_create(User(username=f'eod{i}')
+                                         for i in range(-(-options['accounts'] // per_user)))
+        pks = []
+        opened = eod.day_bounds(today - timedelta(days=3))[0] + timedelta(hours=9)
+        for numbers in batched(range(options['accounts']), 10000):
+            with transaction.atomic():
+                accounts = Account.objects.bulk_create(
+                    Account(user=users[i // per_user], balance=Decimal('1000.00'), account_number=str(10 ** 8 + i),
+                            interest_rate=Decimal('0.02'))
+                    for i in numbers
+                )
+                self.book(accounts, Decimal('1000.00'), 'opening', opened)
+            pks += [account.pk for account in accounts]
+            reset_queries()
+
+        rng = random.Random(1)
+        # Deposits and withdrawals that net to zero, so hot accounts keep the same balance
+        for pk in pks[:options['hot']]:
+            with transaction.atomic():
+                for amounts in batched([Decimal('1.00'), Decimal('-1.00')] * (options['history'] // 2), 1000):
+                    self.book([Account(pk=pk)] * len(amounts), amounts, 'cash', opened)
+            reset_queries()
+        for days_ago in (2, 1, 0):
+            when = eod.day_bounds(today - timedelta(days=days_ago))[0] + timedelta(hours=12)
+            active = rng.sample(pks, int(len(pks) * options['active'] / (10 if days_ago == 0 else 1)))
+            for chunk in batched(sorted(active), 10000):
+                with transaction.atomic():
+                    self.book([Account(pk=pk) for pk in chunk], Decimal('25.00'), 'cash', when)
+                    Account.objects.filter(pk__in=chunk).update(balance=F('balance') + Decimal('25.00'))
+                reset_queries()
+        return pks
+
+    def book(self, accounts, amounts, external_ledger, when):
+        if isinstance(amounts, Decimal):
+            amounts = [amounts] * len(accounts)
+        postings = []
+        for account, amount in zip(accounts, amounts):
+            journal = uuid.uuid4()
+            postings += [
+                Posting(journal=journal, account_id=account.pk, amount=amount, created_at=when),
+                Posting(journal=journal, external_ledger=external_ledger, amount=-amount, created_at=when),
+            ]
+        Posting.objects.bulk_create(postings, batch_size=5000)
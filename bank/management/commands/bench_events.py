@@ -0,0 +1,116 @@
+import asyncio
+import resource
+import threading
+import time
+from importlib import import_module
+
+from django.conf import settings
+from django.contrib.auth import BACKEND_SESSION_KEY, HASH_SESSION_KEY, SESSION_KEY
+from django.contrib.auth.models import User
+from django.core.asgi import get_asgi_application
+from django.core.management.base import BaseCommand
+from django.test.utils import override_settings
+
+from bank import events
+from bank.benchmarks import benchmark_database, format_summary, summarize
+
+
+class Command(BaseCommand):
+    help = 'Hold many idle event streams open on one ASGI application and measure publish-to-delivery latency.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--streams', type=int, default=5000)
+        parser.add_argument('--users', type=int, default=1000, help='Streams are spread evenly across this many users.')
+        parser.add_argument('--rounds', type=int, default=5, help='Rounds of one event per user.')
+
+    def handle(self, *args, **options):
+        with benchmark_database(on_disk=True), override_settings(ALLOWED_HOSTS=['testserver'], BANK_EVENTS_BUS='memory',
+                                                                 BANK_EVENTS_HEARTBEAT=30):
+            users = User.objects.bulk_create(User(username=f'stream{i}') for i in range(options['users']))
+            store = import_module(settings.SESSION_ENGINE).SessionStore
+            cookies = []
+            for user in users:
+                session = store()
+                session.update({SESSION_KEY: str(user.pk), BACKEND_SESSION_KEY: settings.AUTHENTICATION_BACKENDS[0],
+                                HASH_SESSION_KEY: user.get_session_auth_hash()})
+                session.create()
+                cookies.append(f'{settings.SESSION_COOKIE_NAME}={session.session_key}'.encode())
+            asyncio.run(self.run(users, cookies, options))
+
+    async def run(self, users, cookies, options):
+        application = get_asgi_application()
+        bus = events.get_bus()
+        received = {}  # (user id, event id) -> delivery times
+        connected = asyncio.Event()
+        disconnect = asyncio.Event()
+        opened = 0
+
+        async def connection(user, cookie):
+            nonlocal opened
+            scope = {
+                'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': 'GET', 'scheme': 'http',
+                'path': '/events/', 'raw_path': b'/events/', 'query_string': b'', 'root_path': '',
+                'headers': [(b'host', b'testserver'), (b'cookie', cookie), (b'accept', b'text/event-stream')],
+                'client': ('127.0.0.1', 50000), 'server': ('testserver', 80),
+            }
+            requested = False
+
+            async def receive():
+                nonlocal requested
+                if not requested:
+                    requested = True
+                    return {'type': 'http.request', 'body': b'', 'more_body': False}
+                await disconnect.wait()
+                return {'type': 'http.disconnect'}
+
+            async def send(message):
+                nonlocal opened
+                if message['type'] == 'http.response.start':
+                    if message['status'] != 200:
+                        raise RuntimeError(f'Stream refused with {message["status"]}')
+                    opened += 1
+                    if opened == options['streams']:
+                        connected.set()
+                elif message.get('body', b'').startswith(b'id: '):
+                    event_id = int(message['body'].split(b'\n', 1)[0][4:])
+                    received.setdefault((user.pk, event_id), []).append(time.perf_counter())
+
+            await application(scope, receive, send)
+
+        rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        started = time.perf_counter()
+        tasks = [asyncio.ensure_future(connection(users[i % len(users)], cookies[i % len(users)]))
+                 for i in range(options['streams'])]
+        await connected.wait()
+        # Every response has started; give the last ones time to subscribe
+        while bus.stream_count < options['streams']:
+            await asyncio.sleep(0.01)
+        self.stdout.write(f'{options["streams"]} streams open in {time.perf_counter() - started:.1f}s, '
+                          f'max RSS +{(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - rss_before) / 1024:.0f}MB, '
+                          f'{threading.active_count()} threads')
+
+        samples, round_samples = [], []
+        for round in range(1, options['rounds'] + 1):
+            published = {}
+
+            def publish():
+                # From another thread, as a committing WSGI worker or sync_to_async call would
+                for user in users:
+                    published[user.pk] = time.perf_counter()
+                    bus.publish(user.pk, 'balance', {'balance': str(round)})
+
+            thread = threading.Thread(target=publish)
+            thread.start()
+            expected = options['streams']
+            while sum(len(received.get((user.pk, round), ())) for user in users) < expected:
+                await asyncio.sleep(0.005)
+            thread.join()
+            deliveries = [(at - published[user.pk]) for user in users for at in received[(user.pk, round)]]
+            samples += deliveries
+            round_samples.append(max(received[(user.pk, round)][-1] for user in users) - min(published.values()))
+
+        self.stdout.write(format_summary('publish -> delivered', summarize(samples)))
+        self.stdout.write(format_summary(f'round of {len(users)} events', summarize(round_samples)))
+        disconnect.set()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self.stdout.write(f'{bus.stream_count} streams still subscribed after disconnect')
@@ -0,0 +1,61 @@
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.management.base import BaseCommand
+from django.test import Client
+from django.test.utils import override_settings
+from django.urls import reverse
+
+from bank import fragments, loadtest
+from bank.benchmarks import benchmark_database, format_summary, summarize, timed
+
+
+class Command(BaseCommand):
+    help = 'Measure dashboard reload throughput with and without the fragment cache.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--transactions', type=int, default=100000)
+        parser.add_argument('--notifications', type=int, default=5000)
+        parser.add_argument('--repeat', type=int, default=500)
+        parser.add_argument('--threads', type=int, default=16, help='Concurrent reloads racing a version bump.')
+
+    def reload(self, label, user, **overrides):
+        with override_settings(**loadtest.SETTINGS, **overrides):
+            caches[getattr(settings, 'BANK_FRAGMENT_CACHE', 'default')].clear()
+            fragments.stats.reset()
+            client = Client()
+            client.force_login(user)
+            url = reverse('dashboard')
+            started = time.perf_counter()
+            summary = summarize(timed(lambda: client.get(url), self.repeat))
+            elapsed = time.perf_counter() - started
+            hit_rate = fragments.stats.report().get('recent_transactions', {}).get('hit_rate', 0)
+        self.stdout.write(format_summary(label, summary) + f' {self.repeat / elapsed:.0f} reloads/s hit rate={hit_rate:.1%}')
+
+    def stampede(self, user):
+        # Every thread misses at once after a bump; only one should recompute
+        with override_settings(**loadtest.SETTINGS):
+            fragments.stats.reset()
+            fragments.bump([user.pk])
+            computes = lambda: {'recent_transactions': fragments.recent_transactions(user)}
+            with ThreadPoolExecutor(max_workers=self.threads) as pool:
+                list(pool.map(lambda _: fragments.get_fragments(user, computes()), range(self.threads)))
+            counts = fragments.stats.report()['recent_transactions']
+        self.stdout.write(f"stampede of {self.threads}: {counts['miss']} recompute(s), {counts['wait']} waited")
+
+    def handle(self, *args, **options):
+        self.repeat = options['repeat']
+        self.threads = options['threads']
+        with benchmark_database(on_disk=True), tempfile.TemporaryDirectory() as directory:
+            [account, _] = loadtest.seed(2, options['transactions'] * 2, options['notifications'])
+            user = account.user
+            file_cache = {**settings.CACHES, 'fragments': {
+                'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache', 'LOCATION': directory}}
+
+            self.reload('uncached', user, BANK_FRAGMENT_CACHE_ENABLED=False)
+            self.reload('locmem fragments', user)
+            self.reload('file fragments', user, CACHES=file_cache, BANK_FRAGMENT_CACHE='fragments')
+            self.stampede(user)
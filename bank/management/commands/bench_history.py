@@ -0,0 +1,46 @@
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.db.models import Q
+
+from bank.benchmarks import benchmark_database, format_summary, seed_transactions, summarize, timed
+from bank.models import Account, TransactionSearch
+from bank.pagination import encode_cursor, paginate
+
+
+class Command(BaseCommand):
+    help = 'Benchmark keyset-paginated transaction history against a throwaway database.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=1000000)
+        parser.add_argument('--page-size', type=int, default=25)
+        parser.add_argument('--repeat', type=int, default=200)
+
+    def handle(self, *args, **options):
+        rows = options['rows']
+        with benchmark_database():
+            user = User.objects.create(username='bench')
+            account = Account.objects.create(user=user, balance=0, account_number='900000')
+            self.stdout.write(f'Seeding {rows} transactions...')
+            seed_transactions(account, rows)
+            with connection.cursor() as cursor:
+                cursor.execute('ANALYZE')
+
+            queryset = TransactionSearch.objects.filter(user=user).prefetch_related('user')
+            ordered = queryset.order_by('-date', '-pk')
+            for name, position in (('first page', None), ('middle page', rows // 2), ('deep page', rows - options['page_size'] - 1)):
+                cursor = None
+                if position:
+                    row = ordered.values('date', 'pk')[position]
+                    cursor = encode_cursor(row['date'], row['pk'])
+                samples = timed(lambda: list(paginate(queryset, cursor=cursor, page_size=options['page_size'])),
+                                repeat=options['repeat'])
+                self.stdout.write(format_summary(f'keyset {name}', summarize(samples)))
+
+            filtered = queryset.filter(Q(transaction_type='deposit'), amount__gte=1000)
+            samples = timed(lambda: list(paginate(filtered, page_size=options['page_size'])), repeat=options['repeat'])
+            self.stdout.write(format_summary('keyset filtered first page', summarize(samples)))
+
+            offset = rows // 2
+            samples = timed(lambda: list(ordered[offset:offset + options['page_size']]), repeat=max(1, options['repeat'] // 10))
+            self.stdout.write(format_summary('OFFSET middle page', summarize(samples)))
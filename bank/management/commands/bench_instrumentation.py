@@ -0,0 +1,75 @@
+import asyncio
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.test import AsyncClient, Client
+from django.test.utils import override_settings
+from django.urls import reverse
+
+from bank import loadtest
+from bank.benchmarks import benchmark_database, format_summary, seed_transactions, summarize, timed
+from bank.instrumentation import registry
+from bank.models import Account
+
+
+class Command(BaseCommand):
+    help = 'Measure the overhead of the instrumentation middleware on a typical view.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repeat', type=int, default=500)
+        parser.add_argument('--rows', type=int, default=1000)
+
+    def measure(self, user, label, **overrides):
+        with override_settings(ALLOWED_HOSTS=['testserver'], **overrides):
+            client = Client()
+            client.force_login(user)
+            url = reverse('transaction_history_json')
+            client.get(url)
+            summary = summarize(timed(lambda: client.get(url), self.repeat))
+        self.stdout.write(format_summary(label, summary))
+        return summary
+
+    def measure_async(self, user, label, **overrides):
+        async def run():
+            client = AsyncClient()
+            await client.aforce_login(user)
+            url = reverse('async_notifications')
+            await client.get(url)
+            samples = []
+            for _ in range(self.repeat):
+                started = time.perf_counter()
+                await client.get(url)
+                samples.append(time.perf_counter() - started)
+            return samples
+
+        with override_settings(**{**loadtest.SETTINGS, **overrides}):
+            summary = summarize(asyncio.run(run()))
+        self.stdout.write(format_summary(label, summary))
+        return summary
+
+    def report(self, baseline, measured):
+        for label, summary in measured:
+            overhead = summary['p50_ms'] - baseline['p50_ms']
+            self.stdout.write(f'{label} overhead: {overhead:+.3f}ms p50 ({overhead / baseline["p50_ms"]:+.1%})')
+
+    def handle(self, *args, **options):
+        self.repeat = options['repeat']
+        with benchmark_database():
+            user = User.objects.create(username='bench')
+            account = Account.objects.create(user=user, account_number='0000000001', balance=0)
+            seed_transactions(account, options['rows'])
+
+            baseline = self.measure(user, 'disabled', BANK_INSTRUMENTATION_ENABLED=False)
+            enabled = self.measure(user, 'enabled', BANK_INSTRUMENTATION_ENABLED=True,
+                                   BANK_INSTRUMENTATION_ALLOC_SAMPLE_RATE=0)
+            sampled = self.measure(user, 'enabled, 1% alloc sampling', BANK_INSTRUMENTATION_ENABLED=True,
+                                   BANK_INSTRUMENTATION_ALLOC_SAMPLE_RATE=0.01)
+            self.report(baseline, [('enabled', enabled), ('sampled', sampled)])
+
+            # The async notifications view, to check the middleware adds no thread hop in front of it
+            baseline = self.measure_async(user, 'async disabled', BANK_INSTRUMENTATION_ENABLED=False)
+            enabled = self.measure_async(user, 'async enabled', BANK_INSTRUMENTATION_ENABLED=True,
+                                         BANK_INSTRUMENTATION_ALLOC_SAMPLE_RATE=0)
+            self.report(baseline, [('async enabled', enabled)])
+            registry.reset()
@@ -0,0 +1,77 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.contrib.auth import hashers
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.urls import reverse
+
+from bank.benchmarks import benchmark_database
+from bank.models import Account
+from bank.passwords import HASHERS, password_hashers
+
+PASSWORD = 'shift change 0800'
+
+
+class Command(BaseCommand):
+    help = 'Measure logins per second for each password hasher, and database hits per authenticated request.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--logins', type=int, default=200)
+        parser.add_argument('--threads', type=int, default=8, help='Concurrent request threads.')
+        parser.add_argument('--workers', type=int, default=4, help='Hashing processes for the pooled runs.')
+        parser.add_argument('--requests', type=int, default=200, help='Authenticated requests per session engine.')
+
+    def handle(self, *args, **options):
+        with benchmark_database(on_disk=True), override_settings(ALLOWED_HOSTS=['testserver']):
+            users = User.objects.bulk_create(User(username=f'login{i}') for i in range(options['logins']))
+            for name in HASHERS:
+                try:
+                    with override_settings(PASSWORD_HASHERS=password_hashers(name)):
+                        hashers.make_password(PASSWORD)
+                except ValueError as e:
+                    self.stdout.write(f'{name}: skipped ({e})')
+                    continue
+                for workers in (0, options['workers']):
+                    self.logins(users, name, workers, options['threads'])
+            self.session_hits(users[0], options['requests'])
+
+    def logins(self, users, hasher, workers, threads):
+        with override_settings(PASSWORD_HASHERS=password_hashers(hasher), BANK_PASSWORD_HASH_WORKERS=workers):
+            encoded = hashers.make_password(PASSWORD)
+            User.objects.filter(pk__in=[user.pk for user in users]).update(password=encoded)
+            url = reverse('login')
+
+            def login(user):
+                response = Client().post(url, {'username': user.username, 'password': PASSWORD},
+                                         REMOTE_ADDR=f'10.{user.pk // 65536}.{user.pk // 256 % 256}.{user.pk % 256}')
+                return response.status_code
+
+            # Warm the pool so process start-up isn't counted
+            login(users[0])
+            started = time.perf_counter()
+            with ThreadPoolExecutor(threads) as pool:
+                codes = list(pool.map(login, users))
+            elapsed = time.perf_counter() - started
+        mode = f'{workers} hashing processes' if workers else 'in request threads'
+        self.stdout.write(f'{hasher}, {mode}: {len(users) / elapsed:.1f} logins/s '
+                          f'({codes.count(302)}/{len(codes)} succeeded)')
+
+    def session_hits(self, user, requests):
+        user.set_password(PASSWORD)
+        user.save()
+        Account.objects.create(user=user, balance=0, account_number='900000')
+        url = reverse('transaction_history_json')
+        for engine in ('django.contrib.sessions.backends.db', 'django.contrib.sessions.backends.cached_db'):
+            with override_settings(SESSION_ENGINE=engine):
+                client = Client()
+                client.post(reverse('login'), {'username': user.username, 'password': PASSWORD})
+                with CaptureQueriesContext(connection) as queries:
+                    for _ in range(requests):
+                        client.get(url)
+            sessions = sum('django_session' in query['sql'] for query in queries)
+            self.stdout.write(f'{engine.rsplit(".", 1)[1]}: {len(queries) / requests:.1f} queries per authenticated '
+                              f'request, {sessions / requests:.1f} of them on django_session')
@@ -0,0 +1,50 @@
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+
+from bank.benchmarks import benchmark_database, format_summary, summarize, timed
+from bank.models import Notification
+from bank.notifications import invalidate_unread_count, mark_read, unread_count, unread_page
+
+
+class Command(BaseCommand):
+    help = 'Benchmark the notification inbox with many unread notifications per user.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--unread', type=int, default=50000, help='Unread notifications per user.')
+        parser.add_argument('--users', type=int, default=2)
+        parser.add_argument('--repeat', type=int, default=50)
+
+    def seed(self, user):
+        Notification.objects.filter(user=user).delete()
+        Notification.objects.bulk_create(
+            (Notification(user=user, message=f'You received ${i}') for i in range(self.unread)), batch_size=5000)
+
+    def handle(self, *args, **options):
+        self.unread = options['unread']
+        with benchmark_database():
+            users = [User.objects.create(username=f'bench{i}') for i in range(options['users'])]
+            for user in users:
+                self.seed(user)
+            user = users[0]
+
+            def page_view():
+                mark_read(user, unread_page(user))
+
+            self.stdout.write(format_summary('bulk mark displayed page', summarize(timed(page_view, options['repeat']))))
+
+            def uncached_count():
+                invalidate_unread_count([user.pk])
+                unread_count(user)
+
+            self.stdout.write(format_summary('unread count (uncached)', summarize(timed(uncached_count, options['repeat']))))
+            self.stdout.write(format_summary('unread count (cached)', summarize(timed(lambda: unread_count(user), options['repeat']))))
+
+            self.seed(user)
+
+            def per_row_saves():
+                # The previous view: every unread row fetched and saved individually
+                for notification in Notification.objects.filter(user=user, is_read=False):
+                    notification.is_read = True
+                    notification.save()
+
+            self.stdout.write(format_summary('per-row saves (old view)', summarize(timed(per_row_saves))))
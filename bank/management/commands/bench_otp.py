@@ -0,0 +1,54 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management.base import BaseCommand
+from django.db import OperationalError, connection
+from django.test.utils import override_settings
+
+from bank import authorizations
+from bank.benchmarks import benchmark_database, format_summary, summarize
+
+
+class Command(BaseCommand):
+    help = 'Benchmark OTP issue and verify round trips against each store.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--operations', type=int, default=100000, help='Issue/verify pairs per store.')
+        parser.add_argument('--threads', type=int, default=8)
+        parser.add_argument('--users', type=int, default=1000)
+
+    def round_trip(self, store, user, i):
+        started = time.perf_counter()
+        while True:
+            try:
+                otp = authorizations.issue(user, f'{i:010d}', i % 1000 + 1, store=store)
+                assert authorizations.verify(user, f'{i:010d}', i % 1000 + 1, otp, store=store)
+                break
+            except OperationalError:
+                # SQLite allows one writer at a time; retry like a busy request would
+                time.sleep(0.001)
+        return time.perf_counter() - started
+
+    def worker(self, store, users, indexes):
+        try:
+            return [self.round_trip(store, users[i % len(users)], i) for i in indexes]
+        finally:
+            connection.close()
+
+    def handle(self, *args, **options):
+        threads = options['threads']
+        operations = options['operations']
+        with benchmark_database(), override_settings(BANK_OTP_MAX_ISSUES=operations):
+            users = User.objects.bulk_create(User(username=f'bench{i}') for i in range(options['users']))
+            for name in ('cache', 'database'):
+                cache.clear()
+                store = authorizations.get_store(name)
+                started = time.perf_counter()
+                with ThreadPoolExecutor(max_workers=threads) as pool:
+                    futures = [pool.submit(self.worker, store, users, range(t, operations, threads)) for t in range(threads)]
+                    samples = [sample for future in futures for sample in future.result()]
+                elapsed = time.perf_counter() - started
+                self.stdout.write(format_summary(f'{name} store issue+verify', summarize(samples))
+                                  + f' {operations / elapsed:.0f} ops/s')
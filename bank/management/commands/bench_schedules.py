@@ -0,0 +1,79 @@
+import threading
+import time
+from datetime import timedelta
+from decimal import Decimal
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test.utils import override_settings
+from django.utils import timezone
+
+from bank.benchmarks import benchmark_database
+from bank.loadtest import SHADOW_SCREENING_RULES
+from bank.models import Account, ScheduledTransfer, Transaction
+from bank.schedules import Scheduler
+from bank.utils import batched
+
+
+class Command(BaseCommand):
+    help = 'Execute a large set of due scheduled transfers against a throwaway database.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--schedules', type=int, default=100000)
+        parser.add_argument('--accounts', type=int, default=10000)
+        parser.add_argument('--chunk-size', type=int, default=500)
+        parser.add_argument('--workers', default='1,4', help='Comma-separated worker counts, one run each.')
+        parser.add_argument('--nodes', type=int, default=1, help='Schedulers running side by side in each run.')
+
+    def handle(self, *args, **options):
+        with benchmark_database(on_disk=True), override_settings(BANK_SCREENING_RULES=SHADOW_SCREENING_RULES):
+            accounts = self.seed(options['schedules'], options['accounts'])
+            due = timezone.now().replace(microsecond=0)
+            for run, workers in enumerate(int(w) for w in options['workers'].split(',')):
+                # A fresh occurrence each run, so idempotency keys don't turn it into a replay
+                now = due + timedelta(minutes=run)
+                ScheduledTransfer.objects.update(next_run_at=now, status='active')
+                self.run(options, workers, now, accounts)
+
+    def seed(self, schedules, accounts):
+        users = User.objects.bulk_create(User(username=f'schedule{i}') for i in range(accounts))
+        accounts = Account.objects.bulk_create(
+            Account(user=user, balance=Decimal(10 ** 9), account_number=str(700000 + i),
+                    daily_transaction_limit=Decimal(10 ** 9), max_transaction_count=10 ** 6)
+            for i, user in enumerate(users)
+        )
+        for rows in batched(range(schedules), 10000):
+            ScheduledTransfer.objects.bulk_create(
+                ScheduledTransfer(user=accounts[i % len(accounts)].user, from_account=accounts[i % len(accounts)],
+                                  to_account=accounts[(i * 7 + 1) % len(accounts)], amount=Decimal('25.00'),
+                                  frequency='monthly', next_run_at=timezone.now())
+                for i in rows
+            )
+        return accounts
+
+    def run(self, options, workers, now, accounts):
+        transfers = Transaction.objects.filter(transaction_type='transfer').count()
+        results = []
+
+        def node():
+            try:
+                results.append(Scheduler(workers=workers, chunk_size=options['chunk_size']).run(now))
+            finally:
+                connection.close()
+
+        started = time.perf_counter()
+        threads = [threading.Thread(target=node) for _ in range(options['nodes'])]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+
+        ok = sum(result['ok'] for result in results)
+        posted = Transaction.objects.filter(transaction_type='transfer').count() - transfers
+        left = ScheduledTransfer.objects.filter(next_run_at__lte=now).count()
+        self.stdout.write(f'{options["nodes"]} schedulers x {workers} workers: {ok} schedules in {elapsed:.1f}s '
+                          f'({ok / elapsed:,.0f}/s), {posted} transfers posted, '
+                          f'{sum(result["error"] for result in results)} retried after database errors, '
+                          f'{left} still due')
@@ -0,0 +1,94 @@
+import random
+import time
+from datetime import timedelta
+from decimal import Decimal
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.utils import timezone
+
+from bank.benchmarks import benchmark_database, format_summary, summarize, timed
+from bank.forms import TransactionFilterForm
+from bank.models import Account, Transaction, TransactionSearch
+from bank.pagination import paginate
+from bank.search import _entry, fts_available, text_filter
+from bank.utils import batched, explicit_timestamps
+
+MEMOS = ['', '', '', 'rent', 'groceries', 'salary', 'invoice 2231', 'dinner with friends', 'gym membership',
+         'electricity bill', 'car insurance', 'school fees', 'holiday deposit']
+
+
+class Command(BaseCommand):
+    help = 'Benchmark filtered and free-text transaction searches against a throwaway database.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=5000000)
+        parser.add_argument('--payees', type=int, default=2000, help='Distinct counterparties in the seeded history.')
+        parser.add_argument('--batch-size', type=int, default=20000)
+        parser.add_argument('--page-size', type=int, default=25)
+        parser.add_argument('--repeat', type=int, default=50)
+
+    def seed(self, account, rows, payees, batch_size):
+        rng = random.Random(0)
+        types = [choice for choice, _ in Transaction.TRANSACTION_TYPES]
+        payees = [(f'{800000000 + i}', f'payee{i:05d}') for i in range(payees)]
+        start = timezone.now() - timedelta(minutes=rows)
+
+        def generate():
+            for i in range(rows):
+                yield Transaction(user_id=account.user_id, account=account, transaction_type=rng.choice(types),
+                                  amount=Decimal(rng.randint(100, 500000)) / 100, memo=rng.choice(MEMOS),
+                                  date=start + timedelta(minutes=i))
+
+        started = time.perf_counter()
+        with explicit_timestamps(Transaction, 'date'):
+            for batch in batched(generate(), batch_size):
+                with transaction.atomic():
+                    batch = Transaction.objects.bulk_create(batch)
+                    indexed = time.perf_counter()
+                    TransactionSearch.objects.bulk_create(
+                        _entry(row, *(rng.choice(payees) if row.transaction_type == 'transfer' else ('', '')))
+                        for row in batch)
+                    self.index_seconds += time.perf_counter() - indexed
+        return time.perf_counter() - started
+
+    def handle(self, *args, **options):
+        rows, page_size, repeat = options['rows'], options['page_size'], options['repeat']
+        self.index_seconds = 0
+        with benchmark_database(on_disk=True):
+            user = User.objects.create(username='bench')
+            account = Account.objects.create(user=user, balance=0, account_number='900000')
+            self.stdout.write(f'Seeding {rows} transactions...')
+            elapsed = self.seed(account, rows, options['payees'], options['batch_size'])
+            self.stdout.write(f'Seeded in {elapsed:.1f}s, {self.index_seconds:.1f}s of it writing search rows '
+                              f'({self.index_seconds / rows * 1e6:.1f}us per row)')
+            with connection.cursor() as cursor:
+                cursor.execute('ANALYZE')
+            self.stdout.write(f'FTS5 available: {fts_available(connection.alias)}')
+
+            middle = timezone.localdate() - timedelta(minutes=rows // 2)
+            cases = {
+                'type + amount': {'transaction_type': 'deposit', 'min_amount': '4000'},
+                'date range (1 week)': {'date_from': middle, 'date_to': middle + timedelta(days=6)},
+                'counterparty': {'q': 'payee01234'},
+                'memo': {'q': 'insurance'},
+                'memo + type + amount': {'q': 'rent', 'transaction_type': 'transfer', 'min_amount': '4000'},
+                'account number prefix': {'q': '8000012'},
+            }
+            searches = TransactionSearch.objects.filter(user=user)
+            for name, data in cases.items():
+                form = TransactionFilterForm(data)
+                samples = timed(lambda: list(paginate(form.filter(searches), page_size=page_size)), repeat=repeat)
+                self.stdout.write(format_summary(f'search {name}', summarize(samples)))
+                if data.get('q'):
+                    without_text = TransactionFilterForm({**data, 'q': ''})
+                    samples = timed(lambda: list(paginate(text_filter(without_text.filter(searches), data['q'], fts=False),
+                                                          page_size=page_size)),
+                                    repeat=max(1, repeat // 10))
+                    self.stdout.write(format_summary(f'LIKE {name}', summarize(samples)))
+                elif 'transaction_type' in data:
+                    # For comparison: the same filters chained on the ledger table
+                    ledger = Transaction.objects.filter(user=user)
+                    samples = timed(lambda: list(paginate(form.filter(ledger), page_size=page_size)), repeat=repeat)
+                    self.stdout.write(format_summary(f'ledger {name}', summarize(samples)))
@@ -0,0 +1,57 @@
+import tempfile
+import time
+import tracemalloc
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.test import override_settings
+
+from bank.benchmarks import benchmark_database, seed_transactions
+from bank.models import Account, Statement
+from bank.statements import render_statement, statement_transactions, stream_csv
+
+
+def measure(func):
+    tracemalloc.start()
+    started = time.perf_counter()
+    result = func()
+    elapsed = time.perf_counter() - started
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return result, elapsed, peak / 1024 / 1024
+
+
+class Command(BaseCommand):
+    help = 'Benchmark statement export time and peak memory against a throwaway database.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=500000)
+        parser.add_argument('--pdf-rows', type=int, default=5000, help='Rows to render for the PDF measurement.')
+
+    def report(self, name, rows, elapsed, peak):
+        self.stdout.write(f'{name:<28} rows={rows:<8} time={elapsed:.2f}s rows/s={rows / elapsed:,.0f} peak={peak:.1f}MiB')
+
+    def handle(self, *args, **options):
+        with benchmark_database():
+            user = User.objects.create(username='bench')
+            account = Account.objects.create(user=user, balance=0, account_number='900000')
+            self.stdout.write(f"Seeding {options['rows']} transactions...")
+            seed_transactions(account, options['rows'])
+            transactions = statement_transactions(account)
+
+            _, elapsed, peak = measure(lambda: sum(len(chunk) for chunk in stream_csv(transactions)))
+            self.report('streamed CSV', options['rows'], elapsed, peak)
+
+            def materialized():
+                # What the old view did: every row loaded into one document before responding
+                return len(''.join(f'{t.date},{t.transaction_type},{t.amount},{t.status},{t.id}\n' for t in list(transactions)))
+
+            _, elapsed, peak = measure(materialized)
+            self.report('materialized CSV', options['rows'], elapsed, peak)
+
+            pdf_account = Account.objects.create(user=user, balance=0, account_number='900001')
+            seed_transactions(pdf_account, options['pdf_rows'])
+            statement = Statement.objects.create(user=user, account=pdf_account)
+            with tempfile.TemporaryDirectory() as root, override_settings(BANK_STATEMENT_ROOT=root):
+                _, elapsed, peak = measure(lambda: render_statement(statement))
+            self.report('chunked PDF', options['pdf_rows'], elapsed, peak)
@@ -0,0 +1,21 @@
+from datetime import date
+
+from django.core.management.base import BaseCommand
+
+from bank.eod import close_days, reopen
+
+
+class Command(BaseCommand):
+    help = 'Write end-of-day balances for every finished day not closed yet. Run nightly.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--through', type=date.fromisoformat, help='Last day to close (YYYY-MM-DD).')
+        parser.add_argument('--reopen', type=date.fromisoformat,
+                            help='Drop the closes from this day on first, e.g. after a late posting.')
+        parser.add_argument('--batch-size', type=int, default=5000)
+
+    def handle(self, *args, **options):
+        if options['reopen']:
+            self.stdout.write(f'Reopened {reopen(options["reopen"])} days')
+        for day, accounts in close_days(options['through'], options['batch_size']).items():
+            self.stdout.write(f'Closed {day}: {accounts} accounts moved')
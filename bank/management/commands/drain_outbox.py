@@ -0,0 +1,30 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from bank.outbox import OutboxWorker
+
+
+class Command(BaseCommand):
+    help = 'Deliver queued email and SMS notifications from the outbox.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=100)
+        parser.add_argument('--workers', type=int, default=4)
+        parser.add_argument('--interval', type=float, default=1.0, help='Seconds to sleep when the outbox is empty.')
+        parser.add_argument('--once', action='store_true', help='Drain what is due and exit.')
+
+    def handle(self, *args, **options):
+        worker = OutboxWorker(batch_size=options['batch_size'], workers=options['workers'])
+        try:
+            while True:
+                sent = worker.drain()
+                if sent:
+                    self.stdout.write(f'Processed {sent} outbox messages')
+                if options['once']:
+                    break
+                time.sleep(options['interval'])
+        except KeyboardInterrupt:
+            pass
+        finally:
+            worker.close()
@@ -0,0 +1,42 @@
+import resource
+import sys
+import time
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+
+from bank.datasets import import_ledger
+from bank.models import Posting
+
+
+class Command(BaseCommand):
+    help = 'Stream deposits and withdrawals from a CSV or NDJSON feed into the ledger.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('file', help='Feed with account,type,amount[,date,reference,memo] fields, or - for stdin.')
+        parser.add_argument('--format', choices=['csv', 'ndjson'], help='Default: from the file extension.')
+        parser.add_argument('--batch-size', type=int, default=500, help='Rows committed per transaction.')
+        parser.add_argument('--ledger', default='cash', help='External ledger the money comes from or goes to.',
+                            choices=[choice for choice, _ in Posting.EXTERNAL_LEDGERS if choice])
+
+    def handle(self, *args, **options):
+        path = options['file']
+        format = options['format'] or ('ndjson' if Path(path).suffix in ('.ndjson', '.jsonl') else 'csv')
+
+        def on_reject(line, reason):
+            self.stderr.write(f'Line {line}: {reason}')
+
+        started = time.perf_counter()
+        try:
+            stream = sys.stdin if path == '-' else open(path, newline='', encoding='utf-8')
+        except OSError as e:
+            raise CommandError(str(e))
+        with stream:
+            results = import_ledger(stream, format, batch_size=options['batch_size'],
+                                    external_ledger=options['ledger'], on_reject=on_reject)
+        elapsed = time.perf_counter() - started
+        rows = sum(results.values())
+        self.stdout.write(f'{results["imported"]} imported, {results["duplicate"]} already imported, '
+                          f'{results["rejected"]} rejected; {rows} rows in {elapsed:.1f}s '
+                          f'({rows / elapsed:,.0f} rows/s), peak memory '
+                          f'{resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024:.0f}MB')
@@ -0,0 +1,29 @@
+import requests
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+
+class Command(BaseCommand):
+    help = "Print the slowest views from a running server's instrumentation endpoint."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--url', default='http://127.0.0.1:8000/instrumentation/')
+        parser.add_argument('--token', default=getattr(settings, 'BANK_METRICS_TOKEN', ''))
+        parser.add_argument('--top', type=int, default=10)
+        parser.add_argument('--sort', default='p95_ms',
+                            choices=['p95_ms', 'mean_ms', 'queries_per_request', 'db_ms_per_request', 'requests'])
+
+    def handle(self, *args, **options):
+        # Histograms live in the server process, so read them over HTTP
+        try:
+            response = requests.get(options['url'], params={'top': options['top'], 'sort': options['sort']},
+                                    headers={'Authorization': f"Bearer {options['token']}"}, timeout=10)
+            response.raise_for_status()
+        except requests.RequestException as e:
+            raise CommandError(f'Could not fetch the report: {e}')
+
+        self.stdout.write(f"{'view':<32} {'requests':>8} {'mean':>9} {'p95<=':>9} {'queries':>8} {'db':>9}  external")
+        for row in response.json()['views']:
+            external = ' '.join(f'{kind}={ms:.1f}ms' for kind, ms in row['external_ms'].items())
+            self.stdout.write(f"{row['view']:<32} {row['requests']:>8} {row['mean_ms']:>7.1f}ms {row['p95_ms']:>7.0f}ms "
+                              f"{row['queries_per_request']:>8.1f} {row['db_ms_per_request']:>7.1f}ms  {external}")
@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from bank.notifications import purge_read
+
+
+class Command(BaseCommand):
+    help = 'Delete read notifications older than the retention period in batches.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=90)
+        parser.add_argument('--batch-size', type=int, default=5000)
+
+    def handle(self, *args, **options):
+        deleted = purge_read(older_than_days=options['days'], batch_size=options['batch_size'])
+        self.stdout.write(f'Deleted {deleted} read notifications')
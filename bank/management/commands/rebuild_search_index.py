@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from bank.search import rebuild
+
+
+class Command(BaseCommand):
+    help = 'Recreate the transaction search rows from the ledger.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('accounts', nargs='*', type=int, help='Account ids to rebuild (default: all).')
+        parser.add_argument('--batch-size', type=int, default=5000, help='Transactions per transaction.')
+
+    def handle(self, *args, **options):
+        rebuilt = rebuild(accounts=options['accounts'] or None, batch_size=options['batch_size'])
+        self.stdout.write(f'Indexed {rebuilt} transactions')
@@ -0,0 +1,24 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from bank.ledger import reconcile
+
+
+class Command(BaseCommand):
+    help = "Verify every account's cached balance against the double-entry ledger."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=1000)
+        parser.add_argument('--workers', type=int, default=4)
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        mismatches = 0
+        for account_id, ledger_balance, cached_balance in reconcile(options['chunk_size'], options['workers']):
+            mismatches += 1
+            self.stdout.write(f'Account {account_id}: ledger {ledger_balance} != cached {cached_balance}')
+        elapsed = time.perf_counter() - started
+        if mismatches:
+            raise CommandError(f'{mismatches} accounts do not reconcile ({elapsed:.1f}s)')
+        self.stdout.write(f'All accounts reconcile ({elapsed:.1f}s)')
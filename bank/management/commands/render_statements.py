@@ -0,0 +1,27 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from bank.statements import render_pending
+
+
+class Command(BaseCommand):
+    help = 'Render queued PDF account statements.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=2)
+        parser.add_argument('--interval', type=float, default=2.0, help='Seconds to sleep when nothing is queued.')
+        parser.add_argument('--once', action='store_true', help='Render what is queued and exit.')
+
+    def handle(self, *args, **options):
+        try:
+            while True:
+                rendered = render_pending(workers=options['workers'])
+                if rendered:
+                    self.stdout.write(f'Rendered {rendered} statements')
+                    continue
+                if options['once']:
+                    break
+                time.sleep(options['interval'])
+        except KeyboardInterrupt:
+            pass
@@ -0,0 +1,95 @@
+import random
+import time
+from collections import Counter
+from datetime import timedelta
+from decimal import Decimal
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+
+from bank.benchmarks import benchmark_database, format_summary, summarize
+from bank.models import Account, Transfer
+from bank.screening import ALLOW, STORES, ScreeningEngine
+from bank.utils import batched, explicit_timestamps
+
+
+class Command(BaseCommand):
+    help = 'Stream historical transfers through the screening rules and report decision latency.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--since', help='Only replay transfers from this date (YYYY-MM-DD).')
+        parser.add_argument('--limit', type=int)
+        parser.add_argument('--store', choices=sorted(STORES), default='memory',
+                            help='Profile store; the replay starts from empty profiles either way.')
+        parser.add_argument('--synthetic', type=int, default=0,
+                            help='Replay this many generated transfers in a throwaway database instead.')
+        parser.add_argument('--accounts', type=int, default=1000, help='Accounts for --synthetic.')
+
+    def handle(self, *args, **options):
+        if options['synthetic']:
+            with benchmark_database():
+                self.seed(options['synthetic'], options['accounts'])
+                self.replay(options)
+        else:
+            self.replay(options)
+
+    def seed(self, transfers, accounts):
+        rng = random.Random(0)
+        users = User.objects.bulk_create(User(username=f'replay{i}') for i in range(accounts))
+        accounts = [account.pk for account in Account.objects.bulk_create(
+            Account(user=user, balance=0, account_number=str(600000 + i)) for i, user in enumerate(users))]
+        # Each account pays a handful of regular payees a typical amount, with the odd burst and outlier
+        habits = {pk: (rng.sample(accounts, 5), rng.lognormvariate(4, 1)) for pk in accounts}
+        at = timezone.now() - timedelta(seconds=transfers * 30)
+
+        def generate():
+            nonlocal at
+            for _ in range(transfers):
+                at += timedelta(seconds=rng.expovariate(1 / 30))
+                source = rng.choice(accounts)
+                payees, typical = habits[source]
+                payee = rng.choice(accounts) if rng.random() < 0.05 else rng.choice(payees)
+                amount = typical * (rng.uniform(5, 20) if rng.random() < 0.01 else rng.uniform(0.5, 1.5))
+                yield Transfer(from_account_id=source, to_account_id=payee if payee != source else payees[0],
+                               amount=Decimal(f'{amount:.2f}'), timestamp=at)
+
+        with explicit_timestamps(Transfer, 'timestamp'):
+            for batch in batched(generate(), 10000):
+                Transfer.objects.bulk_create(batch)
+
+    def replay(self, options):
+        engine = ScreeningEngine(store=STORES[options['store']]())
+        transfers = Transfer.objects.order_by('pk')
+        if options['since']:
+            transfers = transfers.filter(timestamp__date__gte=parse_date(options['since']))
+        if options['limit']:
+            transfers = transfers[:options['limit']]
+
+        samples, decisions, changed = [], Counter(), 0
+        started = time.perf_counter()
+        for source, payee, amount, timestamp, recorded in transfers.values_list(
+                'from_account_id', 'to_account_id', 'amount', 'timestamp', 'decision').iterator(chunk_size=5000):
+            at = timestamp.timestamp()
+            screened = time.perf_counter()
+            decision = engine.screen(source, payee, amount, at=at)
+            samples.append(time.perf_counter() - screened)
+            decisions[decision.action] += 1
+            changed += decision.action != recorded
+            # Profiles follow what actually happened, not what these rules would have done
+            if recorded == ALLOW:
+                engine.record(source, payee, amount, at=at)
+        elapsed = time.perf_counter() - started
+
+        if not samples:
+            self.stdout.write('No transfers to replay')
+            return
+        screening_seconds = sum(samples)
+        self.stdout.write(format_summary('screen()', summarize(samples)))
+        self.stdout.write(f'{len(samples)} transfers in {elapsed:.2f}s; '
+                          f'{len(samples) / screening_seconds:.0f} decisions/s and '
+                          f'{len(samples) * len(engine.rules) / screening_seconds:.0f} rules/s inside screen()')
+        self.stdout.write(f'p99 decision latency {summarize(samples)["p99_ms"] * 1000:.1f}us')
+        self.stdout.write('Decisions: ' + ', '.join(f'{action}={count}' for action, count in sorted(decisions.items())))
+        self.stdout.write(f'{changed} differ from the decision recorded at the time')
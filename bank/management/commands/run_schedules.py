@@ -0,0 +1,28 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from bank.schedules import Scheduler
+
+
+class Command(BaseCommand):
+    help = 'Execute due scheduled transfers. Safe to run on several nodes at once.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=500, help='Schedules claimed per round.')
+        parser.add_argument('--workers', type=int, default=4)
+        parser.add_argument('--interval', type=float, default=30.0, help='Seconds to sleep when nothing is due.')
+        parser.add_argument('--once', action='store_true', help='Run what is due and exit.')
+
+    def handle(self, *args, **options):
+        scheduler = Scheduler(workers=options['workers'], chunk_size=options['chunk_size'])
+        try:
+            while True:
+                results = scheduler.run()
+                if results:
+                    self.stdout.write(f'Ran {results["ok"]} scheduled transfers, {results["failed"]} failed')
+                if options['once']:
+                    break
+                time.sleep(options['interval'])
+        except KeyboardInterrupt:
+            pass
@@ -0,0 +1,41 @@
+import resource
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import IntegrityError
+
+from bank.datasets import seed
+
+
+class Command(BaseCommand):
+    help = 'Generate a large, consistent synthetic dataset: users, accounts and their ledger history.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=10000)
+        parser.add_argument('--transactions', type=int, default=50, help='Average ledger rows per account.')
+        parser.add_argument('--days', type=int, default=365, help='Days of history, ending today.')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--start', type=int, default=0, help='Index of the first user, to add to an earlier run.')
+        parser.add_argument('--prefix', default='seed', help='Username prefix.')
+        parser.add_argument('--block-size', type=int, default=200, help='Users written per database transaction.')
+        parser.add_argument('--batch-size', type=int, default=5000, help='Ledger rows per bulk insert.')
+        parser.add_argument('--processes', type=int, default=1)
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        try:
+            counts = seed(options['users'], transactions=options['transactions'], days=options['days'],
+                          seed=options['seed'], start=options['start'], prefix=options['prefix'],
+                          block_size=options['block_size'], batch_size=options['batch_size'],
+                          processes=options['processes'])
+        except IntegrityError as e:
+            raise CommandError(f'{e}; users from an earlier run? Pick another --start or --prefix.')
+        except ValueError as e:
+            raise CommandError(str(e))
+        elapsed = time.perf_counter() - started
+        rows = sum(counts.values())
+        peak = max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+                   resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss)
+        self.stdout.write(', '.join(f'{count} {table}' for table, count in counts.items()))
+        self.stdout.write(f'{rows} rows in {elapsed:.1f}s ({rows / elapsed:,.0f} rows/s), '
+                          f'peak memory {peak / 1024:.0f}MB per process')
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from bank.ledger import take_snapshots
+
+
+class Command(BaseCommand):
+    help = 'Snapshot ledger balances so balance reads only sum recent postings. Run periodically.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=1000, help='Accounts locked per transaction.')
+
+    def handle(self, *args, **options):
+        taken = take_snapshots(chunk_size=options['chunk_size'])
+        self.stdout.write(f'Took {taken} balance snapshots')
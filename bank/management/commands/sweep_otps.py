@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from bank.authorizations import get_store
+
+
+class Command(BaseCommand):
+    help = 'Delete expired transfer OTPs from the database store.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=5000)
+
+    def handle(self, *args, **options):
+        deleted = get_store('database').sweep(batch_size=options['batch_size'])
+        self.stdout.write(f'Deleted {deleted} expired OTPs')
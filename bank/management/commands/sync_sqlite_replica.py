@@ -0,0 +1,26 @@
+import sqlite3
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+
+class Command(BaseCommand):
+    help = 'Copy the primary SQLite database into the replica file, standing in for replication locally.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--database', default='replica')
+
+    def handle(self, *args, **options):
+        alias = options['database']
+        if alias not in connections.settings or connections['default'].vendor != 'sqlite':
+            raise CommandError(f'No SQLite replica {alias!r}; set BANK_DB_REPLICA_NAME')
+        connections[alias].close()
+        primary = connections['default']
+        primary.ensure_connection()
+        target = sqlite3.connect(connections.settings[alias]['NAME'])
+        try:
+            # The online backup API copies a consistent snapshot while the primary stays writable
+            primary.connection.backup(target)
+        finally:
+            target.close()
+        self.stdout.write(f"Copied {primary.settings_dict['NAME']} to {connections.settings[alias]['NAME']}")
@@ -0,0 +1,31 @@
+import uuid
+
+from django.db import migrations
+
+
+def post_opening_balances(apps, schema_editor):
+    # Give balances that predate the ledger an opening entry so reconciliation starts clean
+    Account = apps.get_model('bank', 'Account')
+    Posting = apps.get_model('bank', 'Posting')
+    postings = []
+    for account_id, balance in Account.objects.exclude(balance=0).values_list('pk', 'balance').iterator():
+        journal = uuid.uuid4()
+        postings += [
+            Posting(journal=journal, account_id=account_id, amount=balance),
+            Posting(journal=journal, external_ledger='opening', amount=-balance),
+        ]
+        if len(postings) >= 5000:
+            Posting.objects.bulk_create(postings)
+            postings = []
+    Posting.objects.bulk_create(postings)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bank', '0010_posting_balancesnapshot'),
+    ]
+
+    operations = [
+        migrations.RunPython(post_opening_balances, migrations.RunPython.noop),
+    ]
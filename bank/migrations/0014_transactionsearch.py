@@ -0,0 +1,122 @@
+# Generated by Django 5.2.18 on 2026-10-18 20:46
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+FTS_TABLE = 'bank_transactionsearch_fts'
+
+
+def create_text_index(apps, schema_editor):
+    connection = schema_editor.connection
+    if connection.vendor == 'postgresql':
+        schema_editor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+        schema_editor.execute('CREATE INDEX search_text_trgm_idx ON bank_transactionsearch USING gin (search_text gin_trgm_ops)')
+        return
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        cursor.execute('PRAGMA compile_options')
+        options = {row[0] for row in cursor.fetchall()}
+    # The trigram tokenizer (SQLite 3.34+) matches substrings, like the LIKE fallback does
+    if 'ENABLE_FTS5' not in options or connection.Database.sqlite_version_info < (3, 34):
+        return
+    for statement in (
+        f"CREATE VIRTUAL TABLE {FTS_TABLE} USING fts5(search_text, content='bank_transactionsearch', "
+        f"content_rowid='transaction_id', tokenize='trigram')",
+        f'CREATE TRIGGER {FTS_TABLE}_insert AFTER INSERT ON bank_transactionsearch BEGIN '
+        f'INSERT INTO {FTS_TABLE}(rowid, search_text) VALUES (new.transaction_id, new.search_text); END',
+        f'CREATE TRIGGER {FTS_TABLE}_delete AFTER DELETE ON bank_transactionsearch BEGIN '
+        f"INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, search_text) VALUES ('delete', old.transaction_id, old.search_text); END",
+        f'CREATE TRIGGER {FTS_TABLE}_update AFTER UPDATE ON bank_transactionsearch BEGIN '
+        f"INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, search_text) VALUES ('delete', old.transaction_id, old.search_text); "
+        f'INSERT INTO {FTS_TABLE}(rowid, search_text) VALUES (new.transaction_id, new.search_text); END',
+    ):
+        schema_editor.execute(statement)
+
+
+def drop_text_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute('DROP INDEX IF EXISTS search_text_trgm_idx')
+    elif schema_editor.connection.vendor == 'sqlite':
+        for trigger in ('insert', 'delete', 'update'):
+            schema_editor.execute(f'DROP TRIGGER IF EXISTS {FTS_TABLE}_{trigger}')
+        schema_editor.execute(f'DROP TABLE IF EXISTS {FTS_TABLE}')
+
+
+def backfill(apps, schema_editor):
+    # Same derivation as bank.search.rebuild, against the historical models
+    Transaction = apps.get_model('bank', 'Transaction')
+    TransactionSearch = apps.get_model('bank', 'TransactionSearch')
+    Posting = apps.get_model('bank', 'Posting')
+    Account = apps.get_model('bank', 'Account')
+    ids = list(Transaction.objects.order_by('pk').values_list('pk', flat=True))
+    for start in range(0, len(ids), 5000):
+        rows = list(Transaction.objects.filter(pk__in=ids[start:start + 5000]))
+        journals = dict(Posting.objects.filter(transaction__in=rows, account__isnull=False).values_list('transaction_id', 'journal'))
+        counterparty = {}
+        for journal, account_id, transaction_id in (Posting.objects.filter(journal__in=journals.values(), account__isnull=False)
+                                                    .values_list('journal', 'account_id', 'transaction_id')):
+            counterparty.setdefault(journal, []).append((transaction_id, account_id))
+        accounts = {pk: (number, username) for pk, number, username in
+                    Account.objects.filter(pk__in={a for legs in counterparty.values() for _, a in legs})
+                    .values_list('pk', 'account_number', 'user__username')}
+        entries = []
+        for row in rows:
+            number, username = '', ''
+            for transaction_id, account_id in counterparty.get(journals.get(row.pk), []):
+                if transaction_id != row.pk:
+                    number, username = accounts[account_id]
+            entries.append(TransactionSearch(
+                transaction_id=row.pk, user_id=row.user_id, account_id=row.account_id,
+                transaction_type=row.transaction_type, amount=row.amount, date=row.date, status=row.status,
+                counterparty_account_number=number, counterparty_username=username, memo=row.memo,
+                search_text=' '.join(part for part in (number, username, row.memo) if part).lower(),
+            ))
+        TransactionSearch.objects.bulk_create(entries)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bank', '0013_pendingauthorization'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        # History filters moved to TransactionSearch
+        migrations.RemoveIndex(
+            model_name='transaction',
+            name='txn_user_date_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='transaction',
+            name='txn_user_type_date_idx',
+        ),
+        migrations.AddField(
+            model_name='transaction',
+            name='memo',
+            field=models.CharField(blank=True, default='', max_length=140),
+        ),
+        migrations.CreateModel(
+            name='TransactionSearch',
+            fields=[
+                ('transaction', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='search_entry', serialize=False, to='bank.transaction')),
+                ('transaction_type', models.CharField(choices=[('transfer', 'Transfer'), ('deposit', 'Deposit'), ('withdrawal', 'Withdrawal')], max_length=10)),
+                ('amount', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('date', models.DateTimeField()),
+                ('status', models.CharField(max_length=10)),
+                ('counterparty_account_number', models.CharField(blank=True, max_length=20)),
+                ('counterparty_username', models.CharField(blank=True, max_length=150)),
+                ('memo', models.CharField(blank=True, max_length=140)),
+                ('search_text', models.TextField(blank=True)),
+                ('account', models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, related_name='search_entries', to='bank.account')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['user', '-date', '-transaction', 'amount'], name='search_user_date_idx'), models.Index(fields=['user', 'transaction_type', '-date', '-transaction', 'amount'], name='search_user_type_date_idx')],
+            },
+        ),
+        migrations.RunPython(create_text_index, drop_text_index),
+        migrations.RunPython(backfill, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 5.2.18 on 2026-10-18 21:17
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bank', '0014_transactionsearch'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='transfer',
+            name='decision',
+            field=models.CharField(choices=[('allow', 'Allowed'), ('hold', 'Held for review'), ('block', 'Blocked')], default='allow', max_length=5),
+        ),
+        migrations.AddField(
+            model_name='transfer',
+            name='decision_reasons',
+            field=models.CharField(blank=True, max_length=255),
+        ),
+        migrations.AddIndex(
+            model_name='transfer',
+            index=models.Index(fields=['decision', '-timestamp'], name='transfer_review_idx'),
+        ),
+    ]
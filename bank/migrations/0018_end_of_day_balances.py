@@ -0,0 +1,65 @@
+# Generated by Django 5.2.18 on 2026-10-19 00:04
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bank', '0017_scheduledtransfer'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BalanceClose',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField(unique=True)),
+                ('accounts', models.PositiveIntegerField(default=0)),
+                ('closed_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='DailyBalance',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('balance', models.DecimalField(decimal_places=2, max_digits=14)),
+                ('posting_id', models.BigIntegerField()),
+            ],
+        ),
+        migrations.AddField(
+            model_name='account',
+            name='accrued_interest',
+            field=models.DecimalField(decimal_places=8, default=0, max_digits=16),
+        ),
+        migrations.AddField(
+            model_name='account',
+            name='interest_accrued_through',
+            field=models.DateField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='account',
+            name='interest_rate',
+            field=models.DecimalField(decimal_places=5, default=0, max_digits=7),
+        ),
+        migrations.AlterField(
+            model_name='posting',
+            name='external_ledger',
+            field=models.CharField(blank=True, choices=[('', 'Customer account'), ('cash', 'Cash'), ('opening', 'Opening balances'), ('interest', 'Interest expense')], default='', max_length=10),
+        ),
+        migrations.AddIndex(
+            model_name='posting',
+            index=models.Index(fields=['created_at'], name='posting_created_idx'),
+        ),
+        migrations.AddField(
+            model_name='dailybalance',
+            name='account',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_balances', to='bank.account'),
+        ),
+        migrations.AddConstraint(
+            model_name='dailybalance',
+            constraint=models.UniqueConstraint(fields=('account', 'date'), name='unique_daily_balance'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-19 00:31
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bank', '0018_end_of_day_balances'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='statement',
+            name='claimed_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
@@ -1,6 +1,7 @@
 from django.contrib.auth.models import User
 from django.db import models
 from django.core.mail import send_mail
+from django.utils import timezone
 
 class UserProfile(models.Model):
     user = models.OneToOneField(User, on_delete=models.CASCADE)
@@ -14,6 +15,37 @@ class Account(models.Model):
     daily_transaction_limit = models.DecimalField(max_digits=12, decimal_places=2, default=10000)  # Daily transaction limit
     transaction_count = models.PositiveIntegerField(default=0)  # Count of today's transactions
     max_transaction_count = models.PositiveIntegerField(default=5)  # Admin-set max number of transactions per day
+    is_frozen = models.BooleanField(default=False)  # Frozen accounts can still receive money but not send it
+    interest_rate = models.DecimalField(max_digits=7, decimal_places=5, default=0)  # Annual, e.g. 0.01500 for 1.5%
+    accrued_interest = models.DecimalField(max_digits=16, decimal_places=8, default=0)  # Accrued but not yet posted
+    interest_accrued_through = models.DateField(blank=True, null=True)  # Last day bank.interest accrued for
+
+class DailyUsage(models.Model):
+    # One row per account per day, so limits reset by date rather than a nightly sweep
+    account = models.ForeignKey(Account, related_name='daily_usage', on_delete=models.CASCADE)
+    date = models.DateField()
+    count = models.PositiveIntegerField(default=0)
+    total = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['account', 'date'], name='unique_daily_usage'),
+        ]
+
+class ExchangeRate(models.Model):
+    base_currency = models.CharField(max_length=3)
+    target_currency = models.CharField(max_length=3)
+    rate = models.DecimalField(max_digits=18, decimal_places=8)
+    fetched_at = models.DateTimeField()  # When the provider published this rate table
+    source = models.CharField(max_length=50)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['base_currency', 'target_currency', 'fetched_at'], name='unique_exchange_rate_snapshot'),
+        ]
+
+    def __str__(self):
+        return f"{self.base_currency}/{self.target_currency} {self.rate}"
 
 class Transaction(models.Model):
     TRANSACTION_TYPES = (
@@ -23,23 +55,289 @@ class Transaction(models.Model):
     )
 
     user = models.ForeignKey(User, on_delete=models.CASCADE)
+    account = models.ForeignKey(Account, related_name='transactions', on_delete=models.CASCADE, null=True)
     amount = models.DecimalField(max_digits=10, decimal_places=2)
     transaction_type = models.CharField(max_length=10, choices=TRANSACTION_TYPES)
     date = models.DateTimeField(auto_now_add=True)
     status = models.CharField(max_length=10, default='completed')
+    idempotency_key = models.CharField(max_length=64, blank=True, null=True)  # Client supplied key for retried POSTs
+    batch = models.ForeignKey('TransferBatch', related_name='transactions', on_delete=models.SET_NULL, blank=True, null=True)
+    exchange_rate = models.ForeignKey(ExchangeRate, on_delete=models.PROTECT, blank=True, null=True)  # Rate used for foreign currency transfers
+    memo = models.CharField(max_length=140, blank=True, default='')
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['account', 'idempotency_key'], name='unique_transaction_idempotency_key'),
+        ]
+        indexes = [
+            # Keyset pagination seeks on (date, id) within an account or user
+            models.Index(fields=['account', '-date', '-id'], name='txn_account_date_idx'),
+            # Admin changelist ordering and date hierarchy
+            models.Index(fields=['-date', '-id'], name='txn_date_idx'),
+        ]
 
     def __str__(self):
         return f"{self.user.username} - {self.transaction_type} - {self.amount}"
 
+class TransactionSearch(models.Model):
+    # Denormalized copy of each ledger row for transaction_history; see bank.search
+    transaction = models.OneToOneField(Transaction, related_name='search_entry', on_delete=models.CASCADE, primary_key=True)
+    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    account = models.ForeignKey(Account, related_name='search_entries', on_delete=models.CASCADE, null=True)
+    transaction_type = models.CharField(max_length=10, choices=Transaction.TRANSACTION_TYPES)
+    amount = models.DecimalField(max_digits=10, decimal_places=2)
+    date = models.DateTimeField()
+    status = models.CharField(max_length=10)
+    counterparty_account_number = models.CharField(max_length=20, blank=True)
+    counterparty_username = models.CharField(max_length=150, blank=True)
+    memo = models.CharField(max_length=140, blank=True)
+    search_text = models.TextField(blank=True)  # Lowercased counterparty and memo; indexed by FTS5 or pg_trgm
+
+    class Meta:
+        indexes = [
+            # TransactionFilterForm filters: date range seeks on the date column, amount
+            # range is checked inside the index, type has its own ordered index
+            models.Index(fields=['user', '-date', '-transaction', 'amount'], name='search_user_date_idx'),
+            models.Index(fields=['user', 'transaction_type', '-date', '-transaction', 'amount'], name='search_user_type_date_idx'),
+        ]
+
+class TransactionRollup(models.Model):
+    PERIODS = (
+        ('day', 'Day'),
+        ('month', 'Month'),
+    )
+
+    account = models.ForeignKey(Account, related_name='rollups', on_delete=models.CASCADE)
+    period = models.CharField(max_length=5, choices=PERIODS)
+    period_start = models.DateField()  # First day of the day/month bucket, in TIME_ZONE
+    transaction_type = models.CharField(max_length=10, choices=Transaction.TRANSACTION_TYPES)
+    count = models.PositiveIntegerField(default=0)
+    total = models.DecimalField(max_digits=16, decimal_places=2, default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['account', 'period', 'period_start', 'transaction_type'], name='unique_transaction_rollup'),
+        ]
+
+class Posting(models.Model):
+    # External side of postings that move money in or out of the bank
+    EXTERNAL_LEDGERS = (
+        ('', 'Customer account'),
+        ('cash', 'Cash'),
+        ('opening', 'Opening balances'),
+        ('interest', 'Interest expense'),
+    )
+
+    journal = models.UUIDField()  # Groups the legs of one entry; each journal sums to zero
+    account = models.ForeignKey(Account, related_name='postings', on_delete=models.PROTECT, blank=True, null=True)
+    external_ledger = models.CharField(max_length=10, choices=EXTERNAL_LEDGERS, blank=True, default='')
+    transaction = models.ForeignKey(Transaction, related_name='postings', on_delete=models.PROTECT, blank=True, null=True)
+    amount = models.DecimalField(max_digits=12, decimal_places=2)  # Positive credits the account, negative debits it
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['account', 'id'], name='posting_account_idx'),
+            models.Index(fields=['journal'], name='posting_journal_idx'),
+            # End-of-day close reads one day of postings at a time
+            models.Index(fields=['created_at'], name='posting_created_idx'),
+        ]
+
+    def save(self, *args, **kwargs):
+        if self.pk is not None:
+            raise ValueError('Postings are immutable; post a reversing entry instead.')
+        super().save(*args, **kwargs)
+
+    def delete(self, *args, **kwargs):
+        raise ValueError('Postings are immutable; post a reversing entry instead.')
+
+class BalanceSnapshot(models.Model):
+    account = models.ForeignKey(Account, related_name='balance_snapshots', on_delete=models.CASCADE)
+    posting_id = models.BigIntegerField()  # Includes every posting on the account up to this id
+    balance = models.DecimalField(max_digits=14, decimal_places=2)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['account', '-posting_id'], name='snapshot_latest_idx'),
+        ]
+
+class DailyBalance(models.Model):
+    # End-of-day ledger balance, one row per account per day with postings; see bank.eod
+    account = models.ForeignKey(Account, related_name='daily_balances', on_delete=models.CASCADE)
+    date = models.DateField()
+    balance = models.DecimalField(max_digits=14, decimal_places=2)
+    posting_id = models.BigIntegerField()  # Last posting included
+
+    class Meta:
+        constraints = [
+            # Also the index as_of seeks backwards on for an account's latest row
+            models.UniqueConstraint(fields=['account', 'date'], name='unique_daily_balance'),
+        ]
+
+class BalanceClose(models.Model):
+    # One row per closed day; days are closed in order
+    date = models.DateField(unique=True)
+    accounts = models.PositiveIntegerField(default=0)  # Accounts with postings that day
+    closed_at = models.DateTimeField(auto_now_add=True)
+
 class Transfer(models.Model):
+    DECISIONS = (
+        ('allow', 'Allowed'),
+        ('hold', 'Held for review'),
+        ('block', 'Blocked'),
+    )
+
     from_account = models.ForeignKey(Account, related_name='transfers_made', on_delete=models.CASCADE)
     to_account = models.ForeignKey(Account, related_name='transfers_received', on_delete=models.CASCADE)
     amount = models.DecimalField(max_digits=12, decimal_places=2)
     otp = models.CharField(max_length=6, blank=True, null=True)
     timestamp = models.DateTimeField(auto_now_add=True)
+    decision = models.CharField(max_length=5, choices=DECISIONS, default='allow')  # From bank.screening
+    decision_reasons = models.CharField(max_length=255, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['decision', '-timestamp'], name='transfer_review_idx'),
+            models.Index(fields=['-timestamp'], name='transfer_timestamp_idx'),
+        ]
+
+class PendingAuthorization(models.Model):
+    # Database store for transfer OTPs; see bank.authorizations
+    key = models.CharField(max_length=64, unique=True)  # Digest of user, payee and amount, so verification is one lookup
+    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    otp_hash = models.CharField(max_length=64)
+    attempts = models.PositiveIntegerField(default=0)
+    expires_at = models.DateTimeField(db_index=True)
 
 class Notification(models.Model):
+    DELIVERY_STATUSES = (
+        ('pending', 'Pending'),
+        ('sent', 'Sent'),
+        ('failed', 'Failed'),
+    )
+
     user = models.ForeignKey(User, on_delete=models.CASCADE)
     message = models.TextField()
     is_read = models.BooleanField(default=False)
     timestamp = models.DateTimeField(auto_now_add=True)
+    delivery_status = models.CharField(max_length=10, choices=DELIVERY_STATUSES, default='pending')
+    delivered_at = models.DateTimeField(blank=True, null=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', 'is_read', '-timestamp', '-id'], name='notification_inbox_idx'),
+            # Retention sweep over old read notifications
+            models.Index(fields=['is_read', 'timestamp'], name='notification_retention_idx'),
+        ]
+
+class OutboxMessage(models.Model):
+    CHANNELS = (
+        ('email', 'Email'),
+        ('sms', 'SMS'),
+    )
+    STATUSES = (
+        ('pending', 'Pending'),
+        ('sending', 'Sending'),
+        ('sent', 'Sent'),
+        ('failed', 'Failed'),
+    )
+
+    notification = models.ForeignKey(Notification, related_name='outbox_messages', on_delete=models.CASCADE, blank=True, null=True)
+    channel = models.CharField(max_length=5, choices=CHANNELS)
+    recipient = models.CharField(max_length=254)
+    subject = models.CharField(max_length=200, blank=True)
+    body = models.TextField()
+    status = models.CharField(max_length=10, choices=STATUSES, default='pending')
+    attempts = models.PositiveIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    claimed_at = models.DateTimeField(blank=True, null=True)  # When a worker took it; stale claims are re-queued
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(blank=True, null=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'next_attempt_at'], name='outbox_due_idx'),
+        ]
+
+class Statement(models.Model):
+    STATUSES = (
+        ('pending', 'Pending'),
+        ('running', 'Running'),
+        ('ready', 'Ready'),
+        ('failed', 'Failed'),
+    )
+
+    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    account = models.ForeignKey(Account, related_name='statements', on_delete=models.CASCADE)
+    period_start = models.DateField(blank=True, null=True)  # Null for a statement covering the whole history
+    period_end = models.DateField(blank=True, null=True)
+    status = models.CharField(max_length=10, choices=STATUSES, default='pending')
+    file_path = models.CharField(max_length=255, blank=True)
+    row_count = models.PositiveIntegerField(default=0)
+    error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    claimed_at = models.DateTimeField(blank=True, null=True)  # When a renderer took it; stale claims are re-queued
+    completed_at = models.DateTimeField(blank=True, null=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['account', 'period_start', 'period_end', 'status'], name='statement_period_idx'),
+            models.Index(fields=['status', 'created_at'], name='statement_queue_idx'),
+        ]
+
+class TransferBatch(models.Model):
+    STATUSES = (
+        ('pending', 'Pending'),
+        ('running', 'Running'),
+        ('completed', 'Completed'),
+        ('failed', 'Failed'),
+    )
+
+    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    from_account = models.ForeignKey(Account, related_name='transfer_batches', on_delete=models.CASCADE)
+    status = models.CharField(max_length=10, choices=STATUSES, default='pending')
+    total_items = models.PositiveIntegerField(default=0)
+    processed_items = models.PositiveIntegerField(default=0)  # Committed chunk by chunk, so a rerun resumes here
+    total_amount = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    completed_at = models.DateTimeField(blank=True, null=True)
+
+
+class ScheduledTransfer(models.Model):
+    FREQUENCIES = (
+        ('once', 'Once'),
+        ('daily', 'Daily'),
+        ('weekly', 'Weekly'),
+        ('monthly', 'Monthly'),
+    )
+    STATUSES = (
+        ('active', 'Active'),
+        ('running', 'Running'),  # Claimed by a scheduler
+        ('paused', 'Paused'),
+        ('completed', 'Completed'),
+        ('failed', 'Failed'),
+    )
+
+    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    from_account = models.ForeignKey(Account, related_name='scheduled_transfers', on_delete=models.CASCADE)
+    to_account = models.ForeignKey(Account, related_name='incoming_schedules', on_delete=models.CASCADE)
+    amount = models.DecimalField(max_digits=12, decimal_places=2)
+    memo = models.CharField(max_length=140, blank=True, default='')
+    frequency = models.CharField(max_length=10, choices=FREQUENCIES, default='monthly')
+    day_of_month = models.PositiveSmallIntegerField(blank=True, null=True)  # Monthly runs on this day, or the month's last
+    next_run_at = models.DateTimeField()
+    end_at = models.DateTimeField(blank=True, null=True)
+    status = models.CharField(max_length=10, choices=STATUSES, default='active')
+    claimed_at = models.DateTimeField(blank=True, null=True)
+    failures = models.PositiveIntegerField(default=0)  # Runs missed in a row
+    last_run_at = models.DateTimeField(blank=True, null=True)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'next_run_at'], name='schedule_due_idx'),
+        ]
@@ -0,0 +1,55 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+
+from .fragments import touch
+from .models import Notification
+from .pagination import paginate
+
+
+def _unread_key(user_id):
+    return f'bank:notifications:unread:{user_id}'
+
+
+def unread_count(user):
+    key = _unread_key(user.pk)
+    count = cache.get(key)
+    if count is None:
+        count = Notification.objects.filter(user=user, is_read=False).count()
+        cache.set(key, count, getattr(settings, 'BANK_UNREAD_COUNT_TTL', 300))
+    return count
+
+
+def invalidate_unread_count(user_ids):
+    cache.delete_many([_unread_key(user_id) for user_id in user_ids])
+
+
+def unread_page(user, cursor=None, page_size=25):
+    return paginate(Notification.objects.filter(user=user, is_read=False), cursor=cursor, page_size=page_size,
+                    date_field='timestamp')
+
+
+def mark_read(user, notifications):
+    """Mark exactly ``notifications`` read with one UPDATE."""
+    ids = [notification.pk for notification in notifications]
+    if not ids:
+        return 0
+    updated = Notification.objects.filter(user=user, pk__in=ids, is_read=False).update(is_read=True)
+    if updated:
+        invalidate_unread_count([user.pk])
+        touch([user.pk])
+    return updated
+
+
+def purge_read(older_than_days=90, batch_size=5000):
+    """Delete read notifications older than the cutoff, one bounded batch per statement."""
+    cutoff = timezone.now() - timedelta(days=older_than_days)
+    deleted = 0
+    while True:
+        ids = list(Notification.objects.filter(is_read=True, timestamp__lt=cutoff)
+                   .values_list('pk', flat=True)[:batch_size])
+        if not ids:
+            return deleted
+        deleted += Notification.objects.filter(pk__in=ids).delete()[1].get('bank.Notification', 0)
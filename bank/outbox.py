@@ -0,0 +1,193 @@
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection, send_mail
+from django.db import connection, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from . import events
+from .instrumentation import external_call
+from .models import Notification, OutboxMessage, UserProfile
+from .notifications import invalidate_unread_count
+from .utils import get_sms_client, send_sms
+
+logger = logging.getLogger(__name__)
+
+FROM_EMAIL = 'noreply@bankapp.com'
+
+
+def outbox_enabled():
+    return getattr(settings, 'BANK_OUTBOX_ENABLED', True)
+
+
+def enqueue_email(recipient, subject, body, notification=None):
+    if not recipient:
+        return None
+    if not outbox_enabled():
+        with external_call('smtp'):
+            send_mail(subject, body, FROM_EMAIL, [recipient], fail_silently=False)
+        return None
+    return OutboxMessage.objects.create(notification=notification, channel='email', recipient=recipient,
+                                        subject=subject, body=body)
+
+
+def enqueue_sms(recipient, body, notification=None):
+    if not recipient:
+        return None
+    if not outbox_enabled():
+        send_sms(recipient, body)
+        return None
+    return OutboxMessage.objects.create(notification=notification, channel='sms', recipient=recipient, body=body)
+
+
+def notify_user(user, message, subject='Transaction Alert'):
+    """Create a ``Notification`` and queue its email/SMS delivery.
+
+    Call inside the same ``transaction.atomic()`` block as the ledger write so
+    the alert is only sent for postings that actually commit.
+    """
+    notification = Notification.objects.create(user=user, message=message)
+    transaction.on_commit(lambda: invalidate_unread_count([user.pk]))
+    events.publish_on_commit(user.pk, 'notification', {'id': notification.pk, 'message': message})
+    enqueue_email(user.email, subject, message, notification=notification)
+    phone_number = UserProfile.objects.filter(user=user).values_list('phone_number', flat=True).first()
+    enqueue_sms(phone_number, message, notification=notification)
+    if not outbox_enabled():
+        Notification.objects.filter(pk=notification.pk).update(delivery_status='sent', delivered_at=timezone.now())
+    return notification
+
+
+def release_stale(now=None):
+    """Put messages claimed by a worker that died before recording them back in the queue."""
+    cutoff = (now or timezone.now()) - timedelta(seconds=getattr(settings, 'BANK_OUTBOX_CLAIM_TIMEOUT', 300))
+    return (OutboxMessage.objects.filter(Q(claimed_at__lt=cutoff) | Q(claimed_at__isnull=True), status='sending')
+            .update(status='pending', claimed_at=None))
+
+
+class OutboxWorker:
+    """Drains pending ``OutboxMessage`` rows in batches across a thread pool.
+
+    Each thread keeps one SMTP connection open for its lifetime and all
+    threads share a single SMS client.
+    """
+
+    def __init__(self, batch_size=100, workers=4, max_attempts=None, backoff=None, sms_client=None):
+        self.batch_size = batch_size
+        self.workers = workers
+        self.max_attempts = max_attempts or getattr(settings, 'BANK_OUTBOX_MAX_ATTEMPTS', 5)
+        self.backoff = backoff if backoff is not None else getattr(settings, 'BANK_OUTBOX_RETRY_BACKOFF', 30)
+        self.sms_client = sms_client
+        self._local = threading.local()
+        self._connections = []
+        self._lock = threading.Lock()
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='outbox')
+
+    def _claim(self):
+        now = timezone.now()
+        release_stale(now)
+        due = OutboxMessage.objects.filter(status='pending', next_attempt_at__lte=now).order_by('next_attempt_at')
+        with transaction.atomic():
+            if connection.features.has_select_for_update_skip_locked:
+                due = due.select_for_update(skip_locked=True)
+            ids = list(due.values_list('pk', flat=True)[:self.batch_size * self.workers])
+            # Without skip-locked another worker may have read the same ids; keep only the rows this update took
+            OutboxMessage.objects.filter(pk__in=ids, status='pending').update(status='sending', claimed_at=now)
+        return list(OutboxMessage.objects.filter(pk__in=ids, status='sending', claimed_at=now))
+
+    def _email_connection(self):
+        conn = getattr(self._local, 'connection', None)
+        if conn is None:
+            conn = get_connection(fail_silently=False)
+            conn.open()
+            self._local.connection = conn
+            with self._lock:
+                self._connections.append(conn)
+        return conn
+
+    def _send_batch(self, batch):
+        """Send ``batch`` one message at a time; returns it with ``{pk: error}`` for the messages that failed."""
+        channel = batch[0].channel
+        errors = {}
+        if channel == 'email':
+            for i, message in enumerate(batch):
+                try:
+                    with external_call('smtp'):
+                        self._email_connection().send_messages(
+                            [EmailMessage(message.subject, message.body, FROM_EMAIL, [message.recipient])])
+                except Exception as e:
+                    # Drop the connection so the next batch reconnects; the rest of this one is retried later
+                    self._local.connection = None
+                    errors = {m.pk: str(e) for m in batch[i:]}
+                    break
+        else:
+            client = self.sms_client or get_sms_client()
+            for message in batch:
+                try:
+                    send_sms(message.recipient, message.body, client=client)
+                except Exception as e:
+                    errors[message.pk] = str(e)
+        if errors:
+            logger.warning('Outbox %s batch: %d of %d failed: %s', channel, len(errors), len(batch),
+                           next(iter(errors.values())))
+        return batch, errors
+
+    def _record(self, batch, errors):
+        now = timezone.now()
+        sent = [m.pk for m in batch if m.pk not in errors]
+        OutboxMessage.objects.filter(pk__in=sent).update(status='sent', sent_at=now, last_error='', claimed_at=None)
+        failed = [m for m in batch if m.pk in errors]
+        for message in failed:
+            message.attempts += 1
+            message.last_error = errors[message.pk]
+            message.claimed_at = None
+            if message.attempts >= self.max_attempts:
+                message.status = 'failed'
+            else:
+                message.status = 'pending'
+                message.next_attempt_at = now + timedelta(seconds=self.backoff * 2 ** (message.attempts - 1))
+        OutboxMessage.objects.bulk_update(failed, ['attempts', 'last_error', 'status', 'next_attempt_at', 'claimed_at'])
+
+    def _update_notifications(self, notification_ids):
+        if not notification_ids:
+            return
+        # A notification is delivered once every channel has gone out, failed if any channel gave up
+        failed = set(OutboxMessage.objects.filter(notification_id__in=notification_ids, status='failed')
+                     .values_list('notification_id', flat=True))
+        open_ids = set(OutboxMessage.objects.filter(notification_id__in=notification_ids, status__in=['pending', 'sending'])
+                       .values_list('notification_id', flat=True))
+        Notification.objects.filter(pk__in=failed).update(delivery_status='failed')
+        Notification.objects.filter(pk__in=set(notification_ids) - failed - open_ids).update(
+            delivery_status='sent', delivered_at=timezone.now())
+
+    def drain_once(self):
+        messages = self._claim()
+        if not messages:
+            return 0
+        batches = []
+        for channel in ('email', 'sms'):
+            channel_messages = [m for m in messages if m.channel == channel]
+            batches += [channel_messages[i:i + self.batch_size] for i in range(0, len(channel_messages), self.batch_size)]
+
+        results = list(self._pool.map(self._send_batch, batches))
+        for batch, errors in results:
+            self._record(batch, errors)
+        self._update_notifications({m.notification_id for m in messages if m.notification_id})
+        return len(messages)
+
+    def drain(self):
+        total = 0
+        while True:
+            sent = self.drain_once()
+            if not sent:
+                return total
+            total += sent
+
+    def close(self):
+        self._pool.shutdown()
+        for conn in self._connections:
+            conn.close()
+        self._connections = []
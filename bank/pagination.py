@@ -0,0 +1,62 @@
+import base64
+from datetime import datetime
+
+from django.db.models import Q
+
+
+class InvalidCursor(Exception):
+    pass
+
+
+class KeysetPage:
+    def __init__(self, items, next_cursor, page_size):
+        self.items = items
+        self.next_cursor = next_cursor
+        self.page_size = page_size
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def __iter__(self):
+        return iter(self.items)
+
+    def __len__(self):
+        return len(self.items)
+
+
+def encode_cursor(date, pk):
+    return base64.urlsafe_b64encode(f'{date.isoformat()}|{pk}'.encode()).decode()
+
+
+def decode_cursor(cursor):
+    try:
+        date, pk = base64.urlsafe_b64decode(cursor.encode()).decode().split('|')
+        return datetime.fromisoformat(date), int(pk)
+    except (ValueError, UnicodeDecodeError) as e:
+        raise InvalidCursor(cursor) from e
+
+
+def paginate(queryset, cursor=None, page_size=25, date_field='date'):
+    """Return one page of ``queryset`` ordered newest first on ``(date, pk)``.
+
+    Seeking past the cursor instead of using ``OFFSET`` keeps deep pages as
+    cheap as the first one, provided an index leads with the filter columns
+    followed by ``date`` and the primary key.
+    """
+    if page_size < 1:
+        raise ValueError(f'page_size must be at least 1, not {page_size}')
+    queryset = queryset.order_by(f'-{date_field}', '-pk')
+    if cursor:
+        date, pk = decode_cursor(cursor)
+        # The redundant upper bound on date gives the planner an index range to seek into
+        queryset = queryset.filter(**{f'{date_field}__lte': date}).filter(
+            Q(**{f'{date_field}__lt': date}) | Q(pk__lt=pk))
+
+    items = list(queryset[:page_size + 1])
+    next_cursor = None
+    if len(items) > page_size:
+        items = items[:page_size]
+        last = items[-1]
+        next_cursor = encode_cursor(getattr(last, date_field), last.pk)
+    return KeysetPage(items, next_cursor, page_size)
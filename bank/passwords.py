@@ -0,0 +1,85 @@
+"""Password hashing off the request thread; imported by settings, so no model imports here.
+
+With BANK_PASSWORD_HASH_WORKERS set, password checks and new hashes run in a
+pool of processes instead of the request thread. Passwords stored with an
+older hasher are rehashed with the first of PASSWORD_HASHERS when their
+owner next logs in.
+"""
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+
+from django.conf import settings
+from django.contrib.auth import hashers
+from django.test.signals import setting_changed
+
+HASHERS = {
+    'pbkdf2': 'django.contrib.auth.hashers.PBKDF2PasswordHasher',
+    'argon2': 'django.contrib.auth.hashers.Argon2PasswordHasher',  # needs argon2-cffi
+    'bcrypt': 'django.contrib.auth.hashers.BCryptSHA256PasswordHasher',  # needs bcrypt
+    'scrypt': 'django.contrib.auth.hashers.ScryptPasswordHasher',
+}
+
+
+def password_hashers(preferred):
+    """PASSWORD_HASHERS with ``preferred`` first; the others stay so existing hashes still verify."""
+    if preferred not in HASHERS:
+        raise ValueError(f'Unknown password hasher {preferred!r}')
+    return [HASHERS[preferred]] + [path for name, path in HASHERS.items() if name != preferred]
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def _init_worker():
+    import django
+    django.setup()
+
+
+def hash_pool():
+    global _pool
+    workers = getattr(settings, 'BANK_PASSWORD_HASH_WORKERS', 0)
+    if not workers:
+        return None
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                # Spawned rather than forked: forking a threaded server can copy a held lock into the child
+                _pool = ProcessPoolExecutor(max_workers=workers, mp_context=get_context('spawn'),
+                                            initializer=_init_worker)
+    return _pool
+
+
+def _reset_pool(setting, **kwargs):
+    global _pool
+    if setting == 'BANK_PASSWORD_HASH_WORKERS' and _pool is not None:
+        _pool.shutdown()
+        _pool = None
+
+
+setting_changed.connect(_reset_pool)
+
+
+def _run(func, *args):
+    pool = hash_pool()
+    return func(*args) if pool is None else pool.submit(func, *args).result()
+
+
+def _verify(password, encoded):
+    """``(matches, new hash or None)``; the new hash is set when ``encoded`` uses an outdated hasher."""
+    outdated = []
+    matches = hashers.check_password(password, encoded, setter=outdated.append)
+    return matches, hashers.make_password(password) if outdated else None
+
+
+def make_password(password):
+    return _run(hashers.make_password, password)
+
+
+def check_password(user, password):
+    matches, rehashed = _run(_verify, password, user.password)
+    if rehashed:
+        user.password = rehashed
+        user.save(update_fields=['password'])
+    return matches
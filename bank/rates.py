@@ -0,0 +1,300 @@
+import asyncio
+import logging
+import threading
+import time
+import weakref
+from collections import namedtuple
+from datetime import datetime, timezone as dt_timezone
+from decimal import Decimal
+
+import aiohttp
+import requests
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.module_loading import import_string
+
+from .instrumentation import external_call
+from .models import ExchangeRate
+
+logger = logging.getLogger(__name__)
+
+Quote = namedtuple('Quote', ['base_currency', 'target_currency', 'rate', 'fetched_at', 'source'])
+
+
+class RateUnavailable(Exception):
+    pass
+
+
+class CircuitOpen(RateUnavailable):
+    pass
+
+
+class RateProvider:
+    name = 'base'
+
+    def fetch(self, base_currency):
+        """Return ``(rates, fetched_at)`` for every currency quoted against ``base_currency``."""
+        raise NotImplementedError
+
+    async def afetch(self, base_currency):
+        # Providers without a native async client fetch in a worker thread
+        return await sync_to_async(self.fetch, thread_sensitive=False)(base_currency)
+
+
+class ExchangeRateAPIProvider(RateProvider):
+    name = 'exchangerate-api'
+    url = 'https://api.exchangerate-api.com/v4/latest/{base}'
+
+    def __init__(self, timeout=None):
+        self.timeout = timeout or getattr(settings, 'BANK_FX_TIMEOUT', (2, 3))
+        # Persistent session so TLS connections to the API are reused
+        self.session = requests.Session()
+        self._async_sessions = weakref.WeakKeyDictionary()
+
+    def fetch(self, base_currency):
+        response = self.session.get(self.url.format(base=base_currency), timeout=self.timeout)
+        response.raise_for_status()
+        return self._parse(response.json())
+
+    def _parse(self, payload):
+        fetched_at = datetime.fromtimestamp(payload.get('time_last_updated', time.time()), tz=dt_timezone.utc)
+        return payload.get('rates', {}), fetched_at
+
+    def _async_session(self):
+        # aiohttp sessions belong to one event loop; keep one per loop so connections are reused
+        loop = asyncio.get_running_loop()
+        session = self._async_sessions.get(loop)
+        if session is None or session.closed:
+            connect, read = self.timeout if isinstance(self.timeout, tuple) else (self.timeout, self.timeout)
+            session = aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(connect=connect, sock_read=read))
+            self._async_sessions[loop] = session
+        return session
+
+    async def afetch(self, base_currency):
+        try:
+            async with self._async_session().get(self.url.format(base=base_currency)) as response:
+                response.raise_for_status()
+                return self._parse(await response.json())
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            raise requests.ConnectionError(str(e)) from e
+
+
+class FakeRateProvider(RateProvider):
+    """Serves a fixed rate table locally; used by tests and benchmarks."""
+
+    name = 'fake'
+
+    def __init__(self, rates=None, latency=0, fail=False):
+        self.rates = rates or {'USD': 1, 'EUR': 0.9, 'GBP': 0.8, 'NGN': 1500}
+        self.latency = latency
+        self.fail = fail
+        self.calls = 0
+
+    def fetch(self, base_currency):
+        self.calls += 1
+        time.sleep(self.latency)
+        if self.fail:
+            raise requests.ConnectionError('fake provider is down')
+        return self._table(base_currency)
+
+    async def afetch(self, base_currency):
+        self.calls += 1
+        await asyncio.sleep(self.latency)
+        if self.fail:
+            raise requests.ConnectionError('fake provider is down')
+        return self._table(base_currency)
+
+    def _table(self, base_currency):
+        base_rate = self.rates[base_currency]
+        rates = {currency: rate / base_rate for currency, rate in self.rates.items()}
+        return rates, datetime.now(dt_timezone.utc).replace(microsecond=0)
+
+
+class CircuitBreaker:
+    def __init__(self, failure_threshold=3, reset_timeout=30):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self._lock = threading.Lock()
+
+    def _before_call(self):
+        with self._lock:
+            if self.opened_at is not None:
+                if time.monotonic() - self.opened_at < self.reset_timeout:
+                    raise CircuitOpen('Exchange rate provider circuit is open')
+                # Half open: let this call through as a probe
+                self.opened_at = None
+
+    def _record(self, failed):
+        with self._lock:
+            if not failed:
+                self.failures = 0
+                return
+            self.failures += 1
+            if self.failures >= self.failure_threshold:
+                self.opened_at = time.monotonic()
+
+    def call(self, func, *args):
+        self._before_call()
+        try:
+            result = func(*args)
+        except Exception:
+            self._record(failed=True)
+            raise
+        self._record(failed=False)
+        return result
+
+    async def acall(self, func, *args):
+        self._before_call()
+        try:
+            result = await func(*args)
+        except Exception:
+            self._record(failed=True)
+            raise
+        self._record(failed=False)
+        return result
+
+
+class RateService:
+    """Caches full rate tables per base currency in-process and in Django's cache.
+
+    Fresh tables are served from memory; once a table is older than ``ttl``
+    it is still served while a background thread refreshes it. If the
+    provider fails or the circuit is open, the last known table is used.
+    """
+
+    cache_prefix = 'bank:fx:'
+
+    def __init__(self, provider=None, ttl=None, shared_cache=cache):
+        self.provider = provider or import_string(getattr(settings, 'BANK_FX_PROVIDER', 'bank.rates.ExchangeRateAPIProvider'))()
+        self.ttl = ttl if ttl is not None else getattr(settings, 'BANK_FX_TTL', 300)
+        self.shared_cache = shared_cache
+        self.breaker = CircuitBreaker(
+            failure_threshold=getattr(settings, 'BANK_FX_FAILURE_THRESHOLD', 3),
+            reset_timeout=getattr(settings, 'BANK_FX_RESET_TIMEOUT', 30),
+        )
+        self._tables = {}
+        self._refreshing = set()
+        self._lock = threading.Lock()
+
+    def _is_fresh(self, entry):
+        return time.time() - entry['loaded_at'] < self.ttl
+
+    def _store(self, base_currency, rates, fetched_at):
+        entry = {'rates': rates, 'fetched_at': fetched_at, 'loaded_at': time.time()}
+        self._tables[base_currency] = entry
+        # No expiry on the shared copy: it doubles as the last known table for fallback
+        self.shared_cache.set(self.cache_prefix + base_currency, entry, timeout=None)
+        return entry
+
+    def _fetch(self, base_currency):
+        with external_call('fx'):
+            rates, fetched_at = self.breaker.call(self.provider.fetch, base_currency)
+        return self._store(base_currency, rates, fetched_at)
+
+    async def _afetch(self, base_currency):
+        with external_call('fx'):
+            rates, fetched_at = await self.breaker.acall(self.provider.afetch, base_currency)
+        return self._store(base_currency, rates, fetched_at)
+
+    def _refresh_in_background(self, base_currency):
+        with self._lock:
+            if base_currency in self._refreshing:
+                return
+            self._refreshing.add(base_currency)
+
+        def run():
+            try:
+                self._fetch(base_currency)
+            except Exception as e:
+                logger.warning('Background refresh of %s rates failed: %s', base_currency, e)
+            finally:
+                with self._lock:
+                    self._refreshing.discard(base_currency)
+
+        threading.Thread(target=run, daemon=True).start()
+
+    def _known(self, entry, base_currency):
+        if entry is not None:
+            self._tables[base_currency] = entry
+            if not self._is_fresh(entry):
+                self._refresh_in_background(base_currency)
+        return entry
+
+    def get_rates(self, base_currency):
+        entry = self._known(self._tables.get(base_currency) or self.shared_cache.get(self.cache_prefix + base_currency),
+                            base_currency)
+        if entry is not None:
+            return entry
+        try:
+            return self._fetch(base_currency)
+        except Exception as e:
+            raise RateUnavailable(f'No exchange rates available for {base_currency}') from e
+
+    async def aget_rates(self, base_currency):
+        """``get_rates`` for async views: cold tables are fetched without blocking the event loop."""
+        entry = self._tables.get(base_currency) or await self.shared_cache.aget(self.cache_prefix + base_currency)
+        entry = self._known(entry, base_currency)
+        if entry is not None:
+            return entry
+        try:
+            return await self._afetch(base_currency)
+        except Exception as e:
+            raise RateUnavailable(f'No exchange rates available for {base_currency}') from e
+
+    def _quote(self, entry, base_currency, target_currency):
+        if target_currency not in entry['rates']:
+            raise RateUnavailable(f'No {base_currency}/{target_currency} rate')
+        rate = Decimal(str(entry['rates'][target_currency]))
+        return Quote(base_currency, target_currency, rate, entry['fetched_at'], self.provider.name)
+
+    def get_quote(self, base_currency, target_currency):
+        if base_currency == target_currency:
+            return Quote(base_currency, target_currency, Decimal(1), None, self.provider.name)
+        return self._quote(self.get_rates(base_currency), base_currency, target_currency)
+
+    async def aget_quote(self, base_currency, target_currency):
+        if base_currency == target_currency:
+            return Quote(base_currency, target_currency, Decimal(1), None, self.provider.name)
+        return self._quote(await self.aget_rates(base_currency), base_currency, target_currency)
+
+    def clear(self):
+        self._tables.clear()
+
+
+def to_base(amount, quote):
+    """``amount`` in the quote's target currency, converted to its base currency to the cent."""
+    return (Decimal(str(amount)) / quote.rate).quantize(Decimal('0.01'))
+
+
+def snapshot(quote):
+    """Persist ``quote`` so a transfer can reference the exact rate it used."""
+    if quote.fetched_at is None:
+        return None
+    exchange_rate, _ = ExchangeRate.objects.get_or_create(
+        base_currency=quote.base_currency,
+        target_currency=quote.target_currency,
+        fetched_at=quote.fetched_at,
+        defaults={'rate': quote.rate, 'source': quote.source},
+    )
+    return exchange_rate
+
+
+_service = None
+_service_lock = threading.Lock()
+
+
+def get_rate_service():
+    global _service
+    if _service is None:
+        with _service_lock:
+            if _service is None:
+                _service = RateService()
+    return _service
+
+
+def set_rate_service(service):
+    global _service
+    _service = service
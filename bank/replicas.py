@@ -0,0 +1,120 @@
+import contextvars
+import functools
+import random
+import threading
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, connections
+from django.utils.connection import ConnectionDoesNotExist
+
+PIN_SESSION_KEY = 'bank_primary_until'
+
+_replica = contextvars.ContextVar('bank_read_replica', default=None)
+_lag_lock = threading.Lock()
+_lag_checked = {}
+
+
+class ReplicaRouter:
+    """Sends reads to the replica chosen by ``read_replica``; everything else goes to the primary."""
+
+    def db_for_read(self, model, **hints):
+        alias = _replica.get()
+        # Reads inside a write transaction must see its uncommitted rows
+        if alias is None or connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return None
+        return alias
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold the same rows as the primary
+        return True
+
+
+@contextmanager
+def use_replica(alias):
+    token = _replica.set(alias)
+    try:
+        yield
+    finally:
+        _replica.reset(token)
+
+
+def pin_to_primary(request, seconds=None):
+    """Read this session's own writes: skip replicas for the next few seconds."""
+    seconds = seconds if seconds is not None else getattr(settings, 'BANK_REPLICA_STICKY_SECONDS', 5)
+    request.session[PIN_SESSION_KEY] = time.time() + seconds
+
+
+def is_pinned(request):
+    session = getattr(request, 'session', None)
+    return session is not None and session.get(PIN_SESSION_KEY, 0) > time.time()
+
+
+def replica_lag(alias):
+    """Seconds ``alias`` trails the primary, judged by the newest ledger posting on each."""
+    from .models import Posting
+
+    if connections[alias].vendor == 'postgresql':
+        with connections[alias].cursor() as cursor:
+            cursor.execute('SELECT COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0)')
+            return float(cursor.fetchone()[0])
+    latest = Posting.objects.order_by('-id').values_list('created_at', flat=True)
+    primary = latest.using(DEFAULT_DB_ALIAS).first()
+    if primary is None:
+        return 0
+    replica = latest.using(alias).first()
+    if replica is None:
+        return float('inf')
+    return max((primary - replica).total_seconds(), 0)
+
+
+def _healthy(alias):
+    # Probe at most once per interval per process
+    interval = getattr(settings, 'BANK_REPLICA_LAG_CHECK_INTERVAL', 1)
+    with _lag_lock:
+        checked_at, healthy = _lag_checked.get(alias, (0, False))
+        if time.monotonic() - checked_at < interval:
+            return healthy
+    try:
+        healthy = replica_lag(alias) <= getattr(settings, 'BANK_REPLICA_MAX_LAG', 5)
+    except (DatabaseError, ConnectionDoesNotExist):
+        healthy = False
+    with _lag_lock:
+        _lag_checked[alias] = (time.monotonic(), healthy)
+    return healthy
+
+
+def reset_health():
+    with _lag_lock:
+        _lag_checked.clear()
+
+
+def choose_replica(request):
+    """A healthy replica alias for ``request``, or None to read from the primary."""
+    if is_pinned(request):
+        return None
+    healthy = [alias for alias in getattr(settings, 'BANK_READ_REPLICAS', []) if _healthy(alias)]
+    return random.choice(healthy) if healthy else None
+
+
+def _streamed(content, alias):
+    with use_replica(alias):
+        yield from content
+
+
+def read_replica(view):
+    """Serve the view's reads from a replica unless the user just wrote or replicas are lagging."""
+    @functools.wraps(view)
+    def wrapped(request, *args, **kwargs):
+        alias = choose_replica(request)
+        with use_replica(alias):
+            response = view(request, *args, **kwargs)
+        if alias and getattr(response, 'streaming', False):
+            # Streamed querysets are evaluated after the view returns
+            response.streaming_content = _streamed(response.streaming_content, alias)
+        return response
+    return wrapped
@@ -0,0 +1,142 @@
+from collections import defaultdict
+from datetime import date
+from decimal import Decimal
+
+from django.db import IntegrityError, connection, transaction
+from django.db.models import Count, F, Sum
+from django.db.models.functions import TruncDay, TruncMonth
+from django.utils import timezone
+
+from .models import Account, Transaction, TransactionRollup
+from .utils import batched
+
+SPENDING_TYPES = ('transfer', 'withdrawal')
+
+
+def _buckets(when):
+    day = timezone.localdate(when) if timezone.is_aware(when) else when.date()
+    return (('day', day), ('month', day.replace(day=1)))
+
+
+def _increment(ids, deltas):
+    # Relative updates are safe against concurrent writers. One prepared statement is run per bucket, because
+    # a CASE over hundreds of buckets costs more to build in the ORM than the updates themselves
+    table = connection.ops.quote_name(TransactionRollup._meta.db_table)
+    count, total = connection.ops.quote_name('count'), connection.ops.quote_name('total')
+    with connection.cursor() as cursor:
+        cursor.executemany(f'UPDATE {table} SET {count} = {count} + %s, {total} = {total} + %s WHERE id = %s',
+                           [(deltas[key][0], deltas[key][1], pk) for pk, key in ids.items()])
+
+
+def _upsert_one(key, count, total):
+    fields = dict(zip(('account_id', 'period', 'period_start', 'transaction_type'), key))
+    if TransactionRollup.objects.filter(**fields).update(count=F('count') + count, total=F('total') + total):
+        return
+    try:
+        with transaction.atomic():
+            TransactionRollup.objects.create(count=count, total=total, **fields)
+    except IntegrityError:
+        # Another writer created the bucket first
+        TransactionRollup.objects.filter(**fields).update(count=F('count') + count, total=F('total') + total)
+
+
+def record_transactions(rows):
+    """Fold freshly written ledger rows into the day and month rollups.
+
+    Must run inside the transaction that wrote ``rows`` so the aggregates
+    commit or roll back with the ledger.
+    """
+    deltas = defaultdict(lambda: [0, Decimal(0)])
+    for row in rows:
+        for period, period_start in _buckets(row.date):
+            delta = deltas[(row.account_id, period, period_start, row.transaction_type)]
+            delta[0] += 1
+            delta[1] += Decimal(row.amount)
+    if not deltas:
+        return
+
+    existing = {}
+    for pk, *key in (TransactionRollup.objects
+                     .filter(account_id__in={key[0] for key in deltas}, period_start__in={key[2] for key in deltas})
+                     .values_list('pk', 'account_id', 'period', 'period_start', 'transaction_type')):
+        if tuple(key) in deltas:
+            existing[pk] = tuple(key)
+    _increment(existing, deltas)
+
+    known = set(existing.values())
+    missing = [key for key in deltas if key not in known]
+    try:
+        with transaction.atomic():
+            TransactionRollup.objects.bulk_create([
+                TransactionRollup(account_id=key[0], period=key[1], period_start=key[2], transaction_type=key[3],
+                                  count=deltas[key][0], total=deltas[key][1])
+                for key in missing
+            ])
+    except IntegrityError:
+        # A concurrent writer created some of these buckets; fall back to one upsert each
+        for key in missing:
+            _upsert_one(key, *deltas[key])
+
+
+def rebuild(accounts=None, batch_size=500):
+    """Recompute rollups from the ledger, a batch of accounts per transaction.
+
+    Each batch's accounts are locked before their rows are read, so a transfer
+    posting to one of them waits for the rebuild instead of being overwritten.
+    """
+    account_ids = accounts if accounts is not None else Account.objects.values_list('pk', flat=True).iterator()
+    rebuilt = 0
+    for batch in batched(account_ids, batch_size):
+        with transaction.atomic():
+            # Same lock order as transfers.py
+            list(Account.objects.select_for_update().filter(pk__in=batch).order_by('pk').values_list('pk'))
+            rollups = []
+            for period, trunc in (('day', TruncDay), ('month', TruncMonth)):
+                aggregates = (Transaction.objects
+                              .filter(account_id__in=batch)
+                              .annotate(period_start=trunc('date'))
+                              .values('account_id', 'period_start', 'transaction_type')
+                              .annotate(count=Count('id'), total=Sum('amount'))
+                              .order_by())
+                rollups += [
+                    TransactionRollup(account_id=row['account_id'], period=period,
+                                      period_start=row['period_start'].date(),
+                                      transaction_type=row['transaction_type'], count=row['count'], total=row['total'])
+                    for row in aggregates
+                ]
+            TransactionRollup.objects.filter(account_id__in=batch).delete()
+            TransactionRollup.objects.bulk_create(rollups, batch_size=1000)
+        rebuilt += len(rollups)
+    return rebuilt
+
+
+def _last_months(months, today=None):
+    today = today or timezone.localdate()
+    year, month = today.year, today.month
+    starts = []
+    for _ in range(months):
+        starts.append(date(year, month, 1))
+        year, month = (year, month - 1) if month > 1 else (year - 1, 12)
+    return starts[::-1]
+
+
+def monthly_summary(user, months=12, today=None):
+    """Chart data for ``user_analytics``: spending and income per month, from rollups only."""
+    starts = _last_months(months, today)
+    rows = (TransactionRollup.objects
+            .filter(account__user=user, period='month', period_start__gte=starts[0])
+            .values('period_start', 'transaction_type')
+            .annotate(total=Sum('total')))
+    spending = dict.fromkeys(starts, Decimal(0))
+    income = dict.fromkeys(starts, Decimal(0))
+    for row in rows:
+        target = spending if row['transaction_type'] in SPENDING_TYPES else income
+        if row['period_start'] in target:
+            target[row['period_start']] += row['total']
+    return {
+        'labels': [start.strftime('%b %Y') for start in starts],
+        'datasets': [
+            {'label': 'Spending', 'data': [float(spending[start]) for start in starts]},
+            {'label': 'Income', 'data': [float(income[start]) for start in starts]},
+        ],
+    }
@@ -0,0 +1,179 @@
+"""Standing orders: ``ScheduledTransfer`` rows executed by ``manage.py run_schedules``.
+
+Any number of schedulers, on any number of nodes, claim due rows in chunks
+(``FOR UPDATE SKIP LOCKED`` where the database has it) and mark them running.
+Each schedule then runs in its own transaction, together with the
+compare-and-set that moves ``next_run_at`` on, and with an idempotency key per
+occurrence so a run can never be posted twice. Claims left behind by a
+scheduler that died are released after BANK_SCHEDULE_CLAIM_TIMEOUT.
+"""
+import calendar
+import logging
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import DatabaseError, connection, transaction
+from django.utils import timezone
+
+from .limits import LimitExceeded
+from .models import ScheduledTransfer
+from .outbox import notify_user
+from .transfers import TransferError, keep_screening_decision, transfer_funds
+
+logger = logging.getLogger(__name__)
+
+
+class ScheduleConflict(Exception):
+    """Another scheduler moved the schedule on first; the run is rolled back."""
+
+
+def _step(schedule, run):
+    if schedule.frequency == 'daily':
+        return run + timedelta(days=1)
+    if schedule.frequency == 'weekly':
+        return run + timedelta(weeks=1)
+    local = timezone.localtime(run)
+    year, month = local.year + local.month // 12, local.month % 12 + 1
+    day = min(schedule.day_of_month or local.day, calendar.monthrange(year, month)[1])
+    return local.replace(year=year, month=month, day=day)
+
+
+def next_occurrence(schedule, after):
+    """The first run of ``schedule`` after ``after``, or None when there are no more.
+
+    Runs missed while no scheduler was running are skipped, not caught up.
+    """
+    if schedule.frequency == 'once':
+        return None
+    run = _step(schedule, schedule.next_run_at)
+    while run <= after:
+        run = _step(schedule, run)
+    if schedule.end_at and run > schedule.end_at:
+        return None
+    return run
+
+
+def release_stale(now=None):
+    cutoff = (now or timezone.now()) - timedelta(seconds=getattr(settings, 'BANK_SCHEDULE_CLAIM_TIMEOUT', 300))
+    return ScheduledTransfer.objects.filter(status='running', claimed_at__lt=cutoff).update(status='active',
+                                                                                           claimed_at=None)
+
+
+def claim_due(limit, now=None, exclude=()):
+    now = now or timezone.now()
+    due = (ScheduledTransfer.objects.filter(status='active', next_run_at__lte=now).exclude(pk__in=exclude)
+           .order_by('next_run_at'))
+    with transaction.atomic():
+        if connection.features.has_select_for_update_skip_locked:
+            due = due.select_for_update(skip_locked=True)
+        ids = list(due.values_list('pk', flat=True)[:limit])
+        ScheduledTransfer.objects.filter(pk__in=ids).update(status='running', claimed_at=now)
+    return list(ScheduledTransfer.objects.filter(pk__in=ids).select_related('user', 'from_account', 'to_account'))
+
+
+def _advance(schedule, occurrence, **changes):
+    updated = (ScheduledTransfer.objects.filter(pk=schedule.pk, status='running', next_run_at=occurrence)
+               .update(claimed_at=None, **changes))
+    if not updated:
+        raise ScheduleConflict(f'Scheduled transfer {schedule.pk} was already moved on')
+
+
+def run_schedule(schedule, now=None):
+    """Execute one claimed schedule and move it to its next run; returns 'ok' or 'failed'.
+
+    A run that fails (funds, limits, frozen account, screening) is skipped and
+    the owner notified; BANK_SCHEDULE_MAX_FAILURES misses in a row stop the schedule.
+    """
+    now = now or timezone.now()
+    occurrence = schedule.next_run_at
+    upcoming = next_occurrence(schedule, now)
+    try:
+        with transaction.atomic():
+            transfer_funds(schedule.from_account, schedule.to_account, schedule.amount, memo=schedule.memo,
+                           idempotency_key=f'schedule:{schedule.pk}:{occurrence:%Y%m%d%H%M%S}')
+            _advance(schedule, occurrence, next_run_at=upcoming or occurrence, last_run_at=now, failures=0,
+                     last_error='', status='active' if upcoming else 'completed')
+        return 'ok'
+    except (TransferError, LimitExceeded) as e:
+        failures = schedule.failures + 1
+        stopped = upcoming is None or failures >= getattr(settings, 'BANK_SCHEDULE_MAX_FAILURES', 3)
+        with transaction.atomic():
+            # The screening decision was rolled back with the run; keep it for review
+            keep_screening_decision(e)
+            _advance(schedule, occurrence, next_run_at=upcoming or occurrence, last_run_at=now, failures=failures,
+                     last_error=str(e), status='failed' if stopped else 'active')
+            notify_user(schedule.user, f'Your scheduled transfer of ${schedule.amount} to account '
+                                       f'{schedule.to_account.account_number} failed: {e}')
+        return 'failed'
+
+
+class Scheduler:
+    """Claims due schedules a chunk at a time and runs each chunk across a thread pool.
+
+    Every schedule of a source account goes to the same thread, so threads
+    don't queue behind each other's lock on a busy payer.
+    """
+
+    def __init__(self, workers=4, chunk_size=500):
+        self.workers = workers
+        self.chunk_size = chunk_size
+        self.errored = set()  # Handed back after a database error; left for the next run
+
+    def _run_lane(self, schedules, now):
+        results = Counter()
+        for schedule in schedules:
+            try:
+                results[run_schedule(schedule, now)] += 1
+            except ScheduleConflict as e:
+                logger.warning('%s', e)
+                results['conflict'] += 1
+            except DatabaseError as e:
+                # Usually lock contention; hand the run back for the next run, or the stale-claim sweep
+                logger.warning('Scheduled transfer %s not run: %s', schedule.pk, e)
+                results['error'] += 1
+                self.errored.add(schedule.pk)
+                try:
+                    ScheduledTransfer.objects.filter(pk=schedule.pk, status='running').update(status='active',
+                                                                                               claimed_at=None)
+                except DatabaseError:
+                    pass
+        return results
+
+    def _run_lane_in_thread(self, schedules, now):
+        try:
+            return self._run_lane(schedules, now)
+        finally:
+            # Pool threads each open their own connection; don't leak it
+            connection.close()
+
+    def run_once(self, now=None):
+        now = now or timezone.now()
+        schedules = claim_due(self.chunk_size, now, exclude=self.errored)
+        if self.workers <= 1:
+            return self._run_lane(schedules, now)
+        lanes = defaultdict(list)
+        for schedule in schedules:
+            lanes[schedule.from_account_id % self.workers].append(schedule)
+        results = Counter()
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='schedules') as pool:
+            for lane in pool.map(lambda lane: self._run_lane_in_thread(lane, now), lanes.values()):
+                results.update(lane)
+        return results
+
+    def run(self, now=None):
+        """Run everything due at ``now``; returns counts of 'ok', 'failed', 'conflict' and 'error'.
+
+        A schedule that hits a database error is tried once per run, so a
+        persistent error can't keep the run going.
+        """
+        now = now or timezone.now()
+        release_stale(now)
+        self.errored = set()
+        results = Counter()
+        while True:
+            chunk = self.run_once(now)
+            if not chunk:
+                return results
+            results.update(chunk)
@@ -0,0 +1,253 @@
+"""Velocity screening for transfers, decided from per-account profiles without touching the database.
+
+Each account has an ``AccountProfile``: its recent transfer times, rolling
+amount statistics and recent payees. Rules read the profile; the profile is
+updated once the transfer commits. Rules are configured with
+BANK_SCREENING_RULES, e.g.::
+
+    BANK_SCREENING_RULES = [
+        {'rule': 'bank.screening.Velocity', 'max_transfers': 5, 'window': 60},
+        {'rule': 'bank.screening.NewPayee', 'min_amount': 1000, 'action': 'block'},
+    ]
+
+A rule with ``'action': 'allow'`` only records its reason, for trying a rule out.
+"""
+import bisect
+import math
+import threading
+import time
+from collections import namedtuple
+
+from django.conf import settings
+from django.core.cache import caches
+from django.test.signals import setting_changed
+from django.utils.module_loading import import_string
+
+ALLOW, HOLD, BLOCK = 'allow', 'hold', 'block'
+SEVERITY = {ALLOW: 0, HOLD: 1, BLOCK: 2}
+
+Attempt = namedtuple('Attempt', ['account_id', 'payee_id', 'amount', 'at'])
+Decision = namedtuple('Decision', ['action', 'reasons'])
+
+DEFAULT_RULES = [
+    {'rule': 'bank.screening.Velocity', 'max_transfers': 5, 'window': 60},
+    {'rule': 'bank.screening.Velocity', 'max_transfers': 20, 'window': 3600},
+    {'rule': 'bank.screening.Velocity', 'max_transfers': 15, 'window': 60, 'action': BLOCK},
+    {'rule': 'bank.screening.NewPayee', 'min_amount': 1000},
+    {'rule': 'bank.screening.AmountOutlier'},
+]
+
+
+class AccountProfile:
+    """Rolling state for one account; every update is O(1) apart from the bounded lists."""
+
+    MAX_TIMES = 64  # Enough to count past any velocity threshold
+    MAX_PAYEES = 256
+    ALPHA = 0.1  # Weight of the newest amount in the rolling mean and variance
+
+    __slots__ = ('times', 'count', 'mean', 'variance', 'payees')
+
+    def __init__(self):
+        self.times = []
+        self.count = 0
+        self.mean = 0.0
+        self.variance = 0.0
+        self.payees = {}
+
+    def transfers_since(self, at):
+        return len(self.times) - bisect.bisect_right(self.times, at)
+
+    def knows(self, payee_id):
+        return payee_id in self.payees
+
+    @property
+    def deviation(self):
+        return math.sqrt(self.variance)
+
+    def observe(self, payee_id, amount, at):
+        bisect.insort(self.times, at)
+        del self.times[:-self.MAX_TIMES]
+        if self.count:
+            # Exponentially weighted, so the statistics follow the account's recent behaviour
+            delta = amount - self.mean
+            self.mean += self.ALPHA * delta
+            self.variance = (1 - self.ALPHA) * (self.variance + self.ALPHA * delta * delta)
+        else:
+            self.mean = amount
+        self.count += 1
+        self.payees.pop(payee_id, None)
+        self.payees[payee_id] = None
+        if len(self.payees) > self.MAX_PAYEES:
+            del self.payees[next(iter(self.payees))]
+
+
+class Rule:
+    def __init__(self, action=HOLD):
+        self.action = action
+
+    @property
+    def name(self):
+        return type(self).__name__
+
+    def __call__(self, profile, attempt):
+        """A reason string when the rule fires, otherwise None."""
+        raise NotImplementedError
+
+
+class Velocity(Rule):
+    def __init__(self, max_transfers=5, window=60, action=HOLD):
+        super().__init__(action)
+        self.max_transfers = max_transfers
+        self.window = window
+
+    def __call__(self, profile, attempt):
+        recent = profile.transfers_since(attempt.at - self.window)
+        if recent >= self.max_transfers:
+            return f'{recent + 1} transfers within {self.window}s'
+
+
+class NewPayee(Rule):
+    """A large first payment to a payee, once the account has enough history to know its payees."""
+
+    def __init__(self, min_amount=1000, min_history=3, action=HOLD):
+        super().__init__(action)
+        self.min_amount = min_amount
+        self.min_history = min_history
+
+    def __call__(self, profile, attempt):
+        if (attempt.amount >= self.min_amount and profile.count >= self.min_history
+                and not profile.knows(attempt.payee_id)):
+            return f'first transfer to account {attempt.payee_id}'
+
+
+class AmountOutlier(Rule):
+    def __init__(self, deviations=4, ratio=5, min_amount=500, min_history=10, action=HOLD):
+        super().__init__(action)
+        self.deviations = deviations
+        self.ratio = ratio
+        self.min_amount = min_amount
+        self.min_history = min_history
+
+    def __call__(self, profile, attempt):
+        if profile.count < self.min_history:
+            return None
+        # The ratio keeps a very regular account from flagging every small change
+        threshold = max(self.min_amount, profile.mean + self.deviations * profile.deviation, self.ratio * profile.mean)
+        if attempt.amount > threshold:
+            return f'{attempt.amount:.2f} against a typical {profile.mean:.2f}'
+
+
+class MemoryStore:
+    """Profiles in this process only; exact, for single-process deployments and replays."""
+
+    def __init__(self):
+        self._profiles = {}
+        self._lock = threading.Lock()
+
+    def get(self, account_id):
+        return self._profiles.get(account_id)
+
+    def update(self, account_id, func):
+        with self._lock:
+            func(self._profiles.setdefault(account_id, AccountProfile()))
+
+    def reset(self, account_id):
+        with self._lock:
+            self._profiles.pop(account_id, None)
+
+
+class CacheStore:
+    """Profiles in a Django cache shared by every worker.
+
+    Updates are read-modify-write, so two transfers committing at the same
+    instant can drop one observation; the rules tolerate that.
+    """
+
+    prefix = 'bank:screening:'
+
+    def __init__(self, alias=None, ttl=None):
+        self.alias = alias or getattr(settings, 'BANK_SCREENING_CACHE', 'default')
+        self.ttl = ttl if ttl is not None else getattr(settings, 'BANK_SCREENING_PROFILE_TTL', 7 * 24 * 3600)
+
+    def get(self, account_id):
+        return caches[self.alias].get(f'{self.prefix}{account_id}')
+
+    def update(self, account_id, func):
+        cache = caches[self.alias]
+        profile = cache.get(f'{self.prefix}{account_id}') or AccountProfile()
+        func(profile)
+        cache.set(f'{self.prefix}{account_id}', profile, self.ttl)
+
+    def reset(self, account_id):
+        caches[self.alias].delete(f'{self.prefix}{account_id}')
+
+
+STORES = {
+    'memory': MemoryStore,
+    'cache': CacheStore,
+}
+
+_EMPTY = AccountProfile()
+
+
+def build_rules(config):
+    rules = []
+    for options in config:
+        options = dict(options)
+        rules.append(import_string(options.pop('rule'))(**options))
+    return rules
+
+
+class ScreeningEngine:
+    def __init__(self, rules=None, store=None):
+        self.rules = rules if rules is not None else build_rules(getattr(settings, 'BANK_SCREENING_RULES', DEFAULT_RULES))
+        self.store = store or STORES[getattr(settings, 'BANK_SCREENING_STORE', 'cache')]()
+
+    def evaluate(self, profile, attempt):
+        action, reasons = ALLOW, []
+        for rule in self.rules:
+            reason = rule(profile, attempt)
+            if reason:
+                reasons.append(f'{rule.name}: {reason}')
+                if SEVERITY[rule.action] > SEVERITY[action]:
+                    action = rule.action
+        return Decision(action, reasons)
+
+    def screen(self, account_id, payee_id, amount, at=None):
+        attempt = Attempt(account_id, payee_id, float(amount), at if at is not None else time.time())
+        return self.evaluate(self.store.get(account_id) or _EMPTY, attempt)
+
+    def record(self, account_id, payee_id, amount, at=None):
+        """Fold a committed transfer into the sender's profile."""
+        at = at if at is not None else time.time()
+        self.store.update(account_id, lambda profile: profile.observe(payee_id, float(amount), at))
+
+
+_engine = None
+_engine_lock = threading.Lock()
+
+
+def screening_enabled():
+    return getattr(settings, 'BANK_SCREENING_ENABLED', True)
+
+
+def get_engine():
+    global _engine
+    if _engine is None:
+        with _engine_lock:
+            if _engine is None:
+                _engine = ScreeningEngine()
+    return _engine
+
+
+def set_engine(engine):
+    global _engine
+    _engine = engine
+
+
+def _reset_engine(setting, **kwargs):
+    if setting.startswith('BANK_SCREENING_'):
+        set_engine(None)
+
+
+setting_changed.connect(_reset_engine)
@@ -0,0 +1,136 @@
+"""Transaction search: one ``TransactionSearch`` row per ledger row, written in the same transaction.
+
+Free text (counterparty account number and username, memo) is matched with the
+SQLite FTS5 trigram index created by migration 0014 when the SQLite build has
+it, and with ``LIKE`` otherwise (backed by a pg_trgm index on Postgres).
+"""
+from django.contrib.auth.models import User
+from django.db import connections, transaction
+from django.db.models import Count, Q
+from django.db.models.expressions import RawSQL
+
+from .models import Account, Posting, Transaction, TransactionSearch
+from .utils import batched
+
+FTS_TABLE = 'bank_transactionsearch_fts'
+MIN_FTS_TERM = 3  # Trigram MATCH can't find anything shorter
+PROBE_ROWS = 500  # Newest rows sampled to choose between the FTS and LIKE plans
+PROBE_MIN_MATCHES = 2  # About the density at which a LIKE walk and an FTS lookup cost the same
+
+_fts_tables = {}
+
+
+def search_text(*parts):
+    # Stored lowercased so the LIKE fallback is case-insensitive on every backend
+    return ' '.join(part for part in parts if part).lower()
+
+
+def _entry(row, counterparty_number, counterparty_username):
+    return TransactionSearch(
+        transaction_id=row.pk, user_id=row.user_id, account_id=row.account_id,
+        transaction_type=row.transaction_type, amount=row.amount, date=row.date, status=row.status,
+        counterparty_account_number=counterparty_number, counterparty_username=counterparty_username,
+        memo=row.memo, search_text=search_text(counterparty_number, counterparty_username, row.memo),
+    )
+
+
+def index(entries):
+    """Add search rows for freshly written ledger rows.
+
+    ``entries`` are ``(transaction, counterparty account or None)`` pairs. Must
+    run inside the transaction that wrote the rows, like ``record_transactions``.
+    """
+    entries = list(entries)
+    # Batch payees are loaded without their user; fetch every missing username in one query
+    missing = {account.user_id for _, account in entries
+               if account is not None and not Account.user.is_cached(account)}
+    usernames = dict(User.objects.filter(pk__in=missing).values_list('pk', 'username'))
+    search_rows = []
+    for row, account in entries:
+        if account is None:
+            search_rows.append(_entry(row, '', ''))
+        else:
+            username = account.user.username if Account.user.is_cached(account) else usernames.get(account.user_id, '')
+            search_rows.append(_entry(row, account.account_number, username))
+    TransactionSearch.objects.bulk_create(search_rows)
+
+
+def _counterparties(rows):
+    """``{transaction id: (account number, username)}`` for the other leg of each transfer row."""
+    journals = dict(Posting.objects.filter(transaction__in=rows, account__isnull=False)
+                    .values_list('transaction_id', 'journal'))
+    legs = Posting.objects.filter(journal__in=set(journals.values()), account__isnull=False)
+    by_journal = {}
+    for journal, account_id, transaction_id in legs.values_list('journal', 'account_id', 'transaction_id'):
+        by_journal.setdefault(journal, []).append((transaction_id, account_id))
+    accounts = {pk: (number, username) for pk, number, username in
+                Account.objects.filter(pk__in={account_id for legs in by_journal.values() for _, account_id in legs})
+                .values_list('pk', 'account_number', 'user__username')}
+    counterparties = {}
+    for transaction_id, journal in journals.items():
+        for other_id, account_id in by_journal.get(journal, []):
+            if other_id != transaction_id:
+                counterparties[transaction_id] = accounts[account_id]
+    return counterparties
+
+
+def rebuild(accounts=None, batch_size=5000):
+    """Recreate search rows from the ledger, ``batch_size`` transactions per database transaction."""
+    rows = Transaction.objects.order_by('pk')
+    if accounts is not None:
+        rows = rows.filter(account_id__in=accounts)
+    rebuilt = 0
+    for batch in batched(rows.iterator(chunk_size=batch_size), batch_size):
+        counterparties = _counterparties(batch)
+        with transaction.atomic():
+            TransactionSearch.objects.filter(transaction__in=batch).delete()
+            TransactionSearch.objects.bulk_create(_entry(row, *counterparties.get(row.pk, ('', ''))) for row in batch)
+        rebuilt += len(batch)
+    return rebuilt
+
+
+def fts_available(alias):
+    connection = connections[alias]
+    if connection.vendor != 'sqlite':
+        return False
+    key = (alias, connection.settings_dict['NAME'])
+    if key not in _fts_tables:
+        _fts_tables[key] = FTS_TABLE in connection.introspection.table_names(include_views=False)
+    return _fts_tables[key]
+
+
+def _fts_phrase(term):
+    return '"' + term.replace('"', '""') + '"'
+
+
+def _like(terms):
+    return Q(*[Q(search_text__contains=term) for term in terms])
+
+
+def _like_is_cheap(queryset, terms):
+    """Whether a LIKE walk down the user's (date, pk) index finds matches quickly, judged from the newest rows.
+
+    Common terms match a large share of the FTS index across every user, and
+    collecting those rowids costs far more than the early-terminating walk.
+    """
+    newest = queryset.order_by('-date', '-pk').values('pk')[:PROBE_ROWS]
+    sample = TransactionSearch.objects.using(queryset.db).filter(pk__in=newest).aggregate(
+        rows=Count('pk'), matches=Count('pk', filter=_like(terms)))
+    return sample['rows'] < PROBE_ROWS or sample['matches'] >= PROBE_MIN_MATCHES
+
+
+def text_filter(queryset, text, fts=None):
+    """Narrow a ``TransactionSearch`` queryset to rows containing every word of ``text``.
+
+    Rare terms are looked up in the FTS index, inside the same statement as
+    the other filters; ``fts=False`` forces the ``LIKE`` plan, e.g. to compare the two.
+    """
+    terms = text.lower().split()
+    long_terms = [term for term in terms if len(term) >= MIN_FTS_TERM]
+    if fts is False or not long_terms or not fts_available(queryset.db) or _like_is_cheap(queryset, terms):
+        return queryset.filter(_like(terms))
+    queryset = queryset.filter(pk__in=RawSQL(
+        f'SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s',
+        [' '.join(_fts_phrase(term) for term in long_terms)]))
+    # The trigram index can't answer shorter terms
+    return queryset.filter(_like([term for term in terms if len(term) < MIN_FTS_TERM]))
@@ -0,0 +1,248 @@
+import calendar
+import csv
+import logging
+import os
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, timedelta
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Q
+from django.template.loader import render_to_string
+from django.utils import timezone
+from pypdf import PdfReader
+from pypdf.generic import ArrayObject, DictionaryObject, IndirectObject, NameObject, NumberObject
+from xhtml2pdf import pisa
+
+from .models import Statement, Transaction
+from .utils import batched
+
+logger = logging.getLogger(__name__)
+
+CSV_COLUMNS = ('date', 'transaction_type', 'amount', 'status', 'id')
+
+
+class StatementError(Exception):
+    pass
+
+
+class _Echo:
+    # csv.writer wants a file; hand each formatted row straight back instead of buffering
+    def write(self, value):
+        return value
+
+
+def month_bounds(month):
+    """``'2024-09'`` -> ``(date(2024, 9, 1), date(2024, 9, 30))``."""
+    try:
+        year, month = (int(part) for part in month.split('-'))
+        last_day = calendar.monthrange(year, month)[1]
+    except (ValueError, calendar.IllegalMonthError) as e:
+        raise StatementError(f'Invalid month: {month}') from e
+    return date(year, month, 1), date(year, month, last_day)
+
+
+def statement_transactions(account, period_start=None, period_end=None):
+    transactions = Transaction.objects.filter(account=account)
+    if period_start:
+        transactions = transactions.filter(date__gte=period_start)
+    if period_end:
+        transactions = transactions.filter(date__lt=period_end + timedelta(days=1))
+    return transactions.order_by('date', 'id')
+
+
+def stream_csv(transactions, chunk_size=2000, columns=CSV_COLUMNS):
+    """Yield a CSV export of ``columns`` of ``transactions`` (any queryset) a chunk of rows at a time."""
+    writer = csv.writer(_Echo())
+    yield writer.writerow(columns)
+    rows = transactions.values_list(*columns).iterator(chunk_size=chunk_size)
+    for chunk in batched(rows, chunk_size):
+        yield ''.join(writer.writerow(row) for row in chunk)
+
+
+def is_closed(period_end):
+    return period_end is not None and period_end < timezone.localdate()
+
+
+def _stale(statements, now=None):
+    cutoff = (now or timezone.now()) - timedelta(seconds=getattr(settings, 'BANK_STATEMENT_CLAIM_TIMEOUT', 900))
+    return statements.filter(Q(claimed_at__lt=cutoff) | Q(claimed_at__isnull=True), status='running')
+
+
+def release_stale(now=None):
+    """Re-queue statements whose renderer died mid-render; returns how many."""
+    return _stale(Statement.objects.all(), now).update(status='pending', claimed_at=None)
+
+
+def requeue(statement):
+    """Render a ready statement again, e.g. after its file was cleaned up."""
+    return Statement.objects.filter(pk=statement.pk, status='ready').update(
+        status='pending', file_path='', claimed_at=None, completed_at=None)
+
+
+def request_statement(account, period_start=None, period_end=None):
+    """Queue a PDF statement, reusing an existing one where possible.
+
+    Statements already queued or rendering for the same period are always
+    shared; finished statements are only reused for closed periods, whose
+    transactions can no longer change.
+    """
+    statements = Statement.objects.filter(account=account, period_start=period_start, period_end=period_end)
+    # Don't hand out a statement that a dead renderer will never finish
+    _stale(statements).update(status='pending', claimed_at=None)
+    reusable = ['pending', 'running']
+    if is_closed(period_end):
+        reusable.append('ready')
+    existing = statements.filter(status__in=reusable).order_by('-created_at').first()
+    if existing is not None:
+        return existing
+    return Statement.objects.create(user_id=account.user_id, account=account,
+                                    period_start=period_start, period_end=period_end)
+
+
+def statement_path(statement):
+    root = getattr(settings, 'BANK_STATEMENT_ROOT', os.path.join(settings.BASE_DIR, 'statements'))
+    return os.path.join(root, str(statement.account_id), f'statement-{statement.pk}.pdf')
+
+
+def _render_page(statement, rows, page_number, dest):
+    html = render_to_string('bank/statement_page.html', {
+        'statement': statement,
+        'transactions': rows,
+        'page_number': page_number,
+    })
+    status = pisa.CreatePDF(html, dest=dest)
+    if status.err:
+        raise StatementError(f'Could not render page {page_number}')
+
+
+_PAGES = IndirectObject(2, 0, None)
+
+
+def _write_object(out, offsets, idnum, obj):
+    offsets[idnum] = out.tell()
+    out.write(f'{idnum} 0 obj\n'.encode())
+    obj.write_to_stream(out)
+    out.write(b'\nendobj\n')
+
+
+def _concatenate(parts, out):
+    """Write the pages of the PDF files ``parts`` to ``out`` as one document.
+
+    Each part's objects are copied straight to ``out`` under new numbers, so
+    only one part is parsed at a time and memory doesn't grow with the page
+    count. Pages are hung off a single page tree written at the end.
+    """
+    out.write(b'%PDF-1.4\n%\xe2\xe3\xcf\xd3\n')
+    offsets = [0, 0, 0]  # Object 0 heads the free list; 1 and 2 are the catalog and page tree
+    kids = ArrayObject()
+    for part in parts:
+        with open(part, 'rb') as f:
+            reader = PdfReader(f)
+            numbers, queue = {}, []
+
+            def number(ref, obj=None):
+                if ref is _PAGES:
+                    return ref
+                key = (ref.idnum, ref.generation)
+                if key not in numbers:
+                    numbers[key] = len(offsets)
+                    offsets.append(0)
+                    queue.append((numbers[key], ref if obj is None else obj))
+                return IndirectObject(numbers[key], 0, None)
+
+            def renumber(obj):
+                items = dict.items(obj) if isinstance(obj, dict) else enumerate(obj) if isinstance(obj, list) else ()
+                for key, value in list(items):
+                    if isinstance(value, IndirectObject):
+                        obj[key] = number(value)
+                    else:
+                        renumber(value)
+
+            # The reader already copied inherited attributes such as /MediaBox onto each page
+            for page in reader.pages:
+                page[NameObject('/Parent')] = _PAGES
+                kids.append(number(page.indirect_reference, page))
+            while queue:
+                idnum, obj = queue.pop()
+                obj = obj.get_object()
+                renumber(obj)
+                _write_object(out, offsets, idnum, obj)
+
+    _write_object(out, offsets, 1, DictionaryObject({NameObject('/Type'): NameObject('/Catalog'),
+                                                     NameObject('/Pages'): _PAGES}))
+    _write_object(out, offsets, 2, DictionaryObject({NameObject('/Type'): NameObject('/Pages'), NameObject('/Kids'): kids,
+                                                     NameObject('/Count'): NumberObject(len(kids))}))
+    xref = out.tell()
+    out.write(f'xref\n0 {len(offsets)}\n0000000000 65535 f \n'.encode())
+    out.writelines(f'{offset:010d} 00000 n \n'.encode() for offset in offsets[1:])
+    out.write(f'trailer\n<< /Size {len(offsets)} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n'.encode())
+
+
+def render_statement(statement, page_rows=None):
+    """Render ``statement`` to disk one page-sized chunk of rows at a time.
+
+    Each chunk is rendered to its own temporary file before the next is read,
+    then the files are concatenated into the statement.
+    """
+    page_rows = page_rows or getattr(settings, 'BANK_STATEMENT_PAGE_ROWS', 500)
+    transactions = statement_transactions(statement.account, statement.period_start, statement.period_end)
+    path = statement_path(statement)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    row_count = 0
+    with tempfile.TemporaryDirectory(dir=os.path.dirname(path)) as scratch:
+        parts = []
+        chunks = batched(transactions.iterator(chunk_size=page_rows), page_rows)
+        for page_number, rows in enumerate(chunks, start=1):
+            parts.append(os.path.join(scratch, f'{page_number}.pdf'))
+            with open(parts[-1], 'wb') as f:
+                _render_page(statement, rows, page_number, f)
+            row_count += len(rows)
+        if not parts:
+            parts.append(os.path.join(scratch, '1.pdf'))
+            with open(parts[-1], 'wb') as f:
+                _render_page(statement, [], 1, f)
+        with open(os.path.join(scratch, 'statement.pdf'), 'wb') as out:
+            _concatenate(parts, out)
+        os.replace(out.name, path)
+    Statement.objects.filter(pk=statement.pk).update(
+        status='ready', file_path=path, row_count=row_count, completed_at=timezone.now(), error='')
+
+
+def _render_safely(statement):
+    try:
+        render_statement(statement)
+    except Exception as e:
+        logger.exception('Statement %s failed', statement.pk)
+        Statement.objects.filter(pk=statement.pk).update(status='failed', error=str(e), completed_at=timezone.now())
+
+
+def _render_in_thread(statement):
+    try:
+        _render_safely(statement)
+    finally:
+        # Pool threads each open their own connection; don't leak it
+        connection.close()
+
+
+def claim_pending(limit):
+    pending = Statement.objects.filter(status='pending').order_by('created_at')
+    with transaction.atomic():
+        if connection.features.has_select_for_update_skip_locked:
+            pending = pending.select_for_update(skip_locked=True)
+        ids = list(pending.values_list('pk', flat=True)[:limit])
+        Statement.objects.filter(pk__in=ids).update(status='running', claimed_at=timezone.now())
+    return list(Statement.objects.filter(pk__in=ids).select_related('account'))
+
+
+def render_pending(workers=2, limit=None):
+    release_stale()
+    statements = claim_pending(limit or workers * 4)
+    if workers > 1:
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='statements') as pool:
+            list(pool.map(_render_in_thread, statements))
+    else:
+        for statement in statements:
+            _render_safely(statement)
+    return len(statements)
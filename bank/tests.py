@@ -1,3 +1,1397 @@
-from django.test import TestCase
+import asyncio
+import io
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from decimal import Decimal
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import sync_to_async
+from pypdf import PdfReader
+
+from django.contrib.auth import hashers
+from django.contrib.auth.models import User
+from django.core import mail
+from django.core.cache import caches
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import IntegrityError, OperationalError, connection, transaction
+from django.db.models import Sum
+from django.http import HttpResponse
+from django.test import AsyncClient, RequestFactory, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from .models import (
+    Account, BalanceSnapshot, Notification, OutboxMessage, PendingAuthorization, Posting, ScheduledTransfer, Statement,
+    Transaction, TransactionRollup, TransactionSearch, Transfer, TransferBatch, UserProfile,
+)
+from .benchmarks import seed_transactions
+from .admin import PeriodQuerySet
+from . import authorizations, eod, events, fragments, interest, ledger, loadtest, passwords, screening, search
+from .batches import BatchError, create_and_run, parse_items, resume_batch, run_batch
+from .datasets import import_ledger, seed
+from .dbprofiles import database_config
+from .instrumentation import InstrumentationMiddleware, registry
+from .limits import LimitExceeded, precheck, usage_today
+from .notifications import mark_read, purge_read, unread_count, unread_page
+from .outbox import OutboxWorker
+from .pagination import paginate
+from .rollups import monthly_summary, rebuild
+from .statements import month_bounds, render_pending, request_statement
+from .schedules import ScheduleConflict, Scheduler, claim_due, next_occurrence, release_stale, run_schedule
+from .replicas import PIN_SESSION_KEY, ReplicaRouter, choose_replica, pin_to_primary, reset_health, use_replica
+from .rates import FakeRateProvider, RateService, RateUnavailable, set_rate_service, snapshot
+from .transfers import (
+    AccountFrozen, InsufficientFunds, InvalidAuthorization, TransferBlocked, TransferError, TransferHeld, authorized_transfer,
+    deposit_funds, transfer_funds, withdraw_funds,
+)
+
+
+def mock_sms_client(client):
+    return mock.patch('bank.utils.get_sms_client', return_value=client)
+
+
+def make_account(username, balance='1000.00', **kwargs):
+    user = User.objects.create(username=username, email=f'{username}@example.com')
+    account = Account.objects.create(user=user, balance=Decimal(balance), account_number=str(100000 + user.pk), **kwargs)
+    # Ids are reused after each test's rollback; don't inherit an earlier test's screening profile
+    screening.CacheStore().reset(account.pk)
+    return account
+
+
+class TransferServiceTests(TestCase):
+    def setUp(self):
+        self.alice = make_account('alice')
+        self.bob = make_account('bob')
+
+    def test_transfer_moves_funds_and_records_ledger(self):
+        transfer_funds(self.alice, self.bob, '250.50')
+        self.alice.refresh_from_db()
+        self.bob.refresh_from_db()
+        self.assertEqual(self.alice.balance, Decimal('749.50'))
+        self.assertEqual(self.bob.balance, Decimal('1250.50'))
+        self.assertEqual(usage_today(self.alice), (1, Decimal('250.50')))
+        self.assertEqual(Transaction.objects.filter(account=self.alice, transaction_type='transfer').count(), 1)
+        self.assertEqual(Transaction.objects.filter(account=self.bob, transaction_type='deposit').count(), 1)
+        self.assertEqual(Notification.objects.filter(user=self.bob.user).count(), 1)
+
+    def test_insufficient_funds_leaves_balances_untouched(self):
+        with self.assertRaises(InsufficientFunds):
+            transfer_funds(self.alice, self.bob, '5000')
+        self.alice.refresh_from_db()
+        self.assertEqual(self.alice.balance, Decimal('1000.00'))
+        self.assertFalse(Transaction.objects.exists())
+
+    def test_idempotency_key_prevents_double_posting(self):
+        first = transfer_funds(self.alice, self.bob, '100', idempotency_key='retry-1')
+        second = transfer_funds(self.alice, self.bob, '100', idempotency_key='retry-1')
+        self.assertEqual(first.pk, second.pk)
+        self.alice.refresh_from_db()
+        self.assertEqual(self.alice.balance, Decimal('900.00'))
+
+    def test_deposit_and_withdraw(self):
+        deposit_funds(self.alice, 50, idempotency_key='dep')
+        deposit_funds(self.alice, 50, idempotency_key='dep')
+        withdraw_funds(self.alice, '25.25')
+        self.alice.refresh_from_db()
+        self.assertEqual(self.alice.balance, Decimal('1024.75'))
+        with self.assertRaises(InsufficientFunds):
+            withdraw_funds(self.alice, 10000)
+
+
+class FakeSMSClient:
+    def __init__(self, delay=0, fail=False, fail_to=()):
+        self.delay = delay
+        self.fail = fail
+        self.fail_to = fail_to
+        self.sent = []
+        self.messages = self
+
+    def create(self, to, from_, body):
+        time.sleep(self.delay)
+        if self.fail or to in self.fail_to:
+            raise ConnectionError('SMS gateway unavailable')
+        self.sent.append((to, body))
+
+
+class OutboxTests(TestCase):
+    def setUp(self):
+        self.alice = make_account('alice', max_transaction_count=100)
+        self.bob = make_account('bob')
+        UserProfile.objects.create(user=self.bob.user, phone_number='+15550100', address='1 Main St')
+
+    def test_transfer_queues_alerts_instead_of_sending(self):
+        transfer_funds(self.alice, self.bob, 10)
+        self.assertEqual(len(mail.outbox), 0)
+        self.assertEqual(set(OutboxMessage.objects.values_list('channel', flat=True)), {'email', 'sms'})
+        self.assertEqual(Notification.objects.get().delivery_status, 'pending')
+
+    def test_worker_delivers_and_records_status(self):
+        for _ in range(5):
+            transfer_funds(self.alice, self.bob, 10)
+        sms = FakeSMSClient()
+        worker = OutboxWorker(batch_size=2, workers=2, sms_client=sms)
+        self.assertEqual(worker.drain(), 10)
+        worker.close()
+        self.assertEqual(len(mail.outbox), 5)
+        self.assertEqual(len(sms.sent), 5)
+        self.assertFalse(OutboxMessage.objects.exclude(status='sent').exists())
+        self.assertFalse(Notification.objects.exclude(delivery_status='sent').exists())
+
+    def test_failed_delivery_is_retried_with_backoff_then_given_up(self):
+        transfer_funds(self.alice, self.bob, 10)
+        worker = OutboxWorker(max_attempts=2, backoff=0, sms_client=FakeSMSClient(fail=True))
+        worker.drain()
+        worker.close()
+        message = OutboxMessage.objects.get(channel='sms')
+        self.assertEqual((message.status, message.attempts), ('failed', 2))
+        self.assertEqual(Notification.objects.get().delivery_status, 'failed')
+
+    def test_failed_sms_does_not_resend_the_rest_of_its_batch(self):
+        carol = make_account('carol')
+        UserProfile.objects.create(user=carol.user, phone_number='+15550199', address='2 Main St')
+        transfer_funds(self.alice, self.bob, 10)
+        transfer_funds(self.alice, carol, 10)
+        sms = FakeSMSClient(fail_to={'+15550199'})
+        worker = OutboxWorker(backoff=0, sms_client=sms)
+        worker.drain_once()
+        self.assertEqual(OutboxMessage.objects.get(recipient='+15550100').status, 'sent')
+        self.assertEqual(OutboxMessage.objects.get(recipient='+15550199').status, 'pending')
+        sms.fail_to = ()
+        worker.drain()
+        worker.close()
+        self.assertEqual(sorted(to for to, _ in sms.sent), ['+15550100', '+15550199'])
+
+    def test_messages_left_sending_by_a_dead_worker_are_reclaimed(self):
+        transfer_funds(self.alice, self.bob, 10)
+        claimed = OutboxWorker()._claim()
+        self.assertEqual(len(claimed), 2)
+        self.assertEqual(OutboxWorker()._claim(), [])
+        OutboxMessage.objects.update(claimed_at=timezone.now() - timedelta(hours=1))
+        sms = FakeSMSClient()
+        worker = OutboxWorker(sms_client=sms)
+        self.assertEqual(worker.drain(), 2)
+        worker.close()
+        self.assertEqual(len(sms.sent), 1)
+        self.assertFalse(OutboxMessage.objects.exclude(status='sent').exists())
+
+    def test_outbox_keeps_slow_gateways_off_the_request_path(self):
+        def timed(enabled, sms):
+            with override_settings(BANK_OUTBOX_ENABLED=enabled), mock_sms_client(sms):
+                started = time.perf_counter()
+                for _ in range(5):
+                    transfer_funds(self.alice, self.bob, 1)
+                return (time.perf_counter() - started) / 5
+
+        inline = timed(False, FakeSMSClient(delay=0.02))
+        queued = timed(True, FakeSMSClient(delay=0.02))
+        self.assertEqual(len(mail.outbox), 5)
+        self.assertLess(queued, inline)
+
+
+class RateServiceTests(TestCase):
+    def setUp(self):
+        self.shared = caches['default']
+        self.shared.clear()
+
+    def test_rate_table_is_fetched_once_per_base_currency(self):
+        provider = FakeRateProvider()
+        service = RateService(provider=provider, ttl=60)
+        self.assertEqual(service.get_quote('USD', 'EUR').rate, Decimal('0.9'))
+        service.get_quote('USD', 'GBP')
+        self.assertEqual(provider.calls, 1)
+
+    def test_shared_cache_is_reused_across_workers(self):
+        provider = FakeRateProvider()
+        RateService(provider=provider, ttl=60).get_quote('USD', 'EUR')
+        RateService(provider=provider, ttl=60).get_quote('USD', 'EUR')
+        self.assertEqual(provider.calls, 1)
+
+    def test_circuit_breaker_falls_back_to_last_known_rates(self):
+        provider = FakeRateProvider()
+        service = RateService(provider=provider, ttl=0)
+        service.get_quote('USD', 'EUR')
+        provider.fail = True
+        for _ in range(5):
+            with self.assertRaises(Exception):
+                service._fetch('USD')
+        self.assertEqual(service.get_quote('USD', 'EUR').rate, Decimal('0.9'))
+        self.assertIsNotNone(service.breaker.opened_at)
+
+    def test_unavailable_without_any_known_rates(self):
+        service = RateService(provider=FakeRateProvider(fail=True), ttl=60)
+        with self.assertRaises(RateUnavailable):
+            service.get_quote('USD', 'EUR')
+
+    def test_transfer_records_rate_snapshot(self):
+        alice, bob = make_account('alice'), make_account('bob')
+        quote = RateService(provider=FakeRateProvider(), ttl=60).get_quote('USD', 'GBP')
+        rate = snapshot(quote)
+        self.assertEqual(snapshot(quote), rate)
+        debit = transfer_funds(alice, bob, 10, exchange_rate=rate)
+        self.assertEqual(debit.exchange_rate.rate, Decimal('0.8'))
+
+    def test_cached_lookups_outpace_uncached(self):
+        def lookups_per_second(ttl):
+            service = RateService(provider=FakeRateProvider(latency=0.002), ttl=ttl, shared_cache=self.shared)
+            started = time.perf_counter()
+            for _ in range(50):
+                if not ttl:
+                    service.clear()
+                    self.shared.clear()
+                service.get_quote('USD', 'EUR')
+            return 50 / (time.perf_counter() - started)
+
+        self.assertGreater(lookups_per_second(60), lookups_per_second(0))
+
+
+class AsyncViewTests(TestCase):
+    def setUp(self):
+        caches['default'].clear()
+        self.provider = FakeRateProvider(latency=0.01)
+        set_rate_service(RateService(provider=self.provider, ttl=60))
+        self.addCleanup(set_rate_service, None)
+        self.alice, self.bob = make_account('alice'), make_account('bob')
+
+    async def test_async_quote_uses_the_async_provider(self):
+        quote = await RateService(provider=self.provider, ttl=60).aget_quote('USD', 'EUR')
+        self.assertEqual(quote.rate, Decimal('0.9'))
+        self.assertEqual(self.provider.calls, 1)
+
+    async def test_async_transfer(self):
+        client = AsyncClient()
+        await client.aforce_login(self.alice.user)
+        otp = await sync_to_async(authorizations.issue)(self.alice.user, self.bob.account_number, 25)
+        with mock.patch('bank.async_views.render', return_value=HttpResponse()):
+            response = await client.post(reverse('async_transfer'),
+                                         {'to_account': self.bob.account_number, 'amount': '25', 'pin': otp})
+        self.assertRedirects(response, reverse('dashboard'), fetch_redirect_response=False)
+        await self.bob.arefresh_from_db()
+        self.assertEqual(self.bob.balance, Decimal('1025.00'))
+
+    async def test_async_transfer_rejects_a_wrong_pin(self):
+        client = AsyncClient()
+        await client.aforce_login(self.alice.user)
+        with mock.patch('bank.async_views.render', return_value=HttpResponse()) as render:
+            await client.post(reverse('async_transfer'), {'to_account': self.bob.account_number, 'amount': '25', 'pin': 'nope'})
+        self.assertEqual(render.call_args[0][2], {'error': 'Invalid Pin'})
+
+
+class TransactionHistoryTests(TestCase):
+    def setUp(self):
+        self.account = make_account('alice')
+        seed_transactions(self.account, 120, batch_size=50)
+        self.client.force_login(self.account.user)
+
+    def test_keyset_pages_cover_every_row_once(self):
+        seen, cursor = [], None
+        while True:
+            page = paginate(Transaction.objects.filter(account=self.account), cursor=cursor, page_size=25)
+            seen += [t.pk for t in page]
+            if not page.has_next:
+                break
+            cursor = page.next_cursor
+        expected = list(Transaction.objects.order_by('-date', '-id').values_list('pk', flat=True))
+        self.assertEqual(seen, expected)
+
+    def test_json_endpoint_filters_and_paginates(self):
+        url = reverse('transaction_history_json')
+        # The session comes from the cache; the user is read twice (auth, then the account owner)
+        with self.assertNumQueries(3):
+            data = self.client.get(url, {'transaction_type': 'deposit', 'page_size': 10}).json()
+        self.assertEqual(len(data['results']), 10)
+        self.assertEqual({row['transaction_type'] for row in data['results']}, {'deposit'})
+        following = self.client.get(url, {'transaction_type': 'deposit', 'page_size': 10, 'cursor': data['next_cursor']}).json()
+        self.assertLess(following['results'][0]['date'], data['results'][-1]['date'])
+
+    def test_invalid_cursor_is_rejected(self):
+        response = self.client.get(reverse('transaction_history_json'), {'cursor': 'nope'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_page_size_below_one_is_rejected(self):
+        for page_size in ('0', '-3', 'abc'):
+            for name in ('transaction_history', 'transaction_history_json'):
+                response = self.client.get(reverse(name), {'page_size': page_size})
+                self.assertEqual(response.status_code, 400, (name, page_size))
+        with self.assertRaises(ValueError):
+            paginate(Transaction.objects.all(), page_size=0)
+
+
+class TransactionSearchTests(TestCase):
+    def setUp(self):
+        self.alice = make_account('alice')
+        self.bob = make_account('bobby')
+        transfer_funds(self.alice, self.bob, '25.00', memo='Rent for March')
+        deposit_funds(self.alice, '10.00')
+        self.client.force_login(self.alice.user)
+
+    def search(self, **params):
+        return self.client.get(reverse('transaction_history_json'), params).json()['results']
+
+    def test_rows_are_indexed_with_their_counterparty(self):
+        sent = TransactionSearch.objects.get(user=self.alice.user, transaction_type='transfer')
+        received = TransactionSearch.objects.get(user=self.bob.user)
+        self.assertEqual((sent.counterparty_username, sent.memo), ('bobby', 'Rent for March'))
+        self.assertEqual(received.counterparty_account_number, self.alice.account_number)
+
+    def test_text_search_combines_with_filters(self):
+        self.assertEqual([row['memo'] for row in self.search(q='RENT bob')], ['Rent for March'])
+        self.assertEqual(self.search(q='rent', transaction_type='deposit'), [])
+        self.assertEqual(len(self.search(q=self.bob.account_number[-4:], min_amount='20')), 1)
+        # Terms shorter than a trigram are matched with LIKE
+        self.assertEqual(len(self.search(q='by')), 1)
+
+    def test_sparse_matches_use_the_fts_index(self):
+        self.assertTrue(search.fts_available('default'))
+        with mock.patch.object(search, 'PROBE_ROWS', 1), CaptureQueriesContext(connection) as captured:
+            self.assertEqual([row['memo'] for row in self.search(q='RENT by')], ['Rent for March'])
+        self.assertTrue(any(search.FTS_TABLE in query['sql'] for query in captured))
+
+    def test_rebuild_recovers_counterparties_from_the_ledger(self):
+        TransactionSearch.objects.all().delete()
+        self.assertEqual(search.rebuild(), 3)
+        self.assertEqual(TransactionSearch.objects.get(user=self.bob.user).counterparty_username, 'alice')
+        self.assertEqual(len(self.search(q='march')), 1)
+
+
+class StatementTests(TestCase):
+    def setUp(self):
+        self.account = make_account('alice')
+        seed_transactions(self.account, 30)
+        self.client.force_login(self.account.user)
+
+    def test_csv_statement_streams_every_row(self):
+        response = self.client.get(reverse('account_statement'), {'format': 'csv'})
+        self.assertTrue(response.streaming)
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual(lines[0], 'date,transaction_type,amount,status,id')
+        self.assertEqual(len(lines), 31)
+
+    def test_closed_month_statements_are_reused(self):
+        first = request_statement(self.account, *month_bounds('2020-01'))
+        Statement.objects.filter(pk=first.pk).update(status='ready')
+        self.assertEqual(request_statement(self.account, *month_bounds('2020-01')).pk, first.pk)
+        self.assertNotEqual(request_statement(self.account).pk, first.pk)
+
+    def test_statements_left_running_by_a_dead_renderer_are_requeued(self):
+        statement = request_statement(self.account, *month_bounds('2020-01'))
+        Statement.objects.filter(pk=statement.pk).update(status='running', claimed_at=timezone.now())
+        self.assertEqual(request_statement(self.account, *month_bounds('2020-01')).status, 'running')
+        Statement.objects.filter(pk=statement.pk).update(claimed_at=timezone.now() - timedelta(hours=1))
+        requeued = request_statement(self.account, *month_bounds('2020-01'))
+        self.assertEqual((requeued.pk, requeued.status), (statement.pk, 'pending'))
+
+    def test_pdf_is_rendered_in_background_and_downloadable(self):
+        response = self.client.get(reverse('account_statement'))
+        status_url = response['Location']
+        self.assertEqual(self.client.get(status_url).json()['status'], 'pending')
+        with tempfile.TemporaryDirectory() as root, override_settings(BANK_STATEMENT_ROOT=root, BANK_STATEMENT_PAGE_ROWS=10):
+            self.assertEqual(render_pending(workers=1), 1)
+            data = self.client.get(status_url).json()
+            self.assertEqual(data['status'], 'ready')
+            download = self.client.get(data['download_url'])
+            self.assertTrue(b''.join(download.streaming_content).startswith(b'%PDF'))
+            download.close()
+        self.assertEqual(Statement.objects.get().row_count, 30)
+
+    def test_pdf_pages_of_every_chunk_are_kept(self):
+        statement = request_statement(self.account)
+        with tempfile.TemporaryDirectory() as root, override_settings(BANK_STATEMENT_ROOT=root, BANK_STATEMENT_PAGE_ROWS=10):
+            render_pending(workers=1)
+            statement.refresh_from_db()
+            self.assertEqual(len(PdfReader(statement.file_path, strict=True).pages), 3)
+            self.assertEqual(os.listdir(os.path.dirname(statement.file_path)), [os.path.basename(statement.file_path)])
+
+    def test_missing_pdf_is_a_404_and_requeued(self):
+        statement = request_statement(self.account)
+        Statement.objects.filter(pk=statement.pk).update(status='ready', file_path='/nonexistent/statement.pdf')
+        response = self.client.get(reverse('statement_download', kwargs={'pk': statement.pk}))
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(self.client.get(reverse('statement_status', kwargs={'pk': statement.pk})).json()['status'],
+                         'pending')
+
+
+class RollupTests(TestCase):
+    def setUp(self):
+        self.alice = make_account('alice')
+        self.bob = make_account('bob')
+
+    def rollup_values(self):
+        return set(TransactionRollup.objects.values_list('account_id', 'period', 'period_start', 'transaction_type', 'count', 'total'))
+
+    def test_ledger_writes_maintain_rollups(self):
+        transfer_funds(self.alice, self.bob, 100)
+        transfer_funds(self.alice, self.bob, '50.25')
+        withdraw_funds(self.bob, 10)
+        month = TransactionRollup.objects.get(account=self.alice, period='month', transaction_type='transfer')
+        self.assertEqual((month.count, month.total), (2, Decimal('150.25')))
+        self.assertEqual(TransactionRollup.objects.filter(account=self.bob, period='day').count(), 2)
+
+    def test_rebuild_matches_incremental_rollups(self):
+        for amount in (5, 15, 25):
+            transfer_funds(self.alice, self.bob, amount)
+        deposit_funds(self.alice, 7)
+        incremental = self.rollup_values()
+        TransactionRollup.objects.all().delete()
+        rebuild()
+        self.assertEqual(self.rollup_values(), incremental)
+
+    def test_rebuild_reads_the_ledger_inside_its_transaction(self):
+        transfer_funds(self.alice, self.bob, 5)
+        with CaptureQueriesContext(connection) as queries:
+            rebuild()
+        sql = [query['sql'] for query in queries.captured_queries]
+        savepoint = next(i for i, statement in enumerate(sql) if statement.startswith('SAVEPOINT'))
+        aggregate = next(i for i, statement in enumerate(sql) if 'COUNT(' in statement)
+        self.assertLess(savepoint, aggregate)
+
+    def test_monthly_summary_reads_only_rollups(self):
+        transfer_funds(self.alice, self.bob, 100)
+        deposit_funds(self.alice, 40)
+        with self.assertNumQueries(1):
+            data = monthly_summary(self.alice.user)
+        self.assertEqual(len(data['labels']), 12)
+        self.assertEqual(data['datasets'][0]['data'][-1], 100.0)
+        self.assertEqual(data['datasets'][1]['data'][-1], 40.0)
+
+
+class NotificationServiceTests(TestCase):
+    def setUp(self):
+        caches['default'].clear()
+        self.user = User.objects.create(username='alice')
+        Notification.objects.bulk_create([Notification(user=self.user, message=f'n{i}') for i in range(30)])
+
+    def test_only_displayed_page_is_marked_read_in_one_update(self):
+        page = unread_page(self.user, page_size=10)
+        with self.assertNumQueries(1):
+            self.assertEqual(mark_read(self.user, page), 10)
+        self.assertEqual(Notification.objects.filter(is_read=False).count(), 20)
+
+    def test_unread_count_is_cached_and_invalidated(self):
+        self.assertEqual(unread_count(self.user), 30)
+        with self.assertNumQueries(0):
+            self.assertEqual(unread_count(self.user), 30)
+        mark_read(self.user, unread_page(self.user, page_size=5))
+        self.assertEqual(unread_count(self.user), 25)
+
+    def test_transfer_alert_invalidates_unread_count(self):
+        alice, bob = make_account('payer'), make_account('bob')
+        unread_count(bob.user)
+        with self.captureOnCommitCallbacks(execute=True):
+            transfer_funds(alice, bob, 5)
+        self.assertEqual(unread_count(bob.user), 1)
+
+    def test_purge_deletes_old_read_notifications_in_batches(self):
+        Notification.objects.filter(pk__in=list(Notification.objects.values_list('pk', flat=True)[:12])).update(
+            is_read=True, timestamp=timezone.now() - timedelta(days=200))
+        self.assertEqual(purge_read(older_than_days=90, batch_size=5), 12)
+        self.assertEqual(Notification.objects.count(), 18)
+
+
+class LimitTests(TestCase):
+    def setUp(self):
+        caches['default'].clear()
+        self.alice = make_account('alice', max_transaction_count=2, daily_transaction_limit=Decimal('100'))
+        self.bob = make_account('bob')
+
+    def test_count_limit(self):
+        transfer_funds(self.alice, self.bob, 1)
+        transfer_funds(self.alice, self.bob, 1)
+        with self.assertRaises(LimitExceeded):
+            transfer_funds(self.alice, self.bob, 1)
+        self.assertEqual(usage_today(self.alice)[0], 2)
+
+    def test_amount_limit_rolls_back_the_transfer(self):
+        transfer_funds(self.alice, self.bob, 60)
+        with self.assertRaises(LimitExceeded):
+            transfer_funds(self.alice, self.bob, 41)
+        self.alice.refresh_from_db()
+        self.assertEqual(self.alice.balance, Decimal('940.00'))
+
+    def test_usage_resets_by_date(self):
+        transfer_funds(self.alice, self.bob, 1)
+        transfer_funds(self.alice, self.bob, 1)
+        tomorrow = timezone.now() + timedelta(days=1)
+        with mock.patch('django.utils.timezone.now', return_value=tomorrow):
+            transfer_funds(self.alice, self.bob, 1)
+            self.assertEqual(usage_today(self.alice)[0], 1)
+
+    @override_settings(BANK_LIMITS_CACHE_FASTPATH=True)
+    def test_cache_fast_path_rejects_without_queries(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            transfer_funds(self.alice, self.bob, 1)
+            transfer_funds(self.alice, self.bob, 1)
+        with self.assertNumQueries(0), self.assertRaises(LimitExceeded):
+            precheck(self.alice, 1)
+
+
+class LedgerTests(TestCase):
+    def setUp(self):
+        self.alice = make_account('alice')
+        self.bob = make_account('bob', balance='0.00')
+        ledger.post_opening_balance(self.alice)
+
+    def test_every_journal_balances(self):
+        transfer_funds(self.alice, self.bob, 100)
+        deposit_funds(self.bob, 20)
+        withdraw_funds(self.alice, 5)
+        journals = Posting.objects.values('journal').annotate(total=Sum('amount'))
+        self.assertEqual(len(journals), 4)
+        self.assertTrue(all(journal['total'] == 0 for journal in journals))
+        self.assertEqual(ledger.balance(self.alice), Decimal('895.00'))
+        self.assertEqual(ledger.balance(self.bob), Decimal('120.00'))
+
+    def test_record_updates_every_derived_store(self):
+        bus = events.MemoryBus()
+        events.set_bus(bus)
+        self.addCleanup(events.set_bus, None)
+        row = Transaction.objects.create(user=self.bob.user, account=self.bob, transaction_type='deposit', amount=7)
+        with self.captureOnCommitCallbacks(execute=True):
+            ledger.record(ledger.external_legs(row, row.amount), [(row, None)], [(self.bob, Decimal('7.00'), row)])
+        self.assertEqual(ledger.balance(self.bob), Decimal('7.00'))
+        self.assertTrue(TransactionRollup.objects.filter(account=self.bob, period='day', total=7).exists())
+        self.assertTrue(TransactionSearch.objects.filter(transaction=row).exists())
+        self.assertEqual([e.data['balance'] for e in bus.since(self.bob.user_id, 0)], ['7.00'])
+
+    def test_balance_is_snapshot_plus_tail(self):
+        transfer_funds(self.alice, self.bob, 100)
+        self.assertEqual(ledger.take_snapshots(), 2)
+        self.assertEqual(ledger.take_snapshots(), 0)
+        transfer_funds(self.alice, self.bob, 50)
+        snapshot = BalanceSnapshot.objects.get(account=self.alice)
+        self.assertEqual(snapshot.balance, Decimal('900.00'))
+        self.assertEqual(ledger.balance(self.alice), Decimal('850.00'))
+
+    def test_reconcile_reports_tampered_balances(self):
+        transfer_funds(self.alice, self.bob, 100)
+        self.assertEqual(list(ledger.reconcile(chunk_size=1, workers=1)), [])
+        Account.objects.filter(pk=self.bob.pk).update(balance=Decimal('1000000'))
+        self.assertEqual(list(ledger.reconcile(chunk_size=1, workers=1)),
+                         [(self.bob.pk, Decimal('100.00'), Decimal('1000000.00'))])
+
+    def test_postings_are_immutable(self):
+        posting = Posting.objects.first()
+        posting.amount = 1
+        with self.assertRaises(ValueError):
+            posting.save()
+        with self.assertRaises(ledger.UnbalancedEntry):
+            ledger.post([Posting(journal=posting.journal, account=self.alice, amount=1)])
+
+
+class BatchTransferTests(TestCase):
+    def setUp(self):
+        caches['default'].clear()
+        set_rate_service(RateService(provider=FakeRateProvider(), ttl=60))
+        self.addCleanup(set_rate_service, None)
+        self.payer = make_account('payroll', balance='10000.00')
+        self.payees = [make_account(f'payee{i}', balance='0.00') for i in range(6)]
+        self.csv = 'to_account,amount,currency\n' + ''.join(f'{p.account_number},100,USD\n' for p in self.payees)
+
+    def test_batch_pays_everyone_in_chunks(self):
+        items = parse_items(self.csv)
+        items[0]['currency'] = 'EUR'
+        items[0]['amount'] = Decimal('90')
+        batch = create_and_run(self.payer, items, chunk_size=4)
+        self.assertEqual((batch.status, batch.processed_items, batch.total_amount), ('completed', 6, Decimal('600.00')))
+        self.assertEqual(Account.objects.filter(pk__in=[p.pk for p in self.payees], balance=100).count(), 6)
+        self.assertEqual(Notification.objects.filter(user=self.payer.user).count(), 1)
+        self.assertEqual(ledger.balance(self.payees[0]), Decimal('100.00'))
+
+    def test_batch_and_single_transfers_convert_currencies_alike(self):
+        payee, other = self.payees[:2]
+        create_and_run(self.payer, [{'to_account': payee.account_number, 'amount': Decimal('90'), 'currency': 'EUR'}])
+        self.client.force_login(self.payer.user)
+        otp = authorizations.issue(self.payer.user, other.account_number, 90)
+        self.client.post(reverse('transfer'), {'to_account': other.account_number, 'amount': '90', 'currency': 'EUR',
+                                               'pin': otp})
+        self.assertEqual(list(Transaction.objects.filter(transaction_type='deposit').order_by('pk')
+                              .values_list('account_id', 'amount')),
+                         [(payee.pk, Decimal('100.00')), (other.pk, Decimal('100.00'))])
+
+    def test_unknown_recipients_reject_the_whole_batch(self):
+        with self.assertRaises(BatchError):
+            create_and_run(self.payer, parse_items(self.csv + '999999,5,USD\n'))
+        self.assertFalse(Transaction.objects.exists())
+
+    def test_failed_batch_resumes_after_last_committed_chunk(self):
+        Account.objects.filter(pk=self.payer.pk).update(balance=Decimal('250.00'))
+        batch = TransferBatch.objects.create(user=self.payer.user, from_account=self.payer)
+        with self.assertRaises(TransferError):
+            run_batch(batch, parse_items(self.csv), chunk_size=2)
+        self.assertEqual((batch.status, batch.processed_items), ('failed', 2))
+        Account.objects.filter(pk=self.payer.pk).update(balance=Decimal('1000.00'))
+        batch = resume_batch(batch, parse_items(self.csv), chunk_size=2)
+        self.assertEqual((batch.status, batch.processed_items), ('completed', 6))
+        self.assertEqual(Transaction.objects.filter(transaction_type='deposit').count(), 6)
+        with self.assertRaisesMessage(BatchError, 'is completed'):
+            resume_batch(batch, parse_items(self.csv))
+        self.assertEqual(Transaction.objects.filter(transaction_type='deposit').count(), 6)
+
+    def test_non_utf8_upload_is_rejected(self):
+        self.payer.user.is_staff = True
+        self.payer.user.save()
+        self.client.force_login(self.payer.user)
+        upload = SimpleUploadedFile('payroll.csv', 'to_account,amount,memo\n100002,10,Café\n'.encode('latin-1'))
+        response = self.client.post(reverse('batch_transfer'), {'file': upload})
+        self.assertEqual(response.status_code, 400)
+        response = self.client.post(reverse('batch_transfer'), b'\xff\xfe', content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+
+    def test_view_is_staff_only_and_accepts_json(self):
+        user = self.payer.user
+        self.client.force_login(user)
+        body = json.dumps([{'to_account': p.account_number, 'amount': '10'} for p in self.payees])
+        response = self.client.post(reverse('batch_transfer'), body, content_type='application/json')
+        self.assertEqual(response.status_code, 302)
+        user.is_staff = True
+        user.save()
+        response = self.client.post(reverse('batch_transfer'), body, content_type='application/json')
+        self.assertEqual(response.json()['processed_items'], 6)
+
+
+class ScheduledTransferTests(TestCase):
+    def setUp(self):
+        caches['default'].clear()
+        self.payer = make_account('standing', max_transaction_count=50)
+        self.payee = make_account('landlord', balance='0.00')
+        self.now = timezone.now().replace(microsecond=0)
+
+    def schedule(self, **kwargs):
+        fields = {'user': self.payer.user, 'from_account': self.payer, 'to_account': self.payee,
+                  'amount': Decimal('100.00'), 'next_run_at': self.now, **kwargs}
+        return ScheduledTransfer.objects.create(**fields)
+
+    def test_monthly_runs_clamp_to_the_end_of_short_months(self):
+        start = timezone.make_aware(timezone.datetime(2026, 1, 31, 9, 0))
+        schedule = ScheduledTransfer(frequency='monthly', day_of_month=31, next_run_at=start)
+        february = next_occurrence(schedule, start)
+        self.assertEqual((february.month, february.day, february.hour), (2, 28, 9))
+        schedule.next_run_at = february
+        self.assertEqual(next_occurrence(schedule, february).day, 31)
+        # Missed runs are skipped rather than paid in a burst
+        self.assertEqual(next_occurrence(schedule, start.replace(month=5, day=1)).month, 5)
+
+    def test_due_schedules_pay_once_and_move_on(self):
+        monthly = self.schedule(day_of_month=self.now.day)
+        once = self.schedule(frequency='once', amount=Decimal('5.00'))
+        later = self.schedule(next_run_at=self.now + timedelta(days=1))
+        results = Scheduler(workers=1, chunk_size=1).run(self.now)
+        self.assertEqual(results['ok'], 2)
+        self.assertEqual(Scheduler(workers=1).run(self.now), {})
+        self.payer.refresh_from_db()
+        self.assertEqual(self.payer.balance, Decimal('895.00'))
+        monthly.refresh_from_db()
+        self.assertEqual((monthly.status, monthly.last_run_at), ('active', self.now))
+        self.assertGreater(monthly.next_run_at, self.now + timedelta(days=27))
+        self.assertEqual(ScheduledTransfer.objects.get(pk=once.pk).status, 'completed')
+        self.assertEqual(ScheduledTransfer.objects.get(pk=later.pk).last_run_at, None)
+
+    def test_failed_runs_are_skipped_then_stop_the_schedule(self):
+        schedule = self.schedule(frequency='daily', amount=Decimal('5000.00'))
+        for day in range(3):
+            Scheduler(workers=1).run(self.now + timedelta(days=day))
+        schedule.refresh_from_db()
+        self.assertEqual((schedule.status, schedule.failures), ('failed', 3))
+        self.assertIn('Insufficient funds', schedule.last_error)
+        self.assertEqual(Notification.objects.filter(user=self.payer.user).count(), 3)
+        self.assertFalse(Transaction.objects.exists())
+
+    def test_held_runs_keep_the_screening_decision(self):
+        engine = screening.ScreeningEngine(store=screening.MemoryStore(),
+                                           rules=[screening.Velocity(max_transfers=0, window=60)])
+        screening.set_engine(engine)
+        self.addCleanup(screening.set_engine, None)
+        schedule = self.schedule()
+        self.assertEqual(Scheduler(workers=1).run(self.now), {'failed': 1})
+        self.assertEqual(Transfer.objects.get().decision, screening.HOLD)
+        self.assertFalse(Transaction.objects.exists())
+        schedule.refresh_from_db()
+        self.assertIn('held for review', schedule.last_error)
+
+    def test_database_errors_hand_the_run_back_once_per_run(self):
+        schedule = self.schedule()
+        scheduler = Scheduler(workers=1)
+        with (self.assertLogs('bank.schedules', 'WARNING'),
+              mock.patch('bank.schedules.transfer_funds', side_effect=IntegrityError('broken row')) as transfer):
+            self.assertEqual(scheduler.run(self.now), {'error': 1})
+            self.assertEqual(scheduler.run(self.now), {'error': 1})
+        self.assertEqual(transfer.call_count, 2)
+        schedule.refresh_from_db()
+        self.assertEqual((schedule.status, schedule.next_run_at), ('active', self.now))
+
+    def test_claims_are_exclusive_and_stale_ones_released(self):
+        schedule = self.schedule()
+        self.assertEqual(claim_due(10, self.now), [schedule])
+        self.assertEqual(claim_due(10, self.now), [])
+        self.assertEqual(release_stale(self.now + timedelta(minutes=1)), 0)
+        self.assertEqual(release_stale(self.now + timedelta(hours=1)), 1)
+        # The slow scheduler that lost its claim finds the run already paid and backs off
+        self.assertEqual(Scheduler(workers=1).run(self.now + timedelta(hours=1))['ok'], 1)
+        with self.assertRaises(ScheduleConflict):
+            run_schedule(schedule, self.now)
+        self.assertEqual(Transaction.objects.filter(transaction_type='transfer').count(), 1)
+
+
+class DatasetTests(TestCase):
+    def test_seeded_bank_is_deterministic_and_reconciles(self):
+        def history():
+            return list(Transaction.objects.order_by('date', 'pk').values_list('transaction_type', 'amount', 'date'))
+
+        with transaction.atomic():
+            first = seed(12, transactions=6, seed=7, block_size=5, batch_size=10)
+            expected = history()
+            transaction.set_rollback(True)
+        counts = seed(12, transactions=6, seed=7, block_size=5, batch_size=10)
+        self.assertEqual((counts, history()), (first, expected))
+        self.assertEqual((counts['users'], counts['transactions']), (12, len(expected)))
+        self.assertEqual(TransactionSearch.objects.count(), len(expected))
+        self.assertTrue(TransactionRollup.objects.exists())
+        self.assertFalse(Account.objects.filter(balance__lt=0).exists())
+        self.assertEqual(list(ledger.reconcile(workers=1)), [])
+
+    def test_feed_import_is_streamed_and_replayable(self):
+        account = make_account('feed', balance='10.00')
+        feed = ('account,type,amount,date,reference,memo\n'
+                f'{account.account_number},deposit,100,2026-03-01T10:00:00,ref-1,Payroll\n'
+                f'{account.account_number},withdrawal,500,,ref-2,\n'
+                f'{account.account_number},withdrawal,30.5,,ref-3,ATM\n'
+                '999999,deposit,5,,ref-4,\n'
+                f'{account.account_number},refund,5,,,\n')
+        rejected = []
+        results = import_ledger(io.StringIO(feed), batch_size=2, on_reject=lambda line, reason: rejected.append(line))
+        self.assertEqual(results, {'imported': 2, 'rejected': 3})
+        self.assertEqual(rejected, [3, 5, 6])
+        account.refresh_from_db()
+        self.assertEqual(account.balance, Decimal('79.50'))
+        self.assertEqual(ledger.balance(account), Decimal('79.50') - Decimal('10.00'))
+        self.assertEqual(Transaction.objects.get(idempotency_key='ref-1').date.month, 3)
+        self.assertEqual(TransactionSearch.objects.filter(account=account).count(), 2)
+
+        ndjson = json.dumps({'account': account.account_number, 'type': 'deposit', 'amount': '100', 'reference': 'ref-1'})
+        results = import_ledger(io.StringIO(ndjson + '\nnot json\n'), format='ndjson')
+        self.assertEqual(results, {'duplicate': 1, 'rejected': 1})
+
+
+class EndOfDayTests(TestCase):
+    def setUp(self):
+        self.today = timezone.localdate()
+        self.alice = make_account('alice', interest_rate=Decimal('0.1'))
+        self.bob = make_account('bob', balance='0.00')
+        with self.days_ago(3):
+            ledger.post_opening_balance(self.alice)
+        with self.days_ago(2):
+            transfer_funds(self.alice, self.bob, 100)
+
+    def day(self, days_ago):
+        return self.today - timedelta(days=days_ago)
+
+    def days_ago(self, days):
+        noon = eod.day_bounds(self.day(days))[0] + timedelta(hours=12)
+        return mock.patch('django.utils.timezone.now', return_value=noon)
+
+    def balances(self, day):
+        return eod.as_of([self.alice.pk, self.bob.pk], day)
+
+    @override_settings(BANK_EOD_GRACE=0)
+    def test_as_of_reads_end_of_day_rows_plus_unclosed_tail(self):
+        self.assertEqual(list(eod.close_days().values()), [1, 2, 0])
+        self.assertEqual(eod.close_days(), {})
+        self.assertEqual(self.balances(self.day(3)), {self.alice.pk: Decimal('1000.00'), self.bob.pk: 0})
+        self.assertEqual(self.balances(self.day(1)), {self.alice.pk: Decimal('900.00'), self.bob.pk: Decimal('100.00')})
+        transfer_funds(self.bob, self.alice, 30)
+        with self.assertNumQueries(2):
+            self.assertEqual(self.balances(self.today), {self.alice.pk: Decimal('930.00'), self.bob.pk: Decimal('70.00')})
+        self.assertEqual(eod.balance_as_of(self.alice, self.day(1)), Decimal('900.00'))
+
+        # A posting that lands on a closed day is picked up once the day is reopened
+        with self.days_ago(2):
+            deposit_funds(self.bob, 5)
+        self.assertEqual(eod.balance_as_of(self.bob, self.day(1)), Decimal('100.00'))
+        self.assertEqual(eod.reopen(self.day(2)), 2)
+        eod.close_days()
+        self.assertEqual(eod.balance_as_of(self.bob, self.day(1)), Decimal('105.00'))
+
+    @override_settings(BANK_EOD_GRACE=0)
+    def test_imported_history_lands_on_its_own_days(self):
+        eod.close_days()
+        noon = eod.day_bounds(self.day(2))[0] + timedelta(hours=12)
+        feed = f'account,type,amount,date\n{self.bob.account_number},deposit,7,{noon.isoformat()}\n'
+        self.assertEqual(import_ledger(io.StringIO(feed)), {'imported': 1})
+        self.assertEqual(eod.last_closed(), self.day(3))
+        eod.close_days()
+        self.assertEqual(eod.balance_as_of(self.bob, self.day(3)), 0)
+        self.assertEqual(eod.balance_as_of(self.bob, self.day(2)), Decimal('107.00'))
+        self.assertEqual(eod.balance_as_of(self.bob, self.day(1)), Decimal('107.00'))
+
+    @override_settings(BANK_EOD_GRACE=0, BANK_INTEREST_DAY_COUNT=365)
+    def test_interest_accrues_once_per_day_and_posts_whole_cents(self):
+        Account.objects.filter(pk=self.alice.pk).update(interest_accrued_through=self.day(4))
+        with self.assertRaises(interest.DayNotClosed):
+            interest.accrue(self.day(1))
+        eod.close_days()
+        self.assertEqual(interest.accrue_through(self.day(1)), {self.day(3): 1, self.day(2): 1, self.day(1): 1})
+        self.assertEqual(interest.accrue_through(self.day(1)), {})
+        self.assertEqual(interest.accrue(self.day(1)), 0)
+        self.alice.refresh_from_db()
+        # 1000 * 0.1 / 365 + 2 * 900 * 0.1 / 365
+        self.assertAlmostEqual(self.alice.accrued_interest, Decimal('0.76712329'), places=7)
+
+        self.assertEqual(interest.post(), (1, Decimal('0.76')))
+        self.assertEqual(interest.post(), (0, 0))
+        self.alice.refresh_from_db()
+        self.assertEqual(self.alice.balance, Decimal('900.76'))
+        self.assertLess(self.alice.accrued_interest, Decimal('0.01'))
+        self.assertEqual(Posting.objects.get(external_ledger='interest').amount, Decimal('-0.76'))
+        self.assertEqual(list(ledger.reconcile(workers=1)), [])
+
+
+class AuthorizationTests(TestCase):
+    def setUp(self):
+        caches['default'].clear()
+        self.alice = make_account('alice')
+
+    def test_otp_is_single_use_and_bound_to_the_transfer(self):
+        for store in ('cache', 'database'):
+            with self.subTest(store=store), override_settings(BANK_OTP_STORE=store):
+                otp = authorizations.issue(self.alice.user, '1234567890', Decimal('50'))
+                self.assertFalse(authorizations.verify(self.alice.user, '1234567890', Decimal('51'), otp))
+                self.assertTrue(authorizations.verify(self.alice.user, '1234567890', 50.0, otp))
+                self.assertFalse(authorizations.verify(self.alice.user, '1234567890', 50.0, otp))
+
+    @override_settings(BANK_OTP_STORE='database', BANK_OTP_MAX_ATTEMPTS=2)
+    def test_attempts_are_capped(self):
+        otp = authorizations.issue(self.alice.user, '1234567890', 50)
+        wrong = '000000' if otp != '000000' else '111111'
+        self.assertFalse(authorizations.verify(self.alice.user, '1234567890', 50, wrong))
+        self.assertFalse(authorizations.verify(self.alice.user, '1234567890', 50, wrong))
+        self.assertFalse(authorizations.verify(self.alice.user, '1234567890', 50, otp))
+
+    @override_settings(BANK_OTP_STORE='database')
+    def test_expired_otps_are_rejected_and_swept(self):
+        otp = authorizations.issue(self.alice.user, '1234567890', 50)
+        PendingAuthorization.objects.update(expires_at=timezone.now() - timedelta(seconds=1))
+        self.assertFalse(authorizations.verify(self.alice.user, '1234567890', 50, otp))
+        self.assertEqual(authorizations.get_store().sweep(), 1)
+
+    def test_retried_transfer_replays_without_the_used_otp(self):
+        set_rate_service(RateService(provider=FakeRateProvider(), ttl=60))
+        self.addCleanup(set_rate_service, None)
+        bob = make_account('bob')
+        self.client.force_login(self.alice.user)
+        otp = authorizations.issue(self.alice.user, bob.account_number, 25)
+        data = {'to_account': bob.account_number, 'amount': '25', 'pin': otp}
+        for _ in range(2):
+            response = self.client.post(reverse('transfer'), data, HTTP_IDEMPOTENCY_KEY='retry-otp')
+            self.assertRedirects(response, reverse('dashboard'), fetch_redirect_response=False)
+        self.assertEqual(Transaction.objects.filter(transaction_type='transfer').count(), 1)
+
+    def test_failed_transfer_leaves_the_otp_usable(self):
+        bob = make_account('bob')
+        otp = authorizations.issue(self.alice.user, bob.account_number, 1500)
+        with self.assertRaises(InsufficientFunds):
+            authorized_transfer(self.alice.user, self.alice, bob, 1500, otp)
+        with self.assertRaises(InvalidAuthorization):
+            authorized_transfer(self.alice.user, self.alice, bob, 1500, 'nope')
+        deposit_funds(self.alice, 500)
+        authorized_transfer(self.alice.user, self.alice, bob, 1500, otp)
+        with self.assertRaises(InvalidAuthorization):
+            authorized_transfer(self.alice.user, self.alice, bob, 1500, otp)
+
+    @override_settings(BANK_OTP_MAX_ISSUES=2)
+    def test_issuance_is_rate_limited(self):
+        authorizations.issue(self.alice.user, '1234567890', 50)
+        authorizations.issue(self.alice.user, '1234567890', 50)
+        with self.assertRaises(authorizations.RateLimited):
+            authorizations.issue(self.alice.user, '1234567890', 50)
+
+
+@mock.patch('django.template.response.SimpleTemplateResponse.rendered_content', new_callable=mock.PropertyMock,
+            return_value='')
+class LoginTests(TestCase):
+    def setUp(self):
+        caches['default'].clear()
+        self.user = User.objects.create_user('carol', password='correct horse')
+
+    def login(self, password, ip='10.0.0.1'):
+        return self.client.post(reverse('login'), {'username': 'carol', 'password': password}, REMOTE_ADDR=ip)
+
+    def test_outdated_hashes_are_upgraded_at_login(self, rendered):
+        User.objects.filter(pk=self.user.pk).update(password=hashers.make_password('correct horse', hasher='scrypt'))
+        self.assertEqual(self.login('correct horse').status_code, 302)
+        self.user.refresh_from_db()
+        self.assertTrue(self.user.password.startswith('pbkdf2_sha256$'))
+        self.assertTrue(self.user.check_password('correct horse'))
+
+    def test_failures_are_throttled_before_hashing(self, rendered):
+        for _ in range(5):
+            self.assertEqual(self.login('wrong').status_code, 200)
+        with mock.patch('bank.logins.check_password') as check:
+            self.assertEqual(self.login('correct horse').status_code, 429)
+            self.assertEqual(self.login('correct horse', ip='10.0.0.2').status_code, 429)
+        check.assert_not_called()
+
+    def test_success_clears_the_username_counter(self, rendered):
+        for _ in range(4):
+            self.login('wrong')
+        self.assertEqual(self.login('correct horse').status_code, 302)
+        self.client.logout()
+        for _ in range(4):
+            self.login('wrong')
+        self.assertEqual(self.login('correct horse').status_code, 302)
+
+    def test_authenticated_requests_read_the_session_from_the_cache(self, rendered):
+        self.login('correct horse')
+        make_account('dave')
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(reverse('transaction_history_json'))
+        self.assertFalse(any('django_session' in query['sql'] for query in queries))
+
+    @override_settings(BANK_PASSWORD_HASH_WORKERS=1)
+    def test_hashing_pool(self, rendered):
+        encoded = passwords.make_password('in a pool')
+        self.assertTrue(hashers.check_password('in a pool', encoded))
+        self.assertIsNotNone(passwords.hash_pool())
+        self.assertEqual(self.login('correct horse').status_code, 302)
+
+
+class EventStreamTests(TestCase):
+    def setUp(self):
+        self.bus = events.MemoryBus(history=3)
+        events.set_bus(self.bus)
+        self.addCleanup(events.set_bus, None)
+        self.alice, self.bob = make_account('alice'), make_account('bob')
+
+    def test_ledger_writes_and_notifications_publish_after_commit(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            transfer_funds(self.alice, self.bob, 25)
+        self.assertEqual([(e.kind, e.data['balance']) for e in self.bus.since(self.alice.user_id, 0)],
+                         [('balance', '975.00')])
+        received = self.bus.since(self.bob.user_id, 0)
+        self.assertEqual([e.kind for e in received], ['balance', 'notification'])
+        self.assertEqual(received[0].data['amount'], '25.00')
+
+    def test_resume_needs_the_missed_events_to_still_be_kept(self):
+        for n in range(5):
+            self.bus.publish(7, 'balance', {'n': n})
+        self.assertEqual([e.id for e in self.bus.since(7, 3)], [4, 5])
+        self.assertEqual(self.bus.since(7, 5), [])
+        self.assertIsNone(self.bus.since(7, 1))
+        self.assertIsNone(self.bus.since(7, 9))
+
+    async def test_stream_replays_then_follows_live_events(self):
+        self.bus.publish(self.alice.user_id, 'balance', {'balance': '1.00'})
+        self.bus.publish(self.alice.user_id, 'balance', {'balance': '2.00'})
+        client = AsyncClient()
+        await client.aforce_login(self.alice.user)
+        response = await client.get(reverse('event_stream'), headers={'last-event-id': '1'})
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        chunks = aiter(response.streaming_content)
+        self.assertTrue((await anext(chunks)).startswith(b'retry:'))
+        self.assertEqual(await anext(chunks), b'id: 2\nevent: balance\ndata: {"balance":"2.00"}\n\n')
+        await sync_to_async(self.bus.publish, thread_sensitive=False)(self.alice.user_id, 'notification', {'id': 1})
+        self.assertTrue((await asyncio.wait_for(anext(chunks), 1)).startswith(b'id: 3\nevent: notification'))
+        # The ASGI handler cancels the response when the client disconnects
+        waiting = asyncio.ensure_future(anext(chunks))
+        await asyncio.sleep(0.01)
+        waiting.cancel()
+        with self.assertRaises(asyncio.CancelledError):
+            await waiting
+        self.assertEqual(self.bus.stream_count, 0)
+
+    @override_settings(BANK_EVENTS_QUEUE_SIZE=2, BANK_EVENTS_HEARTBEAT=0.01)
+    async def test_heartbeats_and_slow_clients_are_reset(self):
+        events.set_bus(self.bus)
+        chunks = events.stream(42)
+        await anext(chunks)
+        self.assertEqual(await anext(chunks), ': heartbeat\n\n')
+        for n in range(3):
+            self.bus.publish(42, 'balance', {'n': n})
+        await asyncio.sleep(0)
+        self.assertEqual(await anext(chunks), events.RESET)
+        with self.assertRaises(StopAsyncIteration):
+            await anext(chunks)
+
+
+class AdminTests(TestCase):
+    def setUp(self):
+        self.admin = User.objects.create_superuser('root', 'root@example.com', 'pw')
+        self.client.force_login(self.admin)
+        self.alice = make_account('alice')
+        self.bob = make_account('bob')
+
+    def act(self, model, action, accounts, **data):
+        return self.client.post(reverse(f'admin:bank_{model}_changelist'), {
+            'action': action, '_selected_action': [account.pk for account in accounts], **data})
+
+    def test_set_limits_is_one_update(self):
+        with CaptureQueriesContext(connection) as queries:
+            self.act('account', 'set_limits', [self.alice, self.bob], daily_transaction_limit='50.00')
+        self.assertEqual(sum(query['sql'].startswith('UPDATE "bank_account"') for query in queries), 1)
+        self.assertEqual(set(Account.objects.values_list('daily_transaction_limit', flat=True)), {Decimal('50.00')})
+        self.assertEqual(Account.objects.get(pk=self.alice.pk).max_transaction_count, self.alice.max_transaction_count)
+
+    def test_frozen_accounts_can_receive_but_not_send(self):
+        self.act('account', 'freeze', [self.alice])
+        self.alice.refresh_from_db()
+        with self.assertRaises(AccountFrozen):
+            transfer_funds(self.alice, self.bob, 10)
+        with self.assertRaises(AccountFrozen):
+            withdraw_funds(self.alice, 10)
+        transfer_funds(self.bob, self.alice, 10)
+        self.act('account', 'unfreeze', [self.alice])
+        transfer_funds(self.alice, self.bob, 10)
+
+    def test_export_streams_csv(self):
+        deposit_funds(self.alice, 25)
+        response = self.client.post(reverse('admin:bank_transaction_changelist'), {
+            'action': 'export_csv', 'select_across': '1', 'index': '0',
+            '_selected_action': Transaction.objects.values_list('pk', flat=True)})
+        self.assertTrue(response.streaming)
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual(lines[0].split(',')[:3], ['id', 'date', 'user__username'])
+        self.assertIn('alice', lines[1])
+
+    def test_changelist_queries_do_not_grow_with_rows(self):
+        seed_transactions(self.alice, 60)
+        url = reverse('admin:bank_transaction_changelist')
+        with CaptureQueriesContext(connection) as few:
+            self.client.get(url)
+        seed_transactions(self.bob, 60)
+        with CaptureQueriesContext(connection) as many:
+            response = self.client.get(url + '?transaction_type__exact=deposit')
+        self.assertEqual(response.status_code, 200)
+        self.assertLessEqual(len(many), len(few) + 1)
+        self.assertFalse(any('COUNT(*)' in query['sql'] and 'LIMIT' not in query['sql'] for query in many))
+
+
+    def test_only_append_only_tables_estimate_their_count(self):
+        notifications = Notification.objects.bulk_create(Notification(user=self.alice.user, message=str(i))
+                                                         for i in range(4))
+        Notification.objects.filter(pk__in=[notification.pk for notification in notifications[1:3]]).delete()
+        with mock.patch('bank.admin.ESTIMATE_ABOVE', 1):
+            response = self.client.get(reverse('admin:bank_notification_changelist'))
+        self.assertEqual(response.context['cl'].result_count, 2)
+
+    def test_account_limits_are_editable_in_the_list(self):
+        response = self.client.get(reverse('admin:bank_account_changelist'))
+        self.assertContains(response, 'name="form-0-daily_transaction_limit"')
+
+    def test_date_hierarchy_periods_match_distinct_dates(self):
+        seed_transactions(self.alice, 3000, batch_size=500)
+        queryset = PeriodQuerySet(Transaction)
+        for kind in ('year', 'month', 'day'):
+            self.assertEqual(list(queryset.datetimes('date', kind)), list(Transaction.objects.datetimes('date', kind)))
+        last = Transaction.objects.latest('date').date
+        month = queryset.filter(date__year=last.year, date__month=last.month)
+        self.assertEqual(month.datetimes('date', 'day', order='DESC'),
+                         list(Transaction.objects.filter(date__year=last.year, date__month=last.month)
+                              .datetimes('date', 'day', order='DESC')))
+
+
+class ScreeningTests(TestCase):
+    def setUp(self):
+        self.engine = screening.ScreeningEngine(store=screening.MemoryStore())
+
+    def history(self, amounts, payee=2, start=0):
+        for i, amount in enumerate(amounts):
+            self.engine.record(1, payee, amount, at=start + i * 600)
+
+    def test_velocity_counts_a_sliding_window(self):
+        self.engine.rules = [screening.Velocity(max_transfers=3, window=60)]
+        for at in (100, 130, 150):
+            self.engine.record(1, 2, 10, at=at)
+        self.assertEqual(self.engine.screen(1, 2, 10, at=155).action, screening.HOLD)
+        self.assertEqual(self.engine.screen(1, 2, 10, at=165).action, screening.ALLOW)
+
+    def test_new_payees_and_outliers_need_history(self):
+        self.assertEqual(self.engine.screen(1, 3, 5000, at=0).reasons, [])
+        self.history([100, 120, 90, 110] * 3)
+        self.assertEqual(self.engine.screen(1, 2, 110, at=10 ** 5).action, screening.ALLOW)
+        decision = self.engine.screen(1, 3, 5000, at=10 ** 5)
+        self.assertEqual(decision.action, screening.HOLD)
+        self.assertEqual([reason.split(':')[0] for reason in decision.reasons], ['NewPayee', 'AmountOutlier'])
+
+    def test_highest_severity_wins_and_allow_rules_only_report(self):
+        self.engine.rules = screening.build_rules([
+            {'rule': 'bank.screening.Velocity', 'max_transfers': 1, 'window': 60, 'action': 'allow'},
+            {'rule': 'bank.screening.Velocity', 'max_transfers': 2, 'window': 60, 'action': 'block'},
+        ])
+        self.engine.record(1, 2, 10, at=0)
+        self.assertEqual(self.engine.screen(1, 2, 10, at=1), (screening.ALLOW, ['Velocity: 2 transfers within 60s']))
+        self.engine.record(1, 2, 10, at=1)
+        self.assertEqual(self.engine.screen(1, 2, 10, at=2).action, screening.BLOCK)
+
+    def test_transfer_records_the_decision_and_stops_blocked_transfers(self):
+        alice, bob = make_account('alice'), make_account('bob')
+        self.engine.rules = [screening.Velocity(max_transfers=1, window=60, action=screening.BLOCK)]
+        screening.set_engine(self.engine)
+        self.addCleanup(screening.set_engine, None)
+        with self.captureOnCommitCallbacks(execute=True):
+            transfer_funds(alice, bob, '10.00')
+        with self.assertRaises(TransferBlocked):
+            transfer_funds(alice, bob, '10.00')
+        self.assertEqual(list(Transfer.objects.order_by('pk').values_list('decision', flat=True)), ['allow', 'block'])
+        alice.refresh_from_db()
+        self.assertEqual(alice.balance, Decimal('990.00'))
+
+    def test_held_transfer_keeps_its_reasons(self):
+        alice, bob = make_account('alice'), make_account('bob')
+        self.engine.rules = [screening.NewPayee(min_amount=1, min_history=0)]
+        screening.set_engine(self.engine)
+        self.addCleanup(screening.set_engine, None)
+        with self.assertRaises(TransferHeld):
+            transfer_funds(alice, bob, '10.00')
+        self.assertEqual(Transfer.objects.get().decision_reasons, f'NewPayee: first transfer to account {bob.pk}')
+
+
+class InstrumentationTests(TestCase):
+    def setUp(self):
+        registry.reset()
+        self.alice = make_account('alice')
+        self.client.force_login(self.alice.user)
+
+    def tearDown(self):
+        registry.reset()
+
+    @override_settings(BANK_INSTRUMENTATION_ENABLED=True)
+    def test_records_queries_per_view(self):
+        self.client.get(reverse('transaction_history_json'))
+        self.client.get(reverse('transaction_history_json'))
+        [row] = registry.report()
+        self.assertEqual(row['view'], 'transaction_history_json')
+        self.assertEqual(row['requests'], 2)
+        self.assertGreater(row['queries_per_request'], 0)
+
+    def test_disabled_by_default(self):
+        self.client.get(reverse('transaction_history_json'))
+        self.assertEqual(registry.report(), [])
+
+    @override_settings(BANK_INSTRUMENTATION_ENABLED=True)
+    async def test_async_views_are_not_adapted_to_sync(self):
+        client = AsyncClient()
+        await client.aforce_login(self.alice.user)
+        with mock.patch('bank.async_views.render', return_value=HttpResponse()):
+            await client.get(reverse('async_notifications'))
+        # Not wrapped in sync_to_async by the handler
+        self.assertIsInstance(client.handler._middleware_chain.__wrapped__, InstrumentationMiddleware)
+        [row] = registry.report()
+        self.assertEqual(row['view'], 'async_notifications')
+        self.assertGreater(row['queries_per_request'], 0)
+
+    @override_settings(BANK_INSTRUMENTATION_ENABLED=True)
+    async def test_streams_are_timed_until_they_end(self):
+        events.set_bus(events.MemoryBus())
+        self.addCleanup(events.set_bus, None)
+        client = AsyncClient()
+        await client.aforce_login(self.alice.user)
+        response = await client.get(reverse('event_stream'))
+        chunks = aiter(response.streaming_content)
+        await anext(chunks)
+        self.assertEqual(registry.report(), [])
+        waiting = asyncio.ensure_future(anext(chunks))
+        await asyncio.sleep(0.01)
+        waiting.cancel()
+        with self.assertRaises(asyncio.CancelledError):
+            await waiting
+        [row] = registry.report()
+        self.assertEqual(row['view'], 'event_stream')
+        self.assertGreaterEqual(row['mean_ms'], 10)
+
+    @override_settings(BANK_INSTRUMENTATION_ENABLED=True, BANK_METRICS_TOKEN='secret')
+    def test_metrics_endpoint_requires_staff_or_token(self):
+        self.client.get(reverse('transaction_history_json'))
+        self.assertEqual(self.client.get(reverse('metrics')).status_code, 403)
+        response = self.client.get(reverse('metrics'), HTTP_AUTHORIZATION='Bearer secret')
+        self.assertContains(response, 'bank_request_db_queries_count{view="transaction_history_json"} 1')
+
+
+class LoadTestTests(TestCase):
+    def test_every_scenario_runs_cleanly(self):
+        caches['default'].clear()
+        accounts = loadtest.seed(users=2, transactions=40, notifications=5)
+        results = loadtest.run(accounts, requests=2, threads=1)
+        self.assertEqual(set(results), set(loadtest.SCENARIOS))
+        for scenario, result in results.items():
+            with self.subTest(scenario=scenario):
+                self.assertEqual(result['sequential']['errors'], 0)
+                self.assertGreater(result['sequential']['queries_mean'], 0)
+
+
+class DatabaseProfileTests(TestCase):
+    def journal_mode(self):
+        from django.db.backends.sqlite3.base import DatabaseWrapper
+
+        with tempfile.TemporaryDirectory() as directory:
+            wrapper = DatabaseWrapper({**connection.settings_dict, 'NAME': f'{directory}/tuned.sqlite3'}, alias='tuned')
+            try:
+                with wrapper.cursor() as cursor:
+                    cursor.execute('PRAGMA journal_mode')
+                    journal_mode = cursor.fetchone()[0]
+                    cursor.execute('PRAGMA busy_timeout')
+                    return journal_mode, cursor.fetchone()[0], wrapper.transaction_mode
+            finally:
+                wrapper.close()
+
+    @override_settings(BANK_SQLITE_TUNING=True)
+    def test_sqlite_connections_are_tuned(self):
+        self.assertEqual(self.journal_mode(), ('wal', 5000, 'IMMEDIATE'))
+
+    def test_default_profile_leaves_the_journal_alone(self):
+        self.assertEqual(self.journal_mode()[0], 'delete')
+
+    def test_postgres_pooling_disables_persistent_connections(self):
+        with mock.patch.dict('os.environ', {'BANK_DB_POOL': '1'}):
+            config = database_config('postgres', None)
+        self.assertEqual(config['CONN_MAX_AGE'], 0)
+        self.assertIn('pool', config['OPTIONS'])
+        self.assertEqual(database_config('postgres', None)['CONN_MAX_AGE'], 60)
+
+
+@override_settings(BANK_READ_REPLICAS=['replica'])
+class ReplicaRoutingTests(TransactionTestCase):
+    def setUp(self):
+        reset_health()
+        self.addCleanup(reset_health)
+        self.request = RequestFactory().get('/')
+        self.request.session = {}
+
+    def test_reads_go_to_the_chosen_replica_outside_transactions(self):
+        router = ReplicaRouter()
+        self.assertIsNone(router.db_for_read(Transaction))
+        with use_replica('replica'):
+            self.assertEqual(router.db_for_read(Transaction), 'replica')
+            self.assertEqual(router.db_for_write(Transaction), 'default')
+            with transaction.atomic():
+                self.assertIsNone(router.db_for_read(Transaction))
+
+    def test_recent_writers_stay_on_the_primary(self):
+        with mock.patch('bank.replicas.replica_lag', return_value=0):
+            self.assertEqual(choose_replica(self.request), 'replica')
+            pin_to_primary(self.request)
+            self.assertIsNone(choose_replica(self.request))
+
+    def test_lagging_replicas_are_skipped(self):
+        with mock.patch('bank.replicas.replica_lag', return_value=60):
+            self.assertIsNone(choose_replica(self.request))
+
+    def test_marking_notifications_read_pins_the_session(self):
+        alice = make_account('alice')
+        Notification.objects.create(user=alice.user, message='hello')
+        self.client.force_login(alice.user)
+        with mock.patch('bank.views.render', return_value=HttpResponse()):
+            self.client.get(reverse('notifications'))
+        self.assertIn(PIN_SESSION_KEY, self.client.session)
+
+
+class FragmentCacheTests(TestCase):
+    def setUp(self):
+        caches['default'].clear()
+        fragments.stats.reset()
+        self.alice = make_account('alice')
+
+    def header(self):
+        return fragments.get_fragments(self.alice.user, {'header': fragments.account_header(self.alice.user)})['header']
+
+    def test_reload_is_served_from_cache(self):
+        self.header()
+        with self.assertNumQueries(0):
+            self.header()
+        self.assertEqual(fragments.stats.report()['header']['hit'], 1)
+
+    def test_ledger_writes_and_limit_changes_bump_the_version(self):
+        self.assertIn('1000.00', self.header())
+        with self.captureOnCommitCallbacks(execute=True):
+            deposit_funds(self.alice, 5)
+        self.assertIn('1005.00', self.header())
+        self.alice.refresh_from_db()
+        self.alice.daily_transaction_limit = Decimal('250.00')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.alice.save()
+        self.assertIn('250.00', self.header())
+
+    def test_concurrent_misses_compute_once(self):
+        calls = []
+
+        def slow():
+            calls.append(1)
+            time.sleep(0.05)
+            return 'html'
+
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            results = list(pool.map(lambda _: fragments._compute_once('slow', 'bank:fragments:test', slow), range(8)))
+        self.assertEqual(results, ['html'] * 8)
+        self.assertEqual(len(calls), 1)
+
+
+@override_settings(BANK_SCREENING_ENABLED=False)  # Bursts like these are exactly what screening holds
+class TransferConcurrencyTests(TransactionTestCase):
+    accounts = 4
+    workers = 8
+    transfers = 400
+    # Transfers per second the run must sustain; raise it on hardware where the baseline is known
+    min_throughput = float(os.environ.get('BANK_TEST_MIN_TRANSFERS_PER_SECOND', 10))
+
+    def _run(self, job):
+        # SQLite has a single writer; retry the occasional lock timeout like a client would
+        for _ in range(200):
+            try:
+                return job()
+            except OperationalError:
+                time.sleep(random.uniform(0, 0.02))
+            finally:
+                connection.close()
+        raise AssertionError('transfer never acquired the database lock')
+
+    def test_parallel_transfers_conserve_money(self):
+        accounts = [make_account(f'user{i}', balance='500.00', max_transaction_count=1000, daily_transaction_limit=100000) for i in range(self.accounts)]
+        for account in accounts:
+            ledger.post_opening_balance(account)
+        total = Account.objects.aggregate(total=Sum('balance'))['total']
+        rng = random.Random(42)
+        jobs = [rng.sample(accounts, 2) + [rng.randint(1, 50)] for _ in range(self.transfers)]
+
+        def job(args):
+            source, destination, amount = args
+            try:
+                self._run(lambda: transfer_funds(source, destination, amount))
+                return 1
+            except InsufficientFunds:
+                return 0
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            completed = sum(pool.map(job, jobs))
+        throughput = completed / (time.perf_counter() - started)
+        sys.stderr.write(f'\n{completed} parallel transfers at {throughput:,.0f}/s ')
+
+        self.assertEqual(Account.objects.aggregate(total=Sum('balance'))['total'], total)
+        self.assertFalse(Account.objects.filter(balance__lt=0).exists())
+        self.assertEqual(Transaction.objects.filter(transaction_type='transfer').count(), completed)
+        # Every cached balance still matches its postings, so no transfer was half applied
+        self.assertEqual(list(ledger.reconcile(workers=1)), [])
+        self.assertGreaterEqual(throughput, self.min_throughput)
+
+    def test_parallel_transfers_respect_daily_count_limit(self):
+        source = make_account('limited', balance='1000.00', max_transaction_count=5)
+        destination = make_account('payee')
+
+        def job(_):
+            try:
+                self._run(lambda: transfer_funds(source, destination, 1))
+                return 1
+            except LimitExceeded:
+                return 0
+
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            succeeded = sum(pool.map(job, range(40)))
+
+        self.assertEqual(succeeded, 5)
+        self.assertEqual(usage_today(source)[0], 5)
+        source.refresh_from_db()
+        self.assertEqual(source.balance, Decimal('995.00'))
@@ -0,0 +1,215 @@
+from decimal import Decimal
+
+from django.db import IntegrityError, transaction
+from django.db.models import F
+
+from . import authorizations, ledger, limits, screening
+from .models import Account, Transaction, Transfer
+from .outbox import notify_user
+
+
+class TransferError(Exception):
+    pass
+
+
+class InsufficientFunds(TransferError):
+    pass
+
+
+class AccountFrozen(TransferError):
+    pass
+
+
+class TransferHeld(TransferError):
+    pass
+
+
+class TransferBlocked(TransferError):
+    pass
+
+
+class InvalidAuthorization(TransferError):
+    pass
+
+
+def _to_decimal(amount):
+    # Views still hand us floats parsed from POST data
+    amount = Decimal(str(amount)).quantize(Decimal('0.01'))
+    if amount <= 0:
+        raise TransferError('Amount must be greater than zero.')
+    return amount
+
+
+def _lock_accounts(*account_ids):
+    # Always lock in primary key order so two opposite transfers can't deadlock
+    accounts = Account.objects.select_for_update().filter(pk__in=account_ids).order_by('pk')
+    return {account.pk: account for account in accounts.select_related('user')}
+
+
+def _existing(account, idempotency_key):
+    if not idempotency_key:
+        return None
+    return Transaction.objects.filter(account=account, idempotency_key=idempotency_key).first()
+
+
+def _check_not_frozen(account):
+    # Checked on the locked row, so a freeze from the admin can't race a debit
+    if account.is_frozen:
+        raise AccountFrozen('This account is frozen. Please contact admin.')
+
+
+def _debit(account, amount):
+    # Conditional UPDATE so the balance check and the write are a single statement
+    updated = Account.objects.filter(pk=account.pk, balance__gte=amount).update(balance=F('balance') - amount)
+    if not updated:
+        raise InsufficientFunds('Insufficient funds')
+
+
+def _credit(account, amount):
+    Account.objects.filter(pk=account.pk).update(balance=F('balance') + amount)
+
+
+def _post(account_id, idempotency_key, apply):
+    try:
+        with transaction.atomic():
+            rows = apply()
+    except IntegrityError:
+        # A concurrent retry with the same key won the race; hand back its ledger row
+        existing = Transaction.objects.filter(account_id=account_id, idempotency_key=idempotency_key).first()
+        if existing is None:
+            raise
+        return existing
+    return rows
+
+
+def _screen(source, destination, amount):
+    """Screen the transfer from cached profiles, recording and raising on anything but allow."""
+    if not screening.screening_enabled():
+        return screening.Decision(screening.ALLOW, [])
+    decision = screening.get_engine().screen(source.pk, destination.pk, amount)
+    if decision.action == screening.ALLOW:
+        return decision
+    record = Transfer.objects.create(from_account=source, to_account=destination, amount=amount,
+                                     decision=decision.action, decision_reasons='; '.join(decision.reasons)[:255])
+    if decision.action == screening.BLOCK:
+        error = TransferBlocked('This transfer was declined.')
+    else:
+        error = TransferHeld('This transfer is being held for review.')
+    # Callers running the transfer inside their own transaction re-save it after rolling back
+    error.transfer = record
+    raise error
+
+
+def keep_screening_decision(error):
+    """Save again the ``Transfer`` a hold or block recorded, once the caller's transaction has rolled it back."""
+    if getattr(error, 'transfer', None) is not None:
+        error.transfer.pk = None
+        error.transfer.save(force_insert=True)
+
+
+def transfer_funds(from_account, to_account, amount, idempotency_key=None, exchange_rate=None, memo=''):
+    """Move ``amount`` between two accounts and return the debit ``Transaction``.
+
+    Retrying with the same ``idempotency_key`` returns the original debit row
+    instead of posting the transfer twice. ``exchange_rate`` is the
+    ``ExchangeRate`` snapshot the transfer was priced with, if any; ``memo``
+    is shown to both sides.
+
+    Raises ``TransferHeld`` or ``TransferBlocked`` when screening stops it;
+    the decision is kept on a ``Transfer`` row either way.
+    """
+    amount = _to_decimal(amount)
+    if from_account.pk == to_account.pk:
+        raise TransferError('Cannot transfer to the same account.')
+    decision = _screen(from_account, to_account, amount)
+
+    def apply():
+        locked = _lock_accounts(from_account.pk, to_account.pk)
+        existing = _existing(from_account, idempotency_key)
+        if existing is not None:
+            return existing
+        source, destination = locked[from_account.pk], locked[to_account.pk]
+        _check_not_frozen(source)
+
+        limits.consume(source, amount)
+        _debit(source, amount)
+        _credit(destination, amount)
+        rows = Transaction.objects.bulk_create([
+            Transaction(user_id=source.user_id, account=source, transaction_type='transfer',
+                        amount=amount, idempotency_key=idempotency_key or None, exchange_rate=exchange_rate, memo=memo),
+            Transaction(user_id=destination.user_id, account=destination, transaction_type='deposit',
+                        amount=amount, exchange_rate=exchange_rate, memo=memo),
+        ])
+        ledger.record(ledger.transfer_legs(rows[0], rows[1], amount), [(rows[0], destination), (rows[1], source)],
+                      [(source, source.balance - amount, rows[0]), (destination, destination.balance + amount, rows[1])])
+        Transfer.objects.create(from_account=source, to_account=destination, amount=amount,
+                                decision=decision.action, decision_reasons='; '.join(decision.reasons)[:255])
+        if screening.screening_enabled():
+            transaction.on_commit(lambda: screening.get_engine().record(source.pk, destination.pk, amount))
+        notify_user(destination.user, f"You received ${amount} from {source.user.username}")
+        return rows[0]
+
+    return _post(from_account.pk, idempotency_key, apply)
+
+
+def authorized_transfer(user, from_account, to_account, amount, otp, idempotency_key=None, authorized_amount=None,
+                        **kwargs):
+    """``transfer_funds`` behind a transfer OTP, which is used up in the same transaction.
+
+    A retry of an ``idempotency_key`` already posted returns the original debit
+    without asking for the OTP again, and a transfer that fails leaves the OTP
+    usable. ``authorized_amount`` is the amount the OTP was issued for when the
+    user entered it in another currency. Raises ``InvalidAuthorization`` for a
+    wrong or expired OTP.
+    """
+    existing = _existing(from_account, idempotency_key)
+    if existing is not None:
+        return existing
+    try:
+        with transaction.atomic():
+            # A wrong OTP commits, so the attempt still counts
+            if authorizations.verify(user, to_account.account_number, authorized_amount or amount, otp):
+                return transfer_funds(from_account, to_account, amount, idempotency_key=idempotency_key, **kwargs)
+    except TransferError as e:
+        keep_screening_decision(e)
+        raise
+    raise InvalidAuthorization('Invalid Pin')
+
+
+def deposit_funds(account, amount, idempotency_key=None):
+    amount = _to_decimal(amount)
+
+    def apply():
+        locked = _lock_accounts(account.pk)[account.pk]
+        existing = _existing(account, idempotency_key)
+        if existing is not None:
+            return existing
+        _credit(locked, amount)
+        row = Transaction.objects.create(user_id=locked.user_id, account=locked, transaction_type='deposit',
+                                         amount=amount, idempotency_key=idempotency_key or None)
+        ledger.record(ledger.external_legs(row, amount), [(row, None)], [(locked, locked.balance + amount, row)])
+        return row
+
+    return _post(account.pk, idempotency_key, apply)
+
+
+def withdraw_funds(account, amount, idempotency_key=None):
+    amount = _to_decimal(amount)
+
+    def apply():
+        locked = _lock_accounts(account.pk)[account.pk]
+        existing = _existing(account, idempotency_key)
+        if existing is not None:
+            return existing
+        _check_not_frozen(locked)
+        _debit(locked, amount)
+        row = Transaction.objects.create(user_id=locked.user_id, account=locked, transaction_type='withdrawal',
+                                         amount=amount, idempotency_key=idempotency_key or None)
+        ledger.record(ledger.external_legs(row, -amount), [(row, None)], [(locked, locked.balance - amount, row)])
+        return row
+
+    return _post(account.pk, idempotency_key, apply)
+
+
+def idempotency_key_for(request):
+    return request.headers.get('Idempotency-Key') or request.POST.get('idempotency_key') or None
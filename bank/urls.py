@@ -1,17 +1,32 @@
 from django.urls import path
 from django.contrib.auth.views import LogoutView
-from . import views
+from . import async_views, views
 
 urlpatterns = [
     # User-related endpoints
     path('', views.dashboard, name='dashboard'),  # Dashboard view
     path('transfer/', views.transfer, name='transfer'),  # Transfer funds view
+    path('batch-transfer/', views.batch_transfer, name='batch_transfer'),  # Payroll / bulk transfer upload (staff)
     path('generate-otp/', views.generate_otp, name='generate_otp'),  # Generate OTP for transfer
     path('notifications/', views.notifications, name='notifications'),  # User notifications view
     path('transaction-history/', views.transaction_history, name='transaction_history'),  # Transaction history view
+    path('transaction-history.json', views.transaction_history_json, name='transaction_history_json'),  # Transaction history as JSON
     path('profile/', views.profile, name='profile'),  # User profile and settings view
     path('contact-admin/', views.contact_admin, name='contact_admin'),  # Contact admin view
     path('account_summary/', views.account_summary, name='account_summary'),
+    path('analytics/', views.user_analytics, name='user_analytics'),  # Monthly spending and income chart
+    path('statement/', views.account_statement, name='account_statement'),  # CSV download or queued PDF statement
+    path('statement/<int:pk>/', views.statement_status, name='statement_status'),  # Poll a queued PDF statement
+    path('statement/<int:pk>/download/', views.statement_download, name='statement_download'),
+    path('instrumentation/', views.instrumentation_report, name='instrumentation_report'),  # Per-view timings (staff)
+    path('metrics', views.metrics, name='metrics'),  # Prometheus text format
+
+    # Async variants of the busiest views, served when running under ASGI
+    path('async/', async_views.dashboard, name='async_dashboard'),
+    path('async/transfer/', async_views.transfer, name='async_transfer'),
+    path('async/generate-otp/', async_views.generate_otp, name='async_generate_otp'),
+    path('async/notifications/', async_views.notifications, name='async_notifications'),
+    path('events/', async_views.event_stream, name='event_stream'),  # Server-sent account activity
     
     # Authentication (if not handled automatically via Django)
     path('register/', views.register, name='register'),  # Register view
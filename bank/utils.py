@@ -1,9 +1,60 @@
+import threading
+from contextlib import contextmanager
+
+from django.conf import settings
 from twilio.rest import Client
 
-def send_sms(to, body):
-    client = Client("TWILIO_ACCOUNT_SID", "TWILIO_AUTH_TOKEN")
-    message = client.messages.create(
-        to=to,
-        from_="TWILIO_PHONE_NUMBER",
-        body=body
-    )
\ No newline at end of file
+from .instrumentation import external_call
+
+_sms_client = None
+_sms_client_lock = threading.Lock()
+
+
+def get_sms_client():
+    # One client per process so its HTTP session is reused across messages
+    global _sms_client
+    if _sms_client is None:
+        with _sms_client_lock:
+            if _sms_client is None:
+                _sms_client = Client(
+                    getattr(settings, 'TWILIO_ACCOUNT_SID', 'TWILIO_ACCOUNT_SID'),
+                    getattr(settings, 'TWILIO_AUTH_TOKEN', 'TWILIO_AUTH_TOKEN'),
+                )
+    return _sms_client
+
+
+def send_sms(to, body, client=None):
+    client = client or get_sms_client()
+    with external_call('sms'):
+        message = client.messages.create(
+            to=to,
+            from_=getattr(settings, 'TWILIO_PHONE_NUMBER', 'TWILIO_PHONE_NUMBER'),
+            body=body
+        )
+    return message
+
+
+def batched(iterable, size):
+    batch = []
+    for item in iterable:
+        batch.append(item)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+@contextmanager
+def explicit_timestamps(model, field_name):
+    """Let ``bulk_create`` keep the timestamps we generate instead of ``auto_now_add``.
+
+    This flips the field for the whole process, so only use it in bulk loads
+    that run on their own (seed_bank, import_ledger, benchmarks).
+    """
+    field = model._meta.get_field(field_name)
+    field.auto_now_add = False
+    try:
+        yield
+    finally:
+        field.auto_now_add = True
@@ -1,21 +1,33 @@
-import random
-import requests
-from django.http import HttpResponseBadRequest
+import hmac
+from django.conf import settings
+from django.http import FileResponse, Http404, HttpResponse, HttpResponseBadRequest, HttpResponseForbidden, JsonResponse, StreamingHttpResponse
 from django.core.mail import send_mail
 from django.shortcuts import render, redirect, get_object_or_404
-from django.contrib.auth.decorators import login_required
+from django.contrib.auth.decorators import login_required, user_passes_test
 from django.contrib import messages
 from django.contrib.auth import login as auth_login
 from django.contrib.auth.views import LoginView
+from . import authorizations, limits, logins
+from .batches import create_and_run, parse_items
 from .forms import ContactAdminForm, RegisterForm, TransactionFilterForm, TransferForm
-from .models import Account, Transaction, Transfer, Notification
+from .fragments import account_header, get_fragments, recent_transactions, stats as fragment_stats, unread_badge
+from .instrumentation import registry
+from .models import Account, Statement, TransactionSearch
+from .limits import LimitExceeded
+from .notifications import mark_read, unread_page
+from .outbox import enqueue_email
+from .pagination import InvalidCursor, paginate
+from .rates import RateUnavailable, get_rate_service, snapshot, to_base
+from .replicas import pin_to_primary, read_replica, use_replica
+from .rollups import monthly_summary
+from .statements import StatementError, month_bounds, request_statement, requeue, statement_transactions, stream_csv
+from .transfers import TransferError, authorized_transfer, deposit_funds, idempotency_key_for, withdraw_funds
 from django.urls import reverse
 from django_otp.plugins.otp_totp.models import TOTPDevice
 from django_otp.util import random_hex
-from django.template.loader import render_to_string
-from django.http import HttpResponse
-from xhtml2pdf import pisa
-from io import BytesIO
+
+HISTORY_PAGE_SIZE = 25
+MAX_HISTORY_PAGE_SIZE = 200
 
 
 def register(request):
@@ -34,14 +46,35 @@ def register(request):
 class CustomLoginView(LoginView):
     template_name = 'login.html'
 
+    def post(self, request, *args, **kwargs):
+        # Refuse throttled attempts before paying for a password hash
+        try:
+            logins.check_throttle(request, request.POST.get('username', ''))
+        except logins.LoginThrottled as e:
+            return self.render_to_response(self.get_context_data(error=str(e)), status=429)
+        return super().post(request, *args, **kwargs)
+
+    def form_valid(self, form):
+        logins.clear_failures(self.request, form.get_user().get_username())
+        return super().form_valid(form)
+
+    def form_invalid(self, form):
+        logins.record_failure(self.request, self.request.POST.get('username', ''))
+        return super().form_invalid(form)
+
     def get_success_url(self):
         return reverse('dashboard')  # Redirect to the dashboard after successful login
 
 @login_required
+@read_replica
 def dashboard(request):
-    account = Account.objects.get(user=request.user)
-    transactions = Transaction.objects.filter(account=account)
-    return render(request, 'bank/dashboard.html', {'account': account, 'transactions': transactions})
+    # Cached per user until their next ledger write, limit change or notification
+    context = get_fragments(request.user, {
+        'account_header': account_header(request.user),
+        'recent_transactions': recent_transactions(request.user, page_size=10),
+        'unread_badge': unread_badge(request.user),
+    })
+    return render(request, 'bank/dashboard.html', context)
 
 @login_required
 def profile(request):
@@ -66,10 +99,11 @@ def deposit(request):
     if request.method == 'POST':
         amount = float(request.POST.get('amount'))
         account = get_object_or_404(Account, user=request.user)
-        account.balance += amount
-        account.save()
-
-        Transaction.objects.create(account=account, transaction_type='deposit', amount=amount)
+        try:
+            deposit_funds(account, amount, idempotency_key=idempotency_key_for(request))
+        except TransferError as e:
+            return render(request, 'bank/deposit.html', {'error': str(e)})
+        pin_to_primary(request)
         return redirect('dashboard')
     return render(request, 'bank/deposit.html')
 
@@ -82,22 +116,20 @@ def withdraw(request):
             return HttpResponseBadRequest('Invalid amount')
 
         account = get_object_or_404(Account, user=request.user)
-        if account.balance >= amount:
-            account.balance -= amount
-            account.save()
-
-            Transaction.objects.create(account=account, transaction_type='withdrawal', amount=amount)
-            return redirect('dashboard')
-        else:
-            return render(request, 'bank/withdraw.html', {'error': 'Insufficient funds'})
+        try:
+            withdraw_funds(account, amount, idempotency_key=idempotency_key_for(request))
+        except TransferError as e:
+            return render(request, 'bank/withdraw.html', {'error': str(e)})
+        pin_to_primary(request)
+        return redirect('dashboard')
     return render(request, 'bank/withdraw.html')
 
 
 def get_exchange_rate(base_currency, target_currency):
-    api_url = f'https://api.exchangerate-api.com/v4/latest/{base_currency}'
-    response = requests.get(api_url)
-    rates = response.json().get('rates', {})
-    return rates.get(target_currency, 1)
+    try:
+        return get_rate_service().get_quote(base_currency, target_currency).rate
+    except RateUnavailable:
+        return 1
 
 
 @login_required
@@ -108,53 +140,39 @@ def transfer(request):
         amount = float(request.POST.get('amount'))
         currency = request.POST.get('currency', 'USD')  # Default to USD
         pin = request.POST.get('pin')
+        memo = request.POST.get('memo', '')[:140]
         base_currency = 'USD'  # Assuming base currency is USD for simplicity
 
         # Get exchange rate and convert amount to base currency
-        exchange_rate = get_exchange_rate(base_currency, currency)
-        amount_in_base_currency = amount * exchange_rate
-        
+        try:
+            quote = get_rate_service().get_quote(base_currency, currency)
+        except RateUnavailable:
+            return render(request, 'bank/transfer.html', {'error': 'Exchange rates are currently unavailable'})
+        # The amount is entered in the chosen currency; move its equivalent in the base currency, as batches do
+        amount_in_base_currency = to_base(amount, quote)
+
         # Validate account number
         try:
             to_account = Account.objects.get(account_number=to_account_number)
         except Account.DoesNotExist:
             return render(request, 'bank/transfer.html', {'error': 'Account does not exist'})
 
-        # Ensure daily transaction limit
-        if from_account.transaction_count >= from_account.max_transaction_count:
-            return render(request, 'bank/transfer.html', {'error': 'Transaction limit exceeded. Please contact admin.'})
-
-        # Pin Validation
-        transfer_record = Transfer.objects.filter(from_account=from_account, pin=pin).first()
-        if not transfer_record:
-            return render(request, 'bank/transfer.html', {'error': 'Invalid Pin'})
-
-        # Validate sufficient funds
-        if from_account.balance < amount:
-            return render(request, 'bank/transfer.html', {'error': 'Insufficient funds'})
-
-        # Perform the transfer
-        from_account.balance -= amount
-        from_account.transaction_count += 1
-        from_account.save()
-
-        to_account.balance += amount
-        to_account.save()
-
-        # Record transactions
-        Transaction.objects.create(account=from_account, transaction_type='transfer', amount=amount)
-        Transaction.objects.create(account=to_account, transaction_type='deposit', amount=amount)
-
-        # Send Notifications
-        Notification.objects.create(user=to_account.user, message=f"You received ${amount} from {from_account.user.username}")
-        send_mail(
-            'Transaction Alert',
-            f"You received ${amount} from {from_account.user.username}",
-            'noreply@bankapp.com',
-            [to_account.user.email],
-            fail_silently=False,
-        )
+        # Cheap cached rejection; the authoritative check runs inside transfer_funds
+        try:
+            limits.precheck(from_account, amount_in_base_currency)
+        except LimitExceeded as e:
+            return render(request, 'bank/transfer.html', {'error': str(e)})
 
+        # OTP, debit, credit, ledger rows and the queued alert in one transaction
+        try:
+            authorized_transfer(request.user, from_account, to_account, amount_in_base_currency, pin,
+                                idempotency_key=idempotency_key_for(request), exchange_rate=snapshot(quote), memo=memo,
+                                authorized_amount=amount)
+        except (TransferError, LimitExceeded) as e:
+            return render(request, 'bank/transfer.html', {'error': str(e)})
+
+        # The dashboard they land on must show this transfer, so skip replicas for a moment
+        pin_to_primary(request)
         messages.success(request, 'Transfer successful.')
         return redirect('dashboard')
     
@@ -162,12 +180,43 @@ def transfer(request):
 
 
 @login_required
+@user_passes_test(lambda user: user.is_staff)
+def batch_transfer(request):
+    if request.method != 'POST':
+        return JsonResponse({'error': 'POST a CSV file or JSON list of transfers'}, status=405)
+    from_account = get_object_or_404(Account, user=request.user)
+    upload = request.FILES.get('file')
+    try:
+        if upload is not None:
+            content, format = upload.read().decode('utf-8'), 'json' if upload.name.endswith('.json') else 'csv'
+        else:
+            content, format = request.body.decode('utf-8'), 'json'
+    except UnicodeDecodeError:
+        return JsonResponse({'error': 'The transfer list must be UTF-8 encoded'}, status=400)
+    try:
+        batch = create_and_run(from_account, parse_items(content, format))
+    except TransferError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    pin_to_primary(request)
+    return JsonResponse({
+        'id': batch.pk,
+        'status': batch.status,
+        'processed_items': batch.processed_items,
+        'total_amount': str(batch.total_amount),
+    })
+
+
+@login_required
+@read_replica
 def notifications(request):
-    user_notifications = Notification.objects.filter(user=request.user, is_read=False)
-    for notification in user_notifications:
-        notification.is_read = True
-        notification.save()
-    return render(request, 'bank/notifications.html', {'notifications': user_notifications})
+    try:
+        page = unread_page(request.user, cursor=request.GET.get('cursor'))
+    except InvalidCursor:
+        return HttpResponseBadRequest('Invalid cursor')
+    # Only the rows actually shown are marked read
+    if mark_read(request.user, page):
+        pin_to_primary(request)
+    return render(request, 'bank/notifications.html', {'notifications': page, 'page': page})
 
 
 @login_required
@@ -179,22 +228,15 @@ def generate_otp(request):
             amount = form.cleaned_data['amount']
 
             # Check if account exists
-            to_account = get_object_or_404(Account, account_number=to_account_number)
-
-            # Generate a random OTP
-            otp = str(random.randint(100000, 999999))
-            
-            # Save the transfer record with the OTP
-            Transfer.objects.create(from_account=request.user.account, to_account=to_account, amount=amount, otp=otp)
-
-            # Send OTP via email
-            send_mail(
-                'Your OTP for Transfer',
-                f"Your OTP for transferring ${amount} is {otp}",
-                'noreply@bankapp.com',
-                [request.user.email],
-                fail_silently=False,
-            )
+            if not Account.objects.filter(account_number=to_account_number).exists():
+                raise Http404('Account does not exist')
+
+            # Issue a single-use OTP bound to this payee and amount
+            try:
+                otp = authorizations.issue(request.user, to_account_number, amount)
+            except authorizations.RateLimited as e:
+                return render(request, 'bank/generate_otp.html', {'form': form, 'error': str(e)})
+            enqueue_email(request.user.email, 'Your OTP for Transfer', f"Your OTP for transferring ${amount} is {otp}")
 
             return render(request, 'bank/transfer.html', {'success': 'OTP sent to your email'})
     else:
@@ -228,25 +270,48 @@ def verify_otp(request):
     return render(request, 'verify_otp.html')
 
 
+def _transaction_history_page(request):
+    form = TransactionFilterForm(request.GET or None)
+    # prefetch rather than select_related: joining auth_user stops SQLite walking the (user, date) index
+    transactions = form.filter(TransactionSearch.objects.filter(user=request.user).prefetch_related('user'))
+    page_size = min(int(request.GET.get('page_size') or HISTORY_PAGE_SIZE), MAX_HISTORY_PAGE_SIZE)
+    return form, paginate(transactions, cursor=request.GET.get('cursor'), page_size=page_size)
+
+
 @login_required
+@read_replica
 def transaction_history(request):
-    user = request.user
-    form = TransactionFilterForm(request.GET or None)
-    transactions = Transaction.objects.filter(account__user=user)
+    try:
+        form, page = _transaction_history_page(request)
+    except (InvalidCursor, ValueError):
+        return HttpResponseBadRequest('Invalid cursor or page size')
+    return render(request, 'transaction_history.html', {'transactions': page, 'page': page, 'form': form})
 
-    if form.is_valid():
-        if form.cleaned_data['date_from']:
-            transactions = transactions.filter(date__gte=form.cleaned_data['date_from'])
-        if form.cleaned_data['date_to']:
-            transactions = transactions.filter(date__lte=form.cleaned_data['date_to'])
-        if form.cleaned_data['transaction_type']:
-            transactions = transactions.filter(transaction_type=form.cleaned_data['transaction_type'])
-        if form.cleaned_data['min_amount']:
-            transactions = transactions.filter(amount__gte=form.cleaned_data['min_amount'])
-        if form.cleaned_data['max_amount']:
-            transactions = transactions.filter(amount__lte=form.cleaned_data['max_amount'])
 
-    return render(request, 'transaction_history.html', {'transactions': transactions, 'form': form})
+@login_required
+@read_replica
+def transaction_history_json(request):
+    try:
+        form, page = _transaction_history_page(request)
+    except (InvalidCursor, ValueError):
+        return JsonResponse({'error': 'Invalid cursor or page size'}, status=400)
+    if form.is_bound and not form.is_valid():
+        return JsonResponse({'errors': form.errors}, status=400)
+    return JsonResponse({
+        'results': [
+            {
+                'id': t.pk,
+                'date': t.date.isoformat(),
+                'transaction_type': t.transaction_type,
+                'amount': str(t.amount),
+                'status': t.status,
+                'counterparty': t.counterparty_account_number,
+                'memo': t.memo,
+            }
+            for t in page
+        ],
+        'next_cursor': page.next_cursor,
+    })
 
 
 @login_required
@@ -269,39 +334,102 @@ def contact_admin(request):
     return render(request, 'contact_admin.html', {'form': form})
 
 @login_required
+@read_replica
 def account_summary(request):
-    account = get_object_or_404(Account, user=request.user)
-    transactions = Transaction.objects.filter(account=account).order_by('-date')
-    return render(request, 'bank/account_summary.html', {'account': account, 'transactions': transactions})
+    cursor = request.GET.get('cursor')
+    computes = {'account_header': account_header(request.user)}
+    if not cursor:
+        # Only the first page is cached; older pages are read as they are requested
+        computes['summary_transactions'] = recent_transactions(request.user, HISTORY_PAGE_SIZE)
+    try:
+        context = get_fragments(request.user, computes)
+        if cursor:
+            context['summary_transactions'] = recent_transactions(request.user, HISTORY_PAGE_SIZE, cursor)()
+    except InvalidCursor:
+        return HttpResponseBadRequest('Invalid cursor')
+    except Account.DoesNotExist:
+        raise Http404('Account does not exist')
+    return render(request, 'bank/account_summary.html', context)
 
 
 @login_required
+@read_replica
 def account_statement(request):
-    user = request.user
-    transactions = Transaction.objects.filter(account__user=user)
-    html = render_to_string('account_statement.html', {'transactions': transactions})
-    response = HttpResponse(content_type='application/pdf')
-    response['Content-Disposition'] = 'attachment; filename="account_statement.pdf"'
-    pisa_status = pisa.CreatePDF(BytesIO(html), dest=response)
-    if pisa_status.err:
-        return HttpResponse('Error generating PDF')
-    return response
+    account = get_object_or_404(Account, user=request.user)
+    period_start = period_end = None
+    if request.GET.get('month'):
+        try:
+            period_start, period_end = month_bounds(request.GET['month'])
+        except StatementError as e:
+            return HttpResponseBadRequest(str(e))
+
+    if request.GET.get('format') == 'csv':
+        transactions = statement_transactions(account, period_start, period_end)
+        response = StreamingHttpResponse(stream_csv(transactions), content_type='text/csv')
+        response['Content-Disposition'] = 'attachment; filename="account_statement.csv"'
+        return response
+
+    # PDFs are rendered by `manage.py render_statements`; the client polls statement_status.
+    # Look for an already queued statement on the primary so a lagging replica can't cause duplicates.
+    with use_replica(None):
+        statement = request_statement(account, period_start, period_end)
+    return redirect('statement_status', pk=statement.pk)
+
+
+@login_required
+def statement_status(request, pk):
+    statement = get_object_or_404(Statement, pk=pk, user=request.user)
+    data = {'id': statement.pk, 'status': statement.status}
+    if statement.status == 'ready':
+        data['download_url'] = reverse('statement_download', kwargs={'pk': statement.pk})
+    elif statement.status == 'failed':
+        data['error'] = statement.error
+    return JsonResponse(data)
 
 
 @login_required
+def statement_download(request, pk):
+    statement = get_object_or_404(Statement, pk=pk, user=request.user, status='ready')
+    try:
+        f = open(statement.file_path, 'rb')
+    except FileNotFoundError:
+        # Cleaned up, or rendered on another host; statement_status reports it pending until it is rendered again
+        requeue(statement)
+        raise Http404('Statement file not found')
+    return FileResponse(f, as_attachment=True, filename='account_statement.pdf')
+
+
+@login_required
+@read_replica
 def user_analytics(request):
-    user = request.user
-    transactions = Transaction.objects.filter(account__user=user)
-
-    # Example data aggregation
-    data = {
-        'labels': ['January', 'February', 'March'],  # Replace with dynamic data
-        'datasets': [{
-            'label': 'Spending',
-            'data': [100, 200, 300]  # Replace with dynamic data
-        }]
-    }
+    # Read from the precomputed rollups, never the ledger itself
+    data = monthly_summary(request.user)
     return render(request, 'user_analytics.html', {'data': data})
 
 
-
+def _can_read_metrics(request):
+    # Staff sessions, or a scraper presenting BANK_METRICS_TOKEN as a bearer token
+    token = getattr(settings, 'BANK_METRICS_TOKEN', '')
+    header = request.headers.get('Authorization', '')
+    if token and hmac.compare_digest(header, f'Bearer {token}'):
+        return True
+    return request.user.is_authenticated and request.user.is_staff
+
+
+def instrumentation_report(request):
+    if not _can_read_metrics(request):
+        return HttpResponseForbidden()
+    try:
+        top = int(request.GET.get('top', 0)) or None
+    except ValueError:
+        return HttpResponseBadRequest('Invalid top')
+    sort = request.GET.get('sort', 'p95_ms')
+    if sort not in ('p95_ms', 'mean_ms', 'queries_per_request', 'db_ms_per_request', 'requests'):
+        return HttpResponseBadRequest('Invalid sort')
+    return JsonResponse({'views': registry.report(top=top, sort=sort)})
+
+
+def metrics(request):
+    if not _can_read_metrics(request):
+        return HttpResponseForbidden()
+    return HttpResponse(registry.prometheus() + fragment_stats.prometheus(), content_type='text/plain; version=0.0.4')
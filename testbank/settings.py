@@ -10,8 +10,11 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.0/ref/settings/
 """
 
+import os
 from pathlib import Path
 from django.contrib.messages import constants as messages
+from bank.dbprofiles import database_config, replica_config
+from bank.passwords import password_hashers
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -52,6 +55,7 @@ MESSAGE_TAGS = {
 }
 
 MIDDLEWARE = [
+    'bank.instrumentation.InstrumentationMiddleware',  # Outermost so session/auth queries count too; inert unless enabled
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -75,6 +79,7 @@ TEMPLATES = [
                 'django.template.context_processors.request',
                 'django.contrib.auth.context_processors.auth',
                 'django.contrib.messages.context_processors.messages',
+                'bank.context_processors.unread_notifications',
             ],
         },
     },
@@ -86,13 +91,22 @@ WSGI_APPLICATION = 'testbank.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.0/ref/settings/#databases
 
+# 'sqlite-default' (stock journaling), 'sqlite' (WAL-tuned) or 'postgres'; see bank.dbprofiles.
+# WAL rewrites the database header and adds -wal/-shm files, so it is opt-in rather than applied to the checked-in db.sqlite3.
+BANK_DB_PROFILE = os.environ.get('BANK_DB_PROFILE', 'sqlite-default')
+
 DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
-    }
+    'default': database_config(BANK_DB_PROFILE, BASE_DIR),
 }
 
+# Optional read replica from BANK_DB_REPLICA_NAME (SQLite file) or BANK_DB_REPLICA_HOST (Postgres)
+if replica_config(DATABASES['default']):
+    DATABASES['replica'] = replica_config(DATABASES['default'])
+
+DATABASE_ROUTERS = ['bank.replicas.ReplicaRouter']
+
+BANK_SQLITE_TUNING = BANK_DB_PROFILE == 'sqlite'  # PRAGMAs and BEGIN IMMEDIATE on each connection
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.0/ref/settings/#auth-password-validators
@@ -137,3 +151,133 @@ STATIC_URL = 'static/'
 # https://docs.djangoproject.com/en/5.0/ref/settings/#default-auto-field
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
+
+
+# Outbound notifications
+# Alerts are written to the outbox in the same transaction as the ledger
+# write and delivered by `manage.py drain_outbox`.
+
+BANK_OUTBOX_ENABLED = True
+BANK_OUTBOX_MAX_ATTEMPTS = 5
+BANK_OUTBOX_RETRY_BACKOFF = 30  # seconds, doubled after every failed attempt
+BANK_OUTBOX_CLAIM_TIMEOUT = 300  # seconds before a message claimed by a worker that died is re-queued
+
+TWILIO_ACCOUNT_SID = os.environ.get('TWILIO_ACCOUNT_SID', 'TWILIO_ACCOUNT_SID')
+TWILIO_AUTH_TOKEN = os.environ.get('TWILIO_AUTH_TOKEN', 'TWILIO_AUTH_TOKEN')
+TWILIO_PHONE_NUMBER = os.environ.get('TWILIO_PHONE_NUMBER', 'TWILIO_PHONE_NUMBER')
+
+
+# Exchange rates
+
+BANK_FX_PROVIDER = 'bank.rates.ExchangeRateAPIProvider'
+BANK_FX_TTL = 300  # seconds before a cached rate table is refreshed in the background
+BANK_FX_TIMEOUT = (2, 3)  # connect, read
+BANK_FX_FAILURE_THRESHOLD = 3  # consecutive failures before the circuit opens
+BANK_FX_RESET_TIMEOUT = 30  # seconds the circuit stays open
+
+
+# Account statements
+
+BANK_STATEMENT_ROOT = BASE_DIR / 'statements'  # Rendered PDFs, served by statement_download
+BANK_STATEMENT_PAGE_ROWS = 500  # Rows rendered per PDF chunk
+BANK_STATEMENT_CLAIM_TIMEOUT = 900  # seconds before a statement claimed by a renderer that died is re-queued
+
+
+# Daily limits
+
+BANK_LIMITS_CACHE_FASTPATH = False  # Reject over-limit transfers from the cache before touching the database
+
+
+# Transfer OTPs
+
+BANK_OTP_STORE = 'database'  # Used up in the transfer's transaction; 'cache' needs a cache shared by every worker (e.g. Redis)
+BANK_OTP_TTL = 300  # seconds an OTP stays valid
+BANK_OTP_MAX_ATTEMPTS = 3
+BANK_OTP_MAX_ISSUES = 5  # OTPs a user may request per window
+BANK_OTP_RATE_WINDOW = 900  # seconds
+
+
+# Request instrumentation
+
+BANK_INSTRUMENTATION_ENABLED = os.environ.get('BANK_INSTRUMENTATION_ENABLED') == '1'
+BANK_INSTRUMENTATION_ALLOC_SAMPLE_RATE = 0.01  # Fraction of requests traced with tracemalloc
+BANK_METRICS_TOKEN = os.environ.get('BANK_METRICS_TOKEN', '')  # Bearer token for /metrics and /instrumentation/
+
+
+# Read replicas
+
+BANK_READ_REPLICAS = [alias for alias in DATABASES if alias != 'default']  # Used by views decorated with read_replica
+BANK_REPLICA_STICKY_SECONDS = 5  # Keep a user on the primary this long after they write
+BANK_REPLICA_MAX_LAG = 5  # seconds; lagging replicas are skipped
+BANK_REPLICA_LAG_CHECK_INTERVAL = 1  # seconds between lag probes per replica
+
+
+# Dashboard fragments
+
+BANK_FRAGMENT_CACHE = 'default'  # Must be shared by every worker (file or Redis) when running more than one process
+BANK_FRAGMENT_CACHE_ENABLED = True
+BANK_FRAGMENT_TTL = 300  # seconds; superseded versions simply age out
+BANK_FRAGMENT_LOCK_TIMEOUT = 5  # seconds other requests wait for a fragment being recomputed
+
+
+# Transfer screening
+# Rules default to bank.screening.DEFAULT_RULES; set BANK_SCREENING_RULES to change them.
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    # One profile per active sender; locmem's default of 300 entries would keep evicting them
+    'screening': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'bank-screening',
+        'OPTIONS': {'MAX_ENTRIES': 100000},
+    },
+    'sessions': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'bank-sessions',
+        'OPTIONS': {'MAX_ENTRIES': 100000},
+    },
+}
+BANK_SCREENING_ENABLED = True
+BANK_SCREENING_STORE = 'cache'  # or 'memory' for a single process
+BANK_SCREENING_CACHE = 'screening'  # Must be shared by every worker (e.g. Redis) so each sees the others' transfers
+BANK_SCREENING_PROFILE_TTL = 7 * 24 * 3600  # seconds an idle account keeps its profile
+
+
+# Account activity events (server-sent events at /events/, served under ASGI)
+
+BANK_EVENTS_BUS = 'memory'  # One ASGI process; 'cache' when several share BANK_EVENTS_CACHE (e.g. Redis)
+BANK_EVENTS_CACHE = 'default'
+BANK_EVENTS_HISTORY = 100  # Recent events kept per user for Last-Event-ID resume
+BANK_EVENTS_QUEUE_SIZE = 100  # Undelivered events per stream before a slow client is reset
+BANK_EVENTS_HEARTBEAT = 15  # seconds between keep-alive comments on an idle stream
+BANK_EVENTS_POLL_INTERVAL = 0.5  # seconds between cache polls with the cache bus
+
+
+# Logins
+# 'argon2' needs argon2-cffi and 'bcrypt' needs bcrypt; existing hashes are upgraded as their owners log in.
+
+PASSWORD_HASHERS = password_hashers(os.environ.get('BANK_PASSWORD_HASHER', 'pbkdf2'))
+AUTHENTICATION_BACKENDS = ['bank.logins.PooledHashBackend']
+BANK_PASSWORD_HASH_WORKERS = int(os.environ.get('BANK_PASSWORD_HASH_WORKERS', 0))  # Hashing processes; 0 hashes in the request thread
+BANK_LOGIN_CACHE = 'default'  # Must be shared by every worker (e.g. Redis) for the limits to hold across processes
+BANK_LOGIN_MAX_FAILURES_PER_USER = 5
+BANK_LOGIN_MAX_FAILURES_PER_IP = 50
+BANK_LOGIN_WINDOW = 900  # seconds from the first failure
+
+# Sessions are read from the cache and written through to the database
+SESSION_ENGINE = 'django.contrib.sessions.backends.cached_db'
+SESSION_CACHE_ALIAS = 'sessions'  # Shared by every worker (e.g. Redis) when running more than one process
+
+
+# Scheduled transfers (manage.py run_schedules)
+
+BANK_SCHEDULE_MAX_FAILURES = 3  # Missed runs in a row before a schedule is stopped
+BANK_SCHEDULE_CLAIM_TIMEOUT = 300  # seconds before a claim from a scheduler that died is released
+
+
+# End-of-day balances and interest (manage.py close_days, accrue_interest)
+
+BANK_EOD_GRACE = 300  # seconds after midnight before a day is closed, for postings still committing
+BANK_INTEREST_DAY_COUNT = 365  # Days in the year interest rates are divided over